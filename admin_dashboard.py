@@ -1,14 +1,9 @@
 # admin_dashboard.py
-from database import db
-import random
-import string
-import pickle
-import os
-import numpy as np
-from sklearn.neighbors import KNeighborsClassifier
+from database import db, Database
+from typing_model import model_provider, NeighbourIndex
 
 def generate_test_id():
-    return "TE" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    return db.generate_test_id()
 
 def create_test():
     num_questions = int(input("Number of questions: "))
@@ -28,38 +23,89 @@ def create_test():
         print("Failed to create test!")
 
 def train_knn_model():
-    with db.conn.cursor() as cur:
-        cur.execute("SELECT user_id, avg_dwell, avg_flight, error_rate FROM typing_profiles")
-        profiles = cur.fetchall()
-    
+    profiles = db.get_typing_profiles()
+
     if len(profiles) < 2:
         print("Not enough users to train the model (need at least 2).")
         return
     
-    X = np.array([[p["avg_dwell"], p["avg_flight"], p["error_rate"]] for p in profiles])
-    y = np.array([p["user_id"] for p in profiles])
-    
-    knn = KNeighborsClassifier(n_neighbors=min(3, len(profiles)))
-    knn.fit(X, y)
-    
-    with open("typing_model.pkl", "wb") as f:
-        pickle.dump(knn, f)
+    knn = NeighbourIndex.from_profiles(profiles, n_neighbors=3)
+    model_provider.save(knn)
     print("k-NN model trained and saved!")
 
+def view_score_distribution():
+    test_id = input("Enter Test ID: ")
+    dist = db.get_score_distribution(test_id)
+    if not dist["submissions"]:
+        print("No graded submissions for this test.")
+        return
+    print(f"\n=== Scores for {test_id} ===")
+    print(f"Submissions: {dist['submissions']}")
+    print(f"Mean: {dist['mean']:.1%}  Min: {dist['min']:.1%}  Max: {dist['max']:.1%}")
+    bins = len(dist["histogram"])
+    for i, count in enumerate(dist["histogram"]):
+        print(f"{i * 100 // bins:3d}-{(i + 1) * 100 // bins:3d}% | {'#' * count} {count}")
+
+def _pct(value):
+    return f"{value:.0%}" if value is not None else "-"
+
+def view_reports():
+    tests = db.get_test_stats()
+    if not tests:
+        print("No tests yet.")
+        return
+    print("\n=== Test Report ===")
+    print(f"{'Test ID':10} {'Done':>9} {'Avg':>5} {'SD':>5} {'Min':>5} {'Max':>5} {'Stored':>7} {'Test':>5} {'Gap':>5}")
+    for t in tests:
+        done = f"{t['submissions']}/{t['assigned']}"
+        print(f"{t['test_id']:10} {done:>9} {_pct(t['avg_score']):>5} {_pct(t['score_stddev']):>5} "
+              f"{_pct(t['min_score']):>5} {_pct(t['max_score']):>5} {_pct(t['avg_stored_confidence']):>7} "
+              f"{_pct(t['avg_test_confidence']):>5} {_pct(t['avg_confidence_gap']):>5}")
+    gaps = db.get_confidence_gaps()
+    if gaps:
+        print("\n=== Largest Typing Confidence Gaps ===")
+        for s in gaps:
+            print(f"{s['user_id']}: stored {_pct(s['avg_stored_confidence'])}, during tests {_pct(s['avg_test_confidence'])} "
+                  f"(gap {_pct(s['avg_confidence_gap'])}, {s['submissions']} submissions, avg score {_pct(s['avg_score'])})")
+
+def bulk_import_tests():
+    if not isinstance(db, Database):
+        print("Bulk import is only available on the Postgres backend.")
+        return
+    from bulk_import import import_files
+    tests_path = input("Question bank file (.csv/.json/.jsonl, blank to skip): ").strip()
+    roster_path = input("Roster file (.csv/.json/.jsonl, blank to skip): ").strip()
+    if not tests_path and not roster_path:
+        print("Nothing to import.")
+        return
+    try:
+        import_files(tests_path or None, roster_path or None)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {str(e)}")
+
 def admin_dashboard(user):
     while True:
         print("\n=== Admin Dashboard ===")
         print("1. Create Test")
         print("2. Train k-NN Model")
-        print("3. Logout")
-        choice = input("Select an option (1-3): ")
+        print("3. View Score Distribution")
+        print("4. Bulk Import Tests")
+        print("5. Reports")
+        print("6. Logout")
+        choice = input("Select an option (1-6): ")
 
         if choice == "1":
             create_test()
         elif choice == "2":
             train_knn_model()
         elif choice == "3":
+            view_score_distribution()
+        elif choice == "4":
+            bulk_import_tests()
+        elif choice == "5":
+            view_reports()
+        elif choice == "6":
             print("Logging out...")
             break
         else:
-            print("Invalid option! Please select 1, 2, or 3.")
\ No newline at end of file
+            print("Invalid option! Please select 1, 2, 3, 4, 5, or 6.")
\ No newline at end of file
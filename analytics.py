@@ -0,0 +1,222 @@
+# analytics.py
+# Per-test and per-student summary tables for admin reporting. The rows hold
+# counts and sums (scores, squared scores, confidences, confidence gaps), and
+# means are derived when a report is read, so reports read one small row per
+# test or student however many submissions exist:
+#   python analytics.py            # rebuild every summary row
+# Submissions and new assignments add their change to the rows inside their
+# own transaction (SUBMISSION_STATS_SQL, ASSIGNMENT_STATS_SQL), so concurrent
+# writers never overwrite each other. Regrading recomputes rows from the base
+# tables (refresh_stats) after locking them. Placeholders follow queries.py;
+# the two reports are also run by sqlite_database.
+
+TEST_STATS_SQL = """
+    INSERT INTO test_stats AS ts (test_id, assigned, submissions, score_sum, score_sq_sum, stored_confidence_sum,
+                                  test_confidence_sum, confidence_gap_sum, last_submission_at, refreshed_at)
+    SELECT t.test_id,
+           (SELECT COUNT(*) FROM test_assignments a WHERE a.test_id = t.test_id),
+           COUNT(s.user_id),
+           COALESCE(SUM(g.score::DOUBLE PRECISION), 0),
+           COALESCE(SUM(g.score::DOUBLE PRECISION ^ 2), 0),
+           COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION), 0),
+           COALESCE(SUM(s.test_confidence::DOUBLE PRECISION), 0),
+           COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION - s.test_confidence::DOUBLE PRECISION), 0),
+           MAX(s.taken_time), NOW()
+    FROM tests t
+    LEFT JOIN student_submissions s ON s.test_id = t.test_id
+    LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+    WHERE TRUE {condition}
+    GROUP BY t.test_id
+    ON CONFLICT (test_id) DO UPDATE
+    SET assigned = EXCLUDED.assigned,
+        submissions = EXCLUDED.submissions,
+        score_sum = EXCLUDED.score_sum,
+        score_sq_sum = EXCLUDED.score_sq_sum,
+        stored_confidence_sum = EXCLUDED.stored_confidence_sum,
+        test_confidence_sum = EXCLUDED.test_confidence_sum,
+        confidence_gap_sum = EXCLUDED.confidence_gap_sum,
+        last_submission_at = EXCLUDED.last_submission_at,
+        refreshed_at = EXCLUDED.refreshed_at
+"""
+
+STUDENT_STATS_SQL = """
+    INSERT INTO student_stats AS ss (user_id, assigned, submissions, score_sum, stored_confidence_sum,
+                                     test_confidence_sum, confidence_gap_sum, last_submission_at, refreshed_at)
+    SELECT u.user_id,
+           (SELECT COUNT(*) FROM test_assignments a WHERE a.user_id = u.user_id),
+           COUNT(s.test_id),
+           COALESCE(SUM(g.score::DOUBLE PRECISION), 0),
+           COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION), 0),
+           COALESCE(SUM(s.test_confidence::DOUBLE PRECISION), 0),
+           COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION - s.test_confidence::DOUBLE PRECISION), 0),
+           MAX(s.taken_time), NOW()
+    FROM users u
+    LEFT JOIN student_submissions s ON s.user_id = u.user_id
+    LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+    WHERE u.role = 'student' {condition}
+    GROUP BY u.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET assigned = EXCLUDED.assigned,
+        submissions = EXCLUDED.submissions,
+        score_sum = EXCLUDED.score_sum,
+        stored_confidence_sum = EXCLUDED.stored_confidence_sum,
+        test_confidence_sum = EXCLUDED.test_confidence_sum,
+        confidence_gap_sum = EXCLUDED.confidence_gap_sum,
+        last_submission_at = EXCLUDED.last_submission_at,
+        refreshed_at = EXCLUDED.refreshed_at
+"""
+
+TEST_STATS_CONDITION = "AND t.test_id = ANY(%(test_ids)s)"
+
+STUDENT_STATS_CONDITION = "AND u.user_id = ANY(%(user_ids)s)"
+
+# Create any missing summary rows and lock them, in key order, until the
+# transaction ends. Writers to a test's rows take this first, so a recompute
+# that follows sees every submission committed before it, and additive
+# updates queue behind it instead of being overwritten.
+LOCK_TEST_STATS_SQL = """
+    INSERT INTO test_stats AS ts (test_id)
+    SELECT test_id FROM tests WHERE test_id = ANY(%(test_ids)s) ORDER BY test_id
+    ON CONFLICT (test_id) DO UPDATE SET refreshed_at = ts.refreshed_at
+"""
+
+LOCK_STUDENT_STATS_SQL = """
+    INSERT INTO student_stats AS ss (user_id)
+    SELECT user_id FROM users WHERE role = 'student' AND user_id = ANY(%(user_ids)s) ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET refreshed_at = ss.refreshed_at
+"""
+
+# Conflicts with itself and with every row writer, for full rebuilds.
+LOCK_ALL_STATS_SQL = "LOCK TABLE test_stats, student_stats IN SHARE ROW EXCLUSIVE MODE"
+
+# CTEs that add one submission's change to its summary rows. They read a
+# `delta` CTE with user_id, test_id, submissions (1 for a first submission, 0
+# for a resubmission), the new-minus-old score, score_sq, stored_confidence,
+# test_confidence and confidence_gap, and taken_time.
+SUBMISSION_STATS_SQL = """
+    test_delta AS (
+        INSERT INTO test_stats AS ts (test_id, submissions, score_sum, score_sq_sum, stored_confidence_sum,
+                                      test_confidence_sum, confidence_gap_sum, last_submission_at)
+        SELECT test_id, submissions, score, score_sq, stored_confidence, test_confidence, confidence_gap, taken_time
+        FROM delta
+        ON CONFLICT (test_id) DO UPDATE
+        SET submissions = ts.submissions + EXCLUDED.submissions,
+            score_sum = ts.score_sum + EXCLUDED.score_sum,
+            score_sq_sum = ts.score_sq_sum + EXCLUDED.score_sq_sum,
+            stored_confidence_sum = ts.stored_confidence_sum + EXCLUDED.stored_confidence_sum,
+            test_confidence_sum = ts.test_confidence_sum + EXCLUDED.test_confidence_sum,
+            confidence_gap_sum = ts.confidence_gap_sum + EXCLUDED.confidence_gap_sum,
+            last_submission_at = GREATEST(ts.last_submission_at, EXCLUDED.last_submission_at),
+            refreshed_at = NOW()
+    ), student_delta AS (
+        INSERT INTO student_stats AS ss (user_id, submissions, score_sum, stored_confidence_sum,
+                                         test_confidence_sum, confidence_gap_sum, last_submission_at)
+        SELECT d.user_id, d.submissions, d.score, d.stored_confidence, d.test_confidence, d.confidence_gap,
+               d.taken_time
+        FROM delta d
+        JOIN users u ON u.user_id = d.user_id AND u.role = 'student'
+        ON CONFLICT (user_id) DO UPDATE
+        SET submissions = ss.submissions + EXCLUDED.submissions,
+            score_sum = ss.score_sum + EXCLUDED.score_sum,
+            stored_confidence_sum = ss.stored_confidence_sum + EXCLUDED.stored_confidence_sum,
+            test_confidence_sum = ss.test_confidence_sum + EXCLUDED.test_confidence_sum,
+            confidence_gap_sum = ss.confidence_gap_sum + EXCLUDED.confidence_gap_sum,
+            last_submission_at = GREATEST(ss.last_submission_at, EXCLUDED.last_submission_at),
+            refreshed_at = NOW()
+    )
+"""
+
+# CTEs that count newly inserted assignments, read from an `added` CTE of
+# (test_id, user_id), into the assigned columns.
+ASSIGNMENT_STATS_SQL = """
+    test_assigned AS (
+        INSERT INTO test_stats AS ts (test_id, assigned)
+        SELECT test_id, COUNT(*) FROM added GROUP BY test_id ORDER BY test_id
+        ON CONFLICT (test_id) DO UPDATE
+        SET assigned = ts.assigned + EXCLUDED.assigned, refreshed_at = NOW()
+    ), student_assigned AS (
+        INSERT INTO student_stats AS ss (user_id, assigned)
+        SELECT a.user_id, COUNT(*)
+        FROM added a
+        JOIN users u ON u.user_id = a.user_id AND u.role = 'student'
+        GROUP BY a.user_id
+        ORDER BY a.user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET assigned = ss.assigned + EXCLUDED.assigned, refreshed_at = NOW()
+    )
+"""
+
+# Minimum and maximum come from test_scores_test_id_score_idx, since a
+# resubmission can take back the old extreme.
+TEST_REPORT_SQL = """
+    SELECT ts.test_id, ts.assigned, ts.submissions,
+           ts.score_sum / NULLIF(ts.submissions, 0) AS avg_score,
+           sqrt(GREATEST(ts.score_sq_sum / NULLIF(ts.submissions, 0)
+                         - ts.score_sum * ts.score_sum / NULLIF(ts.submissions * ts.submissions, 0), 0))
+               AS score_stddev,
+           (SELECT MIN(g.score) FROM test_scores g WHERE g.test_id = ts.test_id) AS min_score,
+           (SELECT MAX(g.score) FROM test_scores g WHERE g.test_id = ts.test_id) AS max_score,
+           ts.stored_confidence_sum / NULLIF(ts.submissions, 0) AS avg_stored_confidence,
+           ts.test_confidence_sum / NULLIF(ts.submissions, 0) AS avg_test_confidence,
+           ts.confidence_gap_sum / NULLIF(ts.submissions, 0) AS avg_confidence_gap,
+           ts.last_submission_at
+    FROM test_stats ts
+    ORDER BY ts.test_id
+    LIMIT %(limit)s
+"""
+
+# Students whose test-time typing confidence falls furthest below their stored
+# profile, read in order from student_stats_confidence_gap_idx.
+CONFIDENCE_GAP_SQL = """
+    SELECT user_id, submissions,
+           score_sum / submissions AS avg_score,
+           stored_confidence_sum / submissions AS avg_stored_confidence,
+           test_confidence_sum / submissions AS avg_test_confidence,
+           confidence_gap_sum / submissions AS avg_confidence_gap
+    FROM student_stats
+    WHERE submissions > 0
+    ORDER BY confidence_gap_sum / submissions DESC
+    LIMIT %(limit)s
+"""
+
+def refresh_statements(test_ids=None, user_ids=None):
+    # (sql, params) that recompute the given rows from the base tables; both
+    # None rebuilds everything. The rows are locked first so no additive
+    # update is lost. Shared by refresh_stats and AsyncDatabase.
+    if test_ids is None and user_ids is None:
+        return [(LOCK_ALL_STATS_SQL, None), (TEST_STATS_SQL.format(condition=""), None),
+                (STUDENT_STATS_SQL.format(condition=""), None)]
+    statements = []
+    if test_ids:
+        statements.append((LOCK_TEST_STATS_SQL, {"test_ids": list(test_ids)}))
+    if user_ids:
+        statements.append((LOCK_STUDENT_STATS_SQL, {"user_ids": list(user_ids)}))
+    if test_ids:
+        statements.append((TEST_STATS_SQL.format(condition=TEST_STATS_CONDITION), {"test_ids": list(test_ids)}))
+    if user_ids:
+        statements.append((STUDENT_STATS_SQL.format(condition=STUDENT_STATS_CONDITION), {"user_ids": list(user_ids)}))
+    return statements
+
+def refresh_stats(cur, test_ids=None, user_ids=None):
+    for sql, params in refresh_statements(test_ids, user_ids):
+        cur.execute(sql, params)
+
+def test_report(cur, limit=50):
+    cur.execute(TEST_REPORT_SQL, {"limit": limit})
+    return cur.fetchall()
+
+def confidence_gap_report(cur, limit=10):
+    cur.execute(CONFIDENCE_GAP_SQL, {"limit": limit})
+    return cur.fetchall()
+
+if __name__ == "__main__":
+    from database import db, Database
+    try:
+        if not isinstance(db, Database):
+            print("Rebuilding the summary tables is only available on the Postgres backend.")
+        else:
+            with db.cursor() as cur:
+                refresh_stats(cur)
+            print("Analytics summary tables rebuilt.")
+    finally:
+        db.close()
@@ -1,9 +1,8 @@
 # app.py
-from register import register
-from login import login
-from admin_dashboard import admin_dashboard
-from student_dashboard import student_dashboard
-from database import db
+import sys
+
+# Flow modules are imported on first use so the menu does not wait for
+# numpy, pynput or a database connection.
 
 def main_menu():
     while True:
@@ -15,13 +14,17 @@ def main_menu():
         choice = input("Select an option (1-3): ")
 
         if choice == "1":
+            from register import register
             register()
         elif choice == "2":
+            from login import login
             user = login()
             if user:
                 if user["role"] == "admin":
+                    from admin_dashboard import admin_dashboard
                     admin_dashboard(user)
                 elif user["role"] == "student":
+                    from student_dashboard import student_dashboard
                     student_dashboard(user)
                 else:
                     print("Unknown role! Logging out.")
@@ -35,4 +38,7 @@ if __name__ == "__main__":
     try:
         main_menu()
     finally:
-        db.close()
\ No newline at end of file
+        if "database" in sys.modules:
+            sys.modules["database"].db.close()
+        if "instrumentation" in sys.modules and sys.modules["instrumentation"].ENABLED:
+            print(f"Metrics written to {sys.modules['instrumentation'].registry.write()}")
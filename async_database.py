@@ -0,0 +1,327 @@
+# async_database.py
+import asyncio
+import json
+import os
+import time
+import asyncpg
+from database import Database
+from storage import (LOCKOUT_SECONDS, LOCKOUT_TRANSITIONS, KEYSTROKE_COLUMNS, TYPING_PROFILE_COLUMNS, failure_counters,
+                     generate_totp_token, keystroke_rows, limiter_keys, login_locked, score_distribution,
+                     typing_profile_dict, verify_totp_token)
+import queries
+from password_hasher import PasswordHasher
+from id_allocator import ID_SPACES, IdAllocator
+from rate_limit import LoginRateLimiter
+from analytics import LOCK_ALL_STATS_SQL, LOCK_TEST_STATS_SQL, TEST_REPORT_SQL, CONFIDENCE_GAP_SQL, refresh_statements
+import instrumentation
+
+def _row(record):
+    return dict(record) if record is not None else None
+
+def _bind(sql, params=None):
+    # A queries.py statement as asyncpg arguments: (query, *values).
+    query, names = queries.numbered(sql)
+    return (query, *(params[name] for name in names))
+
+# asyncio counterpart of database.Database with the same method names and
+# return shapes, backed by an asyncpg connection pool. bcrypt (through the
+# PasswordHasher) and the SQLite login limiter run in the default executor so
+# neither blocks the loop.
+class AsyncDatabase:
+    def __init__(self, min_size=None, max_size=None, hasher=None):
+        self.min_size = min_size if min_size is not None else int(os.getenv("DB_POOL_MIN", "1"))
+        self.max_size = max_size if max_size is not None else int(os.getenv("DB_POOL_MAX", "10"))
+        self.hasher = hasher or PasswordHasher()
+        self.login_limiter = LoginRateLimiter()
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        # Reservations are awaited in _allocate_id rather than called by the allocator.
+        self.ids = IdAllocator(reserve=None)
+        self._id_lock = asyncio.Lock()
+
+    @staticmethod
+    async def _init_connection(conn):
+        await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+    @staticmethod
+    def _migrate():
+        # Migrations stay in one place; apply them through the blocking layer.
+        db = Database(minconn=1, maxconn=1)
+        try:
+            db.connect()
+        finally:
+            db.close()
+
+    async def _get_pool(self):
+        if self._pool is not None:
+            return self._pool
+        async with self._pool_lock:
+            if self._pool is None:
+                await asyncio.to_thread(self._migrate)
+                self._pool = await asyncpg.create_pool(
+                    host=os.getenv("DB_HOST", "localhost"),
+                    database=os.getenv("DB_NAME", "SmartSecure"),
+                    user=os.getenv("DB_USER", "postgres"),
+                    password=os.getenv("DB_PASSWORD", "CruseQ67"),
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    init=self._init_connection,
+                )
+            return self._pool
+
+    async def connect(self):
+        await self._get_pool()
+
+    async def _fetchrow(self, sql, params=None):
+        pool = await self._get_pool()
+        return _row(await pool.fetchrow(*_bind(sql, params)))
+
+    async def _fetch(self, sql, params=None):
+        pool = await self._get_pool()
+        return [dict(r) for r in await pool.fetch(*_bind(sql, params))]
+
+    async def _execute(self, sql, params=None):
+        pool = await self._get_pool()
+        return await pool.execute(*_bind(sql, params))
+
+    async def _in_executor(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _allocate_id(self, kind):
+        # IdAllocator's blocks, refilled by an awaited reservation.
+        async with self._id_lock:
+            if not self.ids.remaining(kind):
+                self.ids.refill(kind, await self.reserve_ids(ID_SPACES[kind], self.ids.block_size))
+            return self.ids.take(kind)
+
+    async def generate_token(self, role):
+        return await self._allocate_id("admin" if role == "admin" else "student")
+
+    async def generate_test_id(self):
+        return await self._allocate_id("test")
+
+    async def reserve_ids(self, space, count):
+        rows = await self._fetch(queries.RESERVE_IDS_SQL, {"sequence": space.sequence, "count": count})
+        candidates = [space.format(row["n"]) for row in rows]
+        taken = await self._fetch(queries.TAKEN_IDS_SQL.format(table=space.table, column=space.column),
+                                  {"ids": candidates})
+        taken = {row["id"] for row in taken}
+        return [c for c in candidates if c not in taken]
+
+    async def add_user(self, user_id, email, password, role, name):
+        hashed_password = await self._in_executor(self.hasher.hash, password)
+        try:
+            result = await self._fetchrow(queries.ADD_USER_SQL, {"user_id": user_id, "email": email,
+                                                                 "password": hashed_password, "role": role,
+                                                                 "name": name})
+            return result is not None
+        except asyncpg.IntegrityConstraintViolationError:
+            return False
+
+    async def get_user_by_email(self, email):
+        return await self._fetchrow(queries.USER_BY_EMAIL_SQL, {"email": email})
+
+    async def get_user_by_id(self, user_id):
+        return await self._fetchrow(queries.USER_BY_ID_SQL, {"user_id": user_id})
+
+    async def get_auth_state(self, email):
+        row = await self._fetchrow(queries.AUTH_STATE_SQL, {"email": email})
+        if row is None:
+            return None
+        state = {k: v for k, v in row.items() if k not in TYPING_PROFILE_COLUMNS}
+        state["typing_profile"] = typing_profile_dict(row) if row["avg_dwell"] is not None else None
+        return state
+
+    async def verify_login(self, state, password):
+        user = {k: v for k, v in state.items() if k != "typing_profile"}
+        if login_locked(user):
+            return None, None
+        if user["lockout_time"]:
+            await self._in_executor(self.login_limiter.reset, user["email"])
+            await self._execute(queries.CLEAR_LOCKOUT_SQL, {"email": user["email"],
+                                                            "lockout_time": user["lockout_time"]})
+        retry_after = await self._in_executor(self.login_limiter.acquire, *limiter_keys(user))
+        if retry_after:
+            return None, {"retry_after": retry_after}
+        if await self._in_executor(self.hasher.verify, password, user["password"]):
+            if self.hasher.needs_rehash(user["password"]):
+                await self.rehash_password(user["user_id"], user["password"], password)
+            await self._in_executor(self.login_limiter.reset, user["email"])
+            if user["failed_attempts"] or user["lockout_time"]:
+                await self._execute(queries.RESET_FAILED_ATTEMPTS_SQL, {"email": user["email"]})
+            return user, None
+        return None, await self.record_failed_login(user["email"], user["failed_attempts"])
+
+    async def rehash_password(self, user_id, old_hash, password):
+        new_hash = await self._in_executor(self.hasher.hash, password)
+        status = await self._execute(queries.REHASH_PASSWORD_SQL, {"password": new_hash, "user_id": user_id,
+                                                                    "old_hash": old_hash})
+        return status == "UPDATE 1"
+
+    async def check_password(self, email, password):
+        state = await self.get_auth_state(email)
+        if state:
+            user, _ = await self.verify_login(state, password)
+            return user
+        return None
+
+    async def record_failed_login(self, email, known_attempts=None):
+        if known_attempts is None:
+            row = await self._fetchrow(queries.STORED_FAILED_ATTEMPTS_SQL, {"email": email})
+            if row is None:
+                return {"failed_attempts": 0, "lockout_time": 0, "lockout_count": 0}
+            known_attempts = row["failed_attempts"]
+        attempts = await self._in_executor(self.login_limiter.record_failure, email, known_attempts)
+        result = None
+        if attempts in LOCKOUT_TRANSITIONS:
+            result = await self._fetchrow(queries.APPLY_LOCKOUT_SQL, {"attempts": attempts, "email": email,
+                                                                      "until": time.time() + LOCKOUT_SECONDS})
+        return failure_counters(attempts, result)
+
+    async def increment_failed_attempts(self, email):
+        result = await self._fetchrow(queries.INCREMENT_FAILED_ATTEMPTS_SQL,
+                                      {"until": time.time() + LOCKOUT_SECONDS, "email": email})
+        if result is None:
+            return {"failed_attempts": 0, "lockout_time": 0, "lockout_count": 0}
+        return result
+
+    async def get_user_typing_profile(self, user_id):
+        profile = await self._fetchrow(queries.TYPING_PROFILE_SQL, {"user_id": user_id})
+        if profile:
+            return typing_profile_dict(profile)
+        return None
+
+    async def save_typing_dynamics(self, user_id, features, keystrokes=None):
+        await self._execute(queries.SAVE_TYPING_DYNAMICS_SQL, {
+            "user_id": user_id, "dwell": float(features["avgDwell"]), "flight": float(features["avgFlight"]),
+            "error": float(features["errorRate"]), "samples": 5})
+        if keystrokes:
+            await self.update_typing_digraphs(user_id, keystrokes)
+
+    async def save_keystrokes(self, user_id, keystrokes, kind="login"):
+        rows = keystroke_rows(user_id, keystrokes, kind)
+        if not rows:
+            return 0
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.copy_records_to_table("keystrokes", records=rows, columns=list(KEYSTROKE_COLUMNS))
+        return len(rows)
+
+    async def update_typing_profile(self, user_id, new_features, new_samples, keystrokes=None):
+        if keystrokes:
+            await self.update_typing_digraphs(user_id, keystrokes)
+        profile = await self._fetchrow(queries.MERGE_TYPING_PROFILE_SQL, {
+            "user_id": user_id, "dwell": float(new_features["avgDwell"]), "flight": float(new_features["avgFlight"]),
+            "error": float(new_features["errorRate"]), "samples": new_samples})
+        if profile["inserted"]:
+            print("No existing typing profile found for user! Creating new profile.")
+        return typing_profile_dict(profile)
+
+    async def get_typing_digraphs(self, user_id):
+        from typing_digraphs import DigraphProfile
+        row = await self._fetchrow(queries.TYPING_DIGRAPHS_SQL, {"user_id": user_id})
+        return DigraphProfile.from_bytes(row["profile"]) if row else None
+
+    async def update_typing_digraphs(self, user_id, keystrokes):
+        from typing_digraphs import DigraphProfile
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(*_bind(queries.INIT_TYPING_DIGRAPHS_SQL,
+                                          {"user_id": user_id, "profile": DigraphProfile().to_bytes()}))
+                row = await conn.fetchrow(*_bind(queries.LOCK_TYPING_DIGRAPHS_SQL, {"user_id": user_id}))
+                profile = DigraphProfile.from_bytes(row["profile"])
+                added = profile.update(keystrokes)
+                await conn.execute(*_bind(queries.UPDATE_TYPING_DIGRAPHS_SQL,
+                                          {"profile": profile.to_bytes(), "added": added, "user_id": user_id}))
+                return profile
+
+    def generate_totp_token(self, email):
+        return generate_totp_token()
+
+    def verify_totp_token(self, token, secret):
+        return verify_totp_token(token, secret)
+
+    async def create_test(self, test_id, questions, assigned_ids):
+        pool = await self._get_pool()
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    result = await conn.fetchrow(*_bind(queries.CREATE_TEST_SQL, {
+                        "test_id": test_id, "questions": questions, "assigned_ids": assigned_ids}))
+                    await conn.execute(*_bind(LOCK_TEST_STATS_SQL, {"test_ids": [test_id]}))
+                    await conn.execute(*_bind(queries.ASSIGN_SQL, {
+                        "test_ids": [test_id] * len(assigned_ids), "user_ids": list(assigned_ids)}))
+                    return result is not None
+        except asyncpg.IntegrityConstraintViolationError:
+            return False
+
+    async def get_test(self, test_id):
+        return await self._fetchrow(queries.TEST_SQL, {"test_id": test_id})
+
+    async def get_test_header(self, test_id, user_id):
+        return await self._fetchrow(queries.TEST_HEADER_SQL, {"test_id": test_id, "user_id": user_id})
+
+    async def is_test_assigned(self, test_id, user_id):
+        row = await self._fetchrow(queries.TEST_ASSIGNED_SQL, {"test_id": test_id, "user_id": user_id})
+        return row is not None
+
+    async def save_test_submission(self, user_id, test_id, answers, stored_confidence, test_confidence):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(*_bind(LOCK_TEST_STATS_SQL, {"test_ids": [test_id]}))
+                result = await conn.fetchrow(*_bind(queries.SUBMISSION_SQL, {
+                    "user_id": user_id, "test_id": test_id, "stored_confidence": float(stored_confidence),
+                    "test_confidence": float(test_confidence), "answers": answers}))
+                return result is not None
+
+    @staticmethod
+    async def _refresh_stats(conn, test_ids=None, user_ids=None):
+        for sql, params in refresh_statements(test_ids, user_ids):
+            await conn.execute(*_bind(sql, params))
+
+    async def grade_tests(self, test_id=None):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if test_id is None:
+                    await conn.execute(LOCK_ALL_STATS_SQL)
+                    status = await conn.execute(queries.GRADE_SQL.format(source="student_submissions", condition=""))
+                    await self._refresh_stats(conn)
+                else:
+                    await conn.execute(*_bind(LOCK_TEST_STATS_SQL, {"test_ids": [test_id]}))
+                    status = await conn.execute(*_bind(
+                        queries.GRADE_SQL.format(source="student_submissions", condition=queries.GRADE_TEST_CONDITION),
+                        {"test_id": test_id}))
+                    rows = await conn.fetch(*_bind(queries.TEST_SUBMITTERS_SQL, {"test_id": test_id}))
+                    await self._refresh_stats(conn, [test_id], [row["user_id"] for row in rows])
+                return int(status.split()[-1])
+
+    async def get_score_distribution(self, test_id, bins=10):
+        rows = await self._fetch(queries.SCORE_DISTRIBUTION_SQL, {"bins": bins, "test_id": test_id})
+        return score_distribution(rows, bins)
+
+    async def get_test_stats(self, limit=50):
+        return await self._fetch(TEST_REPORT_SQL, {"limit": limit})
+
+    async def get_confidence_gaps(self, limit=10):
+        return await self._fetch(CONFIDENCE_GAP_SQL, {"limit": limit})
+
+    async def get_assigned_test_ids(self, user_id):
+        rows = await self._fetch(queries.ASSIGNED_TEST_IDS_SQL, {"user_id": user_id})
+        return [row["test_id"] for row in rows]
+
+    async def get_typing_profiles(self, since=None):
+        if since is None:
+            return await self._fetch(queries.TYPING_PROFILES_SQL)
+        return await self._fetch(queries.TYPING_PROFILES_SINCE_SQL, {"since": since})
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        self.hasher.close()
+        self.login_limiter.close()
+
+instrumentation.instrument(AsyncDatabase)
@@ -0,0 +1,44 @@
+# async_flows.py
+# Non-interactive cores of the register, login and test flows on AsyncDatabase.
+# The CLI gathers input() and typing samples first; these functions take the
+# collected values so many sessions can run concurrently on one event loop:
+#   await asyncio.gather(*(authenticate(adb, email, uid, pw) for ...))
+import asyncio
+from password_hasher import HasherBusy
+
+async def complete_registration(adb, email, password, role, name, typing_data):
+    user_id = await adb.generate_token(role)
+    try:
+        if not await adb.add_user(user_id, email, password, role, name):
+            return None
+    except HasherBusy:
+        print("Server busy, please try again in a moment.")
+        return None
+    await asyncio.gather(
+        adb.save_typing_dynamics(user_id, typing_data["features"], keystrokes=typing_data["keystrokes"]),
+        adb.save_keystrokes(user_id, typing_data["keystrokes"], kind="register"),
+    )
+    return user_id
+
+async def authenticate(adb, email, user_id, password, role=None):
+    state = await adb.get_auth_state(email)
+    if not state or state["user_id"] != user_id or (role and state["role"] != role):
+        return None, state
+    try:
+        user, _ = await adb.verify_login(state, password)
+    except HasherBusy:
+        print("Server busy, please try again in a moment.")
+        return None, state
+    return user, state
+
+async def record_typing_login(adb, user_id, typing_data, samples=3):
+    await asyncio.gather(
+        adb.save_keystrokes(user_id, typing_data["keystrokes"]),
+        adb.update_typing_profile(user_id, typing_data["features"], new_samples=samples,
+                                  keystrokes=typing_data["keystrokes"]),
+    )
+
+async def submit_test(adb, user_id, test_id, answers, stored_confidence, test_confidence):
+    if not await adb.is_test_assigned(test_id, user_id):
+        return False
+    return await adb.save_test_submission(user_id, test_id, answers, stored_confidence, test_confidence)
@@ -0,0 +1,126 @@
+# benchmarks/backends.py
+# Runs the conformance tests from tests/test_storage.py and per-operation
+# latency measurements against every storage backend, so Postgres and the
+# embedded SQLite backend can be compared method by method. Postgres needs a reachable database; its
+# fixtures are removed afterwards.
+#   BCRYPT_ROUNDS=4 python -m benchmarks.backends --backends postgres,sqlite-memory,sqlite-file --iterations 500
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from database import Database
+from sqlite_database import SQLiteDatabase
+from rate_limit import LoginRateLimiter
+from benchmarks.load import summarize
+from tests.fixtures import EMAIL_DOMAIN, PASSWORD, QUESTIONS, synthetic_typing
+from tests.test_storage import conformance_suite
+
+def make_backend(name, directory):
+    if name == "postgres":
+        return Database()
+    if name == "sqlite-memory":
+        return SQLiteDatabase(":memory:")
+    if name == "sqlite-file":
+        return SQLiteDatabase(os.path.join(directory, "backends.sqlite3"))
+    raise ValueError(f"Unknown backend: {name}")
+
+def run_conformance(name, directory):
+    # "ok", or "failed: " and the names of the failing tests.
+    result = unittest.TextTestRunner(stream=io.StringIO()).run(conformance_suite(lambda: make_backend(name, directory)))
+    if result.wasSuccessful():
+        return "ok"
+    return "failed: " + ", ".join(test.id().rsplit(".", 1)[-1] for test, _ in result.failures + result.errors)
+
+def seed(db, run):
+    user_id = db.generate_token("student")
+    email = f"{run}-student@{EMAIL_DOMAIN}"
+    db.add_user(user_id, email, PASSWORD, "student", "Backend Student")
+    typing = synthetic_typing(3)
+    db.save_typing_dynamics(user_id, typing["features"])
+    test_id = db.generate_test_id()
+    db.create_test(test_id, QUESTIONS, [user_id])
+    answers = {qid: q["correct"] for qid, q in QUESTIONS.items()}
+    return {"user_id": user_id, "email": email, "test_id": test_id, "answers": answers, "typing": typing}
+
+def measure(db, fixture, iterations):
+    user_id, email, test_id = fixture["user_id"], fixture["email"], fixture["test_id"]
+    keystrokes = fixture["typing"]["keystrokes"]
+    features = fixture["typing"]["features"]
+    operations = {
+        "get_auth_state": lambda: db.get_auth_state(email),
+        "get_user_typing_profile": lambda: db.get_user_typing_profile(user_id),
+        "update_typing_profile": lambda: db.update_typing_profile(user_id, features, 3),
+        "save_keystrokes": lambda: db.save_keystrokes(user_id, keystrokes),
+        "update_typing_digraphs": lambda: db.update_typing_digraphs(user_id, keystrokes),
+        "get_typing_digraphs": lambda: db.get_typing_digraphs(user_id),
+        "get_test_header": lambda: db.get_test_header(test_id, user_id),
+        "get_test": lambda: db.get_test(test_id),
+        "save_test_submission": lambda: db.save_test_submission(user_id, test_id, fixture["answers"], 0.9, 0.7),
+        "get_score_distribution": lambda: db.get_score_distribution(test_id),
+        "get_test_stats": lambda: db.get_test_stats(),
+    }
+    results = {}
+    for name, operation in operations.items():
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+        results[name] = summarize(latencies, 0)
+    return results
+
+def cleanup(db, fixture):
+    placeholder = "?" if isinstance(db, SQLiteDatabase) else "%s"
+    with db.cursor() as cur:
+        if fixture:
+            cur.execute(f"DELETE FROM student_submissions WHERE test_id = {placeholder}", (fixture["test_id"],))
+            cur.execute(f"DELETE FROM tests WHERE test_id = {placeholder}", (fixture["test_id"],))
+        cur.execute(f"DELETE FROM users WHERE email LIKE {placeholder}", (f"%@{EMAIL_DOMAIN}",))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="postgres,sqlite-memory,sqlite-file")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends.split(","):
+            conformance = run_conformance(name, directory)
+            if conformance != "ok":
+                report[name] = {"conformance": conformance}
+                continue
+            db = make_backend(name, directory)
+            # Same-user logins repeat far faster than the limiter allows.
+            db.login_limiter = LoginRateLimiter(":memory:", burst=1e12)
+            fixture = None
+            try:
+                db.connect()
+                cleanup(db, None)
+                fixture = seed(db, f"{os.getpid()}-{name}")
+                report[name] = {"conformance": "ok", "operations": measure(db, fixture, args.iterations)}
+            finally:
+                try:
+                    cleanup(db, fixture)
+                finally:
+                    db.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    names = list(report)
+    print("conformance: " + ", ".join(f"{name} {report[name]['conformance']}" for name in names))
+    timed = [name for name in names if "operations" in report[name]]
+    if not timed:
+        return
+    print(f"{'p50 / p95 (ms)':24s}" + "".join(f"{name:>24s}" for name in timed))
+    for operation in report[timed[0]]["operations"]:
+        cells = [report[name]["operations"][operation] for name in timed]
+        print(f"{operation:24s}" + "".join(f"{c['p50_ms']:13.3f} / {c['p95_ms']:8.3f}" for c in cells))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# benchmarks/bcrypt_pool.py
+# Password-check throughput (logins/sec) as the hashing pool grows:
+#   python -m benchmarks.bcrypt_pool --workers 0 1 2 4 --logins 64 --rounds 12
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from password_hasher import PasswordHasher
+
+def run(workers, logins, rounds, clients):
+    hasher = PasswordHasher(workers=workers, rounds=rounds, max_queue=max(clients, workers * 4))
+    try:
+        hashed = hasher.hash("Bench#Pass1")
+        hasher.verify("Bench#Pass1", hashed)  # start the worker processes before timing
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = list(pool.map(lambda _: hasher.verify("Bench#Pass1", hashed), range(logins)))
+        elapsed = time.perf_counter() - start
+    finally:
+        hasher.close()
+    assert all(results)
+    return {"workers": workers, "logins": logins, "seconds": elapsed, "logins_per_sec": logins / elapsed}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent login threads")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = [run(w, args.logins, args.rounds, args.clients) for w in args.workers]
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.logins} password checks at cost {args.rounds}, {args.clients} concurrent clients")
+    for r in report:
+        label = "inline" if r["workers"] == 0 else f"{r['workers']} workers"
+        print(f"{label:>10}: {r['logins_per_sec']:7.1f} logins/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/capture.py
+# Keystroke capture, streaming per-key matching vs the old reversed scan
+# followed by batch feature extraction, across phrase lengths. Reports the
+# total per-sample cost and the work left after the final Enter (finalize):
+#   python -m benchmarks.capture --lengths 16 64 256 --repeat 200
+import argparse
+import contextlib
+import copy
+import io
+import json
+import random
+import time
+from keystroke_features import extract_features
+from typing_auth import CaptureSession, ReplaySource, SampleCapture, typing_auth
+from benchmarks.features import same
+
+def synthetic_samples(phrase, samples, overlap=0.3):
+    # Rolled-over keys (release after the next press) are common in fast typing.
+    recorded = []
+    t = 1_700_000_000.0
+    for _ in range(samples):
+        events = []
+        for ch in phrase:
+            press = t
+            t = press + random.uniform(0.08, 0.25)
+            hold = random.uniform(0.06, 0.14)
+            if random.random() < overlap:
+                hold = t - press + random.uniform(0.01, 0.05)
+            events.append(("press", ch, press))
+            events.append(("release", ch, press + hold))
+        events.sort(key=lambda e: (e[2], e[0] == "press"))
+        recorded.append((phrase, events))
+        t += 1.0
+    return recorded
+
+def reversed_scan_capture(recorded, phrase):
+    # The capture path typing_auth used before streaming matching.
+    all_events = []
+    for typed, stream in recorded:
+        current_events = []
+        for kind, char, timestamp in stream:
+            if kind == "press":
+                current_events.append({"key": char, "press_time": timestamp})
+            else:
+                for event in reversed(current_events):
+                    if event["key"] == char and "release_time" not in event:
+                        event["release_time"] = timestamp
+                        break
+        if typed == phrase and len(current_events) >= len(phrase):
+            all_events.extend(current_events[:len(phrase)])
+    features = extract_features(all_events, 0.0)
+    return {"features": features, "keystrokes": all_events}
+
+def streaming_capture(recorded, phrase):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return typing_auth("S000000", "login", phrase, len(recorded), source=ReplaySource(recorded))
+
+def check_parity(recorded, phrase):
+    old = reversed_scan_capture(copy.deepcopy(recorded), phrase)
+    new = streaming_capture(copy.deepcopy(recorded), phrase)
+    for k in ("avgDwell", "avgFlight"):
+        assert abs(old["features"][k] - new["features"][k]) < 1e-6, (k, old["features"], new["features"])
+    assert len(old["keystrokes"]) == len(new["keystrokes"])
+    for o, n in zip(old["keystrokes"], new["keystrokes"]):
+        assert o.get("release_time") == n.get("release_time"), (o, n)
+        assert same(o["dwell_time"], n["dwell_time"]) and same(o["flight_time"], n["flight_time"]), (o, n)
+
+def time_per_sample(fn, recorded, phrase, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(recorded, phrase)
+    return (time.perf_counter() - start) / repeat / len(recorded)
+
+def finalize_cost(recorded, phrase, repeat):
+    # Old path: all features computed after the last sample. Streaming path:
+    # only the already-accumulated running means are read.
+    events = reversed_scan_capture(copy.deepcopy(recorded), phrase)["keystrokes"]
+    batches = [copy.deepcopy(events) for _ in range(repeat)]
+    start = time.perf_counter()
+    for batch in batches:
+        extract_features(batch, 0.0)
+    scan_s = (time.perf_counter() - start) / repeat
+
+    session = CaptureSession()
+    for typed, stream in recorded:
+        sample = SampleCapture(len(phrase))
+        ReplaySource([(typed, stream)]).read_sample(sample.press, sample.release)
+        session.accept(sample)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        session.features(0.0)
+    stream_s = (time.perf_counter() - start) / repeat
+    return scan_s, stream_s
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = []
+    for length in args.lengths:
+        # A small alphabet makes repeated keys, and so long reversed scans, likely.
+        phrase = "".join(random.choice("etaoin ") for _ in range(length))
+        recorded = synthetic_samples(phrase, args.samples)
+        check_parity(recorded, phrase)
+        scan_s = time_per_sample(reversed_scan_capture, recorded, phrase, args.repeat)
+        stream_s = time_per_sample(streaming_capture, recorded, phrase, args.repeat)
+        scan_final_s, stream_final_s = finalize_cost(recorded, phrase, args.repeat)
+        report.append({
+            "phrase_length": length,
+            "reversed_scan_us_per_sample": scan_s * 1e6,
+            "streaming_us_per_sample": stream_s * 1e6,
+            "reversed_scan_finalize_us": scan_final_s * 1e6,
+            "streaming_finalize_us": stream_final_s * 1e6,
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.samples} samples per capture, outputs match the reversed-scan path")
+    for r in report:
+        print(f"len {r['phrase_length']:5d}: reversed scan {r['reversed_scan_us_per_sample']:9.1f} us/sample, "
+              f"finalize {r['reversed_scan_finalize_us']:8.1f} us | streaming {r['streaming_us_per_sample']:9.1f} us/sample, "
+              f"finalize {r['streaming_finalize_us']:8.1f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/features.py
+# Per-sample latency of keystroke feature extraction, TimingStats vs the old pandas path:
+#   python -m benchmarks.features --samples 3 --repeat 2000
+import argparse
+import copy
+import json
+import math
+import random
+import time
+from keystroke_features import extract_features
+
+def synthetic_events(samples, phrase="thequickbrownfox"):
+    events = []
+    t = 1_700_000_000.0
+    for _ in range(samples):
+        for ch in phrase:
+            press = t
+            release = press + random.uniform(0.06, 0.14)
+            t = press + random.uniform(0.08, 0.25)
+            events.append({"key": ch, "press_time": press, "release_time": release})
+        t += 1.0
+    return events
+
+def pandas_features(all_events, error_rate):
+    # The implementation typing_auth used before keystroke_features.
+    import pandas as pd
+    if all_events:
+        df = pd.DataFrame(all_events)
+        df['dwell_time'] = df['release_time'] - df['press_time']
+        df['flight_time'] = df['press_time'].shift(-1) - df['release_time']
+        avg_dwell = df['dwell_time'].mean() * 1000 if not df['dwell_time'].isna().all() else 0
+        avg_flight = df['flight_time'].mean() * 1000 if not df['flight_time'].isna().all() else 0
+
+        for i, event in enumerate(all_events):
+            event['dwell_time'] = df['dwell_time'][i] if not pd.isna(df['dwell_time'][i]) else 0
+            event['flight_time'] = df['flight_time'][i] if not pd.isna(df['flight_time'][i]) else None
+    else:
+        avg_dwell, avg_flight = 0, 0
+    return {"avgDwell": avg_dwell, "avgFlight": avg_flight, "errorRate": error_rate}
+
+def same(a, b):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+
+def check_parity(events):
+    old_events, new_events = copy.deepcopy(events), copy.deepcopy(events)
+    old = pandas_features(old_events, 0.1)
+    new = extract_features(new_events, 0.1)
+    assert all(same(old[k], new[k]) for k in old), (old, new)
+    for o, n in zip(old_events, new_events):
+        assert same(o["dwell_time"], n["dwell_time"]) and same(o["flight_time"], n["flight_time"]), (o, n)
+
+def time_per_call(fn, events, repeat):
+    batches = [copy.deepcopy(events) for _ in range(repeat)]
+    start = time.perf_counter()
+    for batch in batches:
+        fn(batch, 0.1)
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=3, help="typing samples per call (3 for login, 5 for registration)")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    events = synthetic_events(args.samples)
+    partial = copy.deepcopy(events)
+    del partial[len(partial) // 2]["release_time"]
+    check_parity(events)
+    check_parity(partial)
+
+    stats_s = time_per_call(extract_features, events, args.repeat)
+    pandas_s = time_per_call(pandas_features, events, args.repeat)
+    report = {
+        "events_per_call": len(events),
+        "stats_us_per_sample": stats_s / args.samples * 1e6,
+        "pandas_us_per_sample": pandas_s / args.samples * 1e6,
+        "speedup": pandas_s / stats_s,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(events)} events per call ({args.samples} samples), outputs match the pandas path")
+    print(f"stats : {report['stats_us_per_sample']:8.1f} us/sample")
+    print(f"pandas: {report['pandas_us_per_sample']:8.1f} us/sample")
+    print(f"speedup: {report['speedup']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# benchmarks/instrumentation.py
+# Cost of the instrumentation layer: timed() steps and CountingCursor
+# statements with DB_METRICS off and on (statements need a reachable Postgres):
+#   python -m benchmarks.instrumentation --steps 1000000 --statements 20000
+import argparse
+import json
+import time
+import instrumentation
+
+def time_steps(n):
+    start = time.perf_counter()
+    for _ in range(n):
+        with instrumentation.timed("bench_step"):
+            pass
+    return (time.perf_counter() - start) / n
+
+def time_statements(db, n):
+    with db.cursor() as cur:
+        start = time.perf_counter()
+        for _ in range(n):
+            cur.execute("SELECT 1")
+            cur.fetchone()
+        return (time.perf_counter() - start) / n
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=1_000_000)
+    parser.add_argument("--statements", type=int, default=20_000)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {}
+    for enabled in (False, True):
+        # Statements and steps check the flag per call, so it can be flipped here.
+        instrumentation.ENABLED = enabled
+        report[f"step_us_{'on' if enabled else 'off'}"] = time_steps(args.steps) * 1e6
+    if args.statements:
+        from database import db
+        try:
+            db.init_db()
+            for enabled in (False, True, False, True):
+                instrumentation.ENABLED = enabled
+                report[f"statement_us_{'on' if enabled else 'off'}"] = time_statements(db, args.statements) * 1e6
+        finally:
+            db.close()
+    instrumentation.ENABLED = False
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:18s}: {value:8.3f} us")
+
+if __name__ == "__main__":
+    main()
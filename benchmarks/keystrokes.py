@@ -0,0 +1,87 @@
+# benchmarks/keystrokes.py
+# Compares keystroke ingestion paths against a local Postgres:
+#   python -m benchmarks.keystrokes --sessions 200 --keys 48 --threads 8
+import argparse
+import json
+import random
+import threading
+import time
+from database import Database, keystroke_rows, KEYSTROKE_COLUMNS
+from keystroke_writer import KeystrokeWriter
+
+BENCH_USER = "BENCH01"
+
+def synthetic_keystrokes(count, phrase="thequickbrownfox"):
+    events = []
+    t = time.time()
+    for i in range(count):
+        press = t
+        release = press + random.uniform(0.06, 0.14)
+        t = release + random.uniform(0.05, 0.2)
+        events.append({"key": phrase[i % len(phrase)], "press_time": press, "release_time": release,
+                       "dwell_time": release - press, "flight_time": t - release})
+    events[-1]["flight_time"] = None
+    return events
+
+def per_row_insert(db, rows):
+    # The original save_keystrokes loop: one INSERT round trip per keystroke.
+    with db.cursor() as cur:
+        for row in rows:
+            cur.execute(f"INSERT INTO keystrokes ({', '.join(KEYSTROKE_COLUMNS)}) "
+                        f"VALUES ({', '.join(['%s'] * len(KEYSTROKE_COLUMNS))})", row)
+    return len(rows)
+
+def run_sessions(sessions, threads, save):
+    chunks = [sessions[i::threads] for i in range(threads)]
+    def worker(chunk):
+        for rows in chunk:
+            save(rows)
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=48, help="keystrokes per session (3 samples x 16 keys)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    db = Database(maxconn=args.threads + 1)
+    db.add_user(BENCH_USER, "bench-keystrokes@example.com", "Bench#Pass1", "student", "Benchmark")
+    sessions = [keystroke_rows(BENCH_USER, synthetic_keystrokes(args.keys)) for _ in range(args.sessions)]
+    total_rows = sum(len(rows) for rows in sessions)
+
+    results = {}
+    try:
+        results["per_row"] = run_sessions(sessions, args.threads, lambda rows: per_row_insert(db, rows))
+        results["multi_row"] = run_sessions(sessions, args.threads, lambda rows: db.insert_keystroke_rows(rows, "values"))
+        results["copy"] = run_sessions(sessions, args.threads, lambda rows: db.insert_keystroke_rows(rows, "copy"))
+
+        writer = KeystrokeWriter(db, max_rows=5000, flush_interval=0.05)
+        start = time.perf_counter()
+        run_sessions(sessions, args.threads, writer.submit)
+        writer.close()
+        results["write_behind"] = time.perf_counter() - start
+    finally:
+        with db.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE user_id = %s", (BENCH_USER,))
+        db.close()
+
+    report = {name: {"seconds": seconds, "rows": total_rows, "rows_per_sec": total_rows / seconds}
+              for name, seconds in results.items()}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.sessions} sessions x {args.keys} keystrokes, {args.threads} threads")
+    baseline = report["per_row"]["rows_per_sec"]
+    for name, r in report.items():
+        print(f"{name:>13}: {r['rows_per_sec']:>10.0f} rows/sec  ({r['seconds']:.3f}s, {r['rows_per_sec'] / baseline:.1f}x)")
+
+if __name__ == "__main__":
+    main()
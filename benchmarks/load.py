@@ -0,0 +1,238 @@
+# benchmarks/load.py
+# Load generator for the auth and test flows against a local Postgres. Seeds
+# synthetic users, then drives register / login / typing verification / test
+# submission concurrently through the real Database methods (no input() or
+# pynput) and writes per-flow and per-method latency percentiles as JSON. The
+# login rate limiter is lifted unless --rate-limit is given, since the same
+# seeded users log in many times; the bruteforce flow exercises it instead:
+#   BCRYPT_ROUNDS=10 python -m benchmarks.load --users 200 --concurrency 16 --output load.json
+# With DB_METRICS=1 the per-statement Prometheus snapshot is written alongside.
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from database import Database
+from typing_verifier import verify_typing_features
+from typing_model import model_provider
+from content_cache import ContentCache
+from rate_limit import LoginRateLimiter
+import instrumentation
+from tests.fixtures import PASSWORD, synthetic_typing
+
+TEST_ID = "TELOAD01"
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+def summarize(latencies, errors, wall_seconds=None):
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+    }
+    if wall_seconds:
+        summary["throughput_per_sec"] = len(values) / wall_seconds
+    return summary
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, seconds, ok=True):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+# Wraps a Database so every public method call is timed under its name.
+class TimedDatabase:
+    def __init__(self, db, recorder):
+        self._db = db
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = attr(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self._recorder.add(name, time.perf_counter() - start, ok)
+        return timed
+
+def seed(db, users):
+    hashed = db.hasher.hash(PASSWORD)
+    seeded = []
+    with db.cursor() as cur:
+        for i in range(users):
+            user_id, email = f"L{i:06d}", f"load{i}@bench.local"
+            cur.execute("""
+                INSERT INTO users (user_id, email, password, role, name)
+                VALUES (%s, %s, %s, 'student', %s)
+                ON CONFLICT (user_id) DO UPDATE SET failed_attempts = 0, lockout_time = 0, lockout_count = 0
+            """, (user_id, email, hashed, f"Load User {i}"))
+            seeded.append((user_id, email))
+    for user_id, _ in seeded:
+        typing = synthetic_typing(5, dwell=random.uniform(0.06, 0.15), flight=random.uniform(0.08, 0.2))
+        db.save_typing_dynamics(user_id, typing["features"])
+        db.save_keystrokes(user_id, typing["keystrokes"], kind="register")
+    questions = {str(q): {"text": f"Q{q}", "options": ["a", "b", "c", "d"], "correct": q % 4} for q in range(1, 21)}
+    db.create_test(TEST_ID, questions, [user_id for user_id, _ in seeded])
+    return seeded
+
+def cleanup(db):
+    with db.cursor() as cur:
+        cur.execute("DELETE FROM student_submissions WHERE test_id = %s", (TEST_ID,))
+        cur.execute("DELETE FROM tests WHERE test_id = %s", (TEST_ID,))
+        cur.execute("DELETE FROM users WHERE email LIKE %s", ("%@bench.local",))
+
+def flow_register(tdb, i):
+    user_id, email = f"R{i:06d}", f"reg{i}@bench.local"
+    typing = synthetic_typing(5)
+    if not tdb.add_user(user_id, email, PASSWORD, "student", f"Registered {i}"):
+        return False
+    tdb.save_typing_dynamics(user_id, typing["features"])
+    tdb.save_keystrokes(user_id, typing["keystrokes"], kind="register")
+    return True
+
+def flow_login(tdb, user, queries):
+    user_id, email = user
+    tdb.reset_query_count()
+    state = tdb.get_auth_state(email)
+    if not state or state["user_id"] != user_id:
+        return False
+    logged_in, _ = tdb.verify_login(state, PASSWORD)
+    queries.append(tdb.query_count())
+    if not logged_in:
+        return False
+    typing = synthetic_typing(3)
+    tdb.save_keystrokes(user_id, typing["keystrokes"])
+    tdb.update_typing_profile(user_id, typing["features"], new_samples=3)
+    return True
+
+def flow_bruteforce(tdb, user):
+    # Wrong passwords against one account; succeeds when the limiter turns the
+    # attempt away before bcrypt runs.
+    user_id, email = user
+    state = tdb.get_auth_state(email)
+    if not state:
+        return False
+    _, counters = tdb.verify_login(state, "Wrong#Pass1")
+    return bool(counters and "retry_after" in counters)
+
+def flow_typing_verification(tdb, user):
+    user_id, _ = user
+    stored = tdb.get_user_typing_profile(user_id)
+    if not stored:
+        return False
+    typing = synthetic_typing(3)
+    verify_typing_features(typing["features"], stored)
+    if model_provider.available():
+        model_provider.predict_user(typing["features"])
+    return True
+
+def flow_submission(tdb, user, cache):
+    user_id, _ = user
+    header = tdb.get_test_header(TEST_ID, user_id)
+    if not header or not header["assigned"] or not cache.get(TEST_ID, header["version"]):
+        return False
+    answers = {str(q): random.randrange(4) for q in range(1, 21)}
+    return tdb.save_test_submission(user_id, TEST_ID, answers, random.uniform(0.9, 1.0), random.uniform(0.85, 1.0))
+
+def run_flow(name, fn, jobs, concurrency, flow_recorder):
+    def job(arg):
+        start = time.perf_counter()
+        ok = False
+        try:
+            ok = fn(arg)
+        except Exception:
+            ok = False
+        flow_recorder.add(name, time.perf_counter() - start, ok)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(job, jobs))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="operations per flow")
+    parser.add_argument("--flows", nargs="+", default=["register", "login", "typing_verification", "submission"])
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    parser.add_argument("--keep", action="store_true", help="keep seeded rows after the run")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the default login rate limits")
+    args = parser.parse_args()
+
+    db = Database(maxconn=args.concurrency + 2)
+    if not args.rate_limit:
+        db.login_limiter = LoginRateLimiter(":memory:", burst=1e12)
+    method_recorder, flow_recorder = Recorder(), Recorder()
+    tdb = TimedDatabase(db, method_recorder)
+    cache = ContentCache(database=tdb)
+    login_queries = []
+    walls = {}
+    try:
+        cleanup(db)
+        users = seed(db, args.users)
+        picks = [random.choice(users) for _ in range(args.ops)]
+        flows = {
+            "register": (lambda i: flow_register(tdb, i), range(args.ops)),
+            "login": (lambda u: flow_login(tdb, u, login_queries), picks),
+            "typing_verification": (lambda u: flow_typing_verification(tdb, u), picks),
+            "submission": (lambda u: flow_submission(tdb, u, cache), picks),
+            "bruteforce": (lambda u: flow_bruteforce(tdb, u), [users[0]] * args.ops),
+        }
+        # verify_typing_features prints a line per attempt; keep the report clean.
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name in args.flows:
+                fn, jobs = flows[name]
+                walls[name] = run_flow(name, fn, jobs, args.concurrency, flow_recorder)
+    finally:
+        if not args.keep:
+            cleanup(db)
+        db.close()
+
+    report = {
+        "config": {"users": args.users, "concurrency": args.concurrency, "ops": args.ops,
+                   "bcrypt_rounds": db.hasher.rounds, "hash_workers": db.hasher.workers,
+                   "db_host": os.getenv("DB_HOST", "localhost")},
+        "flows": {name: summarize(flow_recorder.latencies[name], flow_recorder.errors[name], walls[name])
+                  for name in walls},
+        "methods": {name: summarize(values, method_recorder.errors[name])
+                    for name, values in sorted(method_recorder.latencies.items())},
+    }
+    if "submission" in walls:
+        report["content_cache"] = cache.stats()
+    if login_queries:
+        report["login_queries_per_auth"] = sum(login_queries) / len(login_queries)
+    if instrumentation.ENABLED:
+        report["metrics_file"] = instrumentation.registry.write()
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/startup.py
+# Tracks CLI startup cost: `import app` time and time until the main menu prompt.
+#   python -m benchmarks.startup --runs 10 --save startup.json
+#   python -m benchmarks.startup --baseline startup.json --tolerance 0.25
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "pandas", "sklearn", "pynput", "psycopg2", "bcrypt")
+MENU_PROMPT = b"Select an option (1-3): "
+
+IMPORT_PROBE = f"""
+import sys, time, json
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+def measure_import():
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=ROOT, capture_output=True, check=True)
+    return json.loads(out.stdout)
+
+def measure_time_to_menu():
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-u", "app.py"], cwd=ROOT,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    seen = b""
+    while not seen.endswith(MENU_PROMPT):
+        chunk = proc.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError("app.py exited before showing the menu")
+        seen += chunk
+    elapsed = time.perf_counter() - start
+    proc.communicate(b"3\n")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    menu = [measure_time_to_menu() for _ in range(args.runs)]
+    report = {
+        "import_ms": statistics.median(r["seconds"] for r in imports) * 1000,
+        "time_to_menu_ms": statistics.median(menu) * 1000,
+        "heavy_modules_at_menu": imports[0]["loaded"],
+    }
+    print(json.dumps(report, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [key for key in ("import_ms", "time_to_menu_ms")
+                       if report[key] > baseline[key] * (1 + args.tolerance)]
+        new_heavy = sorted(set(report["heavy_modules_at_menu"]) - set(baseline.get("heavy_modules_at_menu", [])))
+        for key in regressions:
+            print(f"REGRESSION: {key} {report[key]:.1f}ms vs baseline {baseline[key]:.1f}ms")
+        if new_heavy:
+            print(f"REGRESSION: heavy modules now imported before the menu: {', '.join(new_heavy)}")
+        if regressions or new_heavy:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/verifier.py
+# Throughput of the vectorized typing verifier against the scalar per-attempt
+# check it replaced, on synthetic profiles and attempts (no database):
+#   python -m benchmarks.verifier --attempts 1000000 --users 5000
+import argparse
+import json
+import time
+import numpy as np
+from typing_verifier import accept
+
+def scalar_verify(login_features, stored_features, dwell_threshold=0.3, flight_threshold=0.3, error_threshold=0.2):
+    # The rule login.py and student_dashboard.py each carried a copy of, without the print.
+    dwell_ok = abs(login_features["avgDwell"] - stored_features["avgDwell"]) <= stored_features["avgDwell"] * dwell_threshold
+    flight_ok = abs(login_features["avgFlight"] - stored_features["avgFlight"]) <= stored_features["avgFlight"] * flight_threshold
+    error_ok = abs(login_features["errorRate"] - stored_features["errorRate"]) <= error_threshold and 0 <= login_features["errorRate"] <= 1
+    return dwell_ok and flight_ok and error_ok
+
+def synthetic(users, attempts, seed=0):
+    rng = np.random.default_rng(seed)
+    means = np.column_stack([rng.uniform(60, 160, users), rng.uniform(80, 300, users), rng.uniform(0, 0.1, users)])
+    stds = means * np.array([0.1, 0.15, 0.5])
+    counts = rng.integers(5, 50, users).astype(float)
+    owner = rng.integers(0, users, attempts)
+    samples = rng.normal(means[owner], stds[owner] * 1.5)
+    samples[:, 2] = np.clip(samples[:, 2], 0, 1)
+    return means[owner], stds[owner], counts[owner], samples
+
+def as_features(row):
+    return {"avgDwell": row[0], "avgFlight": row[1], "errorRate": row[2]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--scalar", type=int, default=100_000, help="attempts timed through the scalar check")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    means, stds, counts, samples = synthetic(args.users, args.attempts)
+
+    n = min(args.scalar, args.attempts)
+    start = time.perf_counter()
+    expected = [scalar_verify(as_features(samples[i]), as_features(means[i])) for i in range(n)]
+    scalar_s = time.perf_counter() - start
+    assert (accept(samples[:n], means[:n], mode="band") == np.array(expected)).all(), "band mode disagrees with the scalar check"
+
+    report = {"attempts": args.attempts, "scalar_attempts_per_s": n / scalar_s}
+    for mode in ("band", "zscore"):
+        start = time.perf_counter()
+        accepted = accept(samples, means, stds, counts, mode=mode)
+        elapsed = time.perf_counter() - start
+        report[f"{mode}_attempts_per_s"] = args.attempts / elapsed
+        report[f"{mode}_accept_rate"] = float(accepted.mean())
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.attempts} attempts over {args.users} profiles, band mode matches the scalar check")
+    print(f"scalar : {report['scalar_attempts_per_s']:12,.0f} attempts/s")
+    for mode in ("band", "zscore"):
+        print(f"{mode:7s}: {report[f'{mode}_attempts_per_s']:12,.0f} attempts/s "
+              f"(accept rate {report[f'{mode}_accept_rate']:.1%})")
+
+if __name__ == "__main__":
+    main()
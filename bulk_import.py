@@ -0,0 +1,204 @@
+# bulk_import.py
+# Loads question banks and rosters from files in one transaction:
+#   python bulk_import.py --tests bank.csv --roster roster.csv --rejects rejects.jsonl
+# Tests, by extension:
+#   .csv   one row per question: test_id, question_id, text, option1..option4,
+#          correct (1-4, as typed in Create Test), assigned_ids (";"-separated,
+#          optional); rows with the same test_id form one test
+#   .json  a list of {"test_id", "questions", "assigned_ids"} objects, with
+#          questions stored as the tests table holds them ("correct" is 0-3)
+#   .jsonl one such object per line
+# Rosters: .csv with test_id,user_id columns, or .json/.jsonl {"test_id", "user_id"}
+# records. Every referenced user_id is checked in one query; rejected rows are
+# written to the rejects file with the reason instead of aborting the import.
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from database import db, Database
+from analytics import LOCK_TEST_STATS_SQL
+from queries import ASSIGN_SQL
+
+def _records(path):
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, newline="") as f:
+        if ext == ".csv":
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                yield line, row
+        elif ext == ".jsonl":
+            for line, text in enumerate(f, start=1):
+                if text.strip():
+                    try:
+                        yield line, json.loads(text)
+                    except ValueError as e:
+                        yield line, {"_error": f"invalid JSON: {e}", "_raw": text.strip()}
+        elif ext == ".json":
+            for line, record in enumerate(json.load(f), start=1):
+                yield line, record
+        else:
+            raise ValueError(f"Unsupported file type: {path}")
+
+def _question(text, options, correct):
+    if not text or len(options) != 4 or any(not o for o in options):
+        raise ValueError("question needs text and 4 options")
+    if not isinstance(correct, int) or not 0 <= correct <= 3:
+        raise ValueError("correct answer must be one of the 4 options")
+    return {"text": text, "options": options, "correct": correct}
+
+def _check_test_id(test_id):
+    if not test_id or len(test_id) > 8:
+        raise ValueError("test_id must be 1-8 characters")
+    return test_id
+
+class Importer:
+    def __init__(self):
+        self.tests = {}
+        self.assignments = []
+        self.rejects = []
+        self.rows = 0
+
+    def reject(self, source, line, reason, record):
+        self.rejects.append({"source": source, "line": line, "reason": reason, "record": record})
+
+    def read_tests(self, path):
+        csv_input = path.lower().endswith(".csv")
+        for line, record in _records(path):
+            self.rows += 1
+            test_id = None
+            try:
+                if not isinstance(record, dict):
+                    raise ValueError("expected an object")
+                if "_error" in record:
+                    raise ValueError(record["_error"])
+                test_id = _check_test_id((record.get("test_id") or "").strip())
+                test = self.tests.setdefault(test_id, {"questions": {}, "assigned": [], "source": (path, line)})
+                if csv_input:
+                    qid = (record.get("question_id") or "").strip() or str(len(test["questions"]) + 1)
+                    correct = int(record.get("correct") or 0) - 1
+                    options = [(record.get(f"option{i}") or "").strip() for i in range(1, 5)]
+                    test["questions"][qid] = _question((record.get("text") or "").strip(), options, correct)
+                    assigned = [u.strip() for u in (record.get("assigned_ids") or "").split(";") if u.strip()]
+                else:
+                    questions = record.get("questions") or {}
+                    if isinstance(questions, list):
+                        questions = {str(i): q for i, q in enumerate(questions, 1)}
+                    for qid, q in questions.items():
+                        test["questions"][str(qid)] = _question(q.get("text"), q.get("options") or [], q.get("correct"))
+                    assigned = [str(u).strip() for u in record.get("assigned_ids") or []]
+                for user_id in assigned:
+                    self.assignments.append((test_id, user_id, path, line, True))
+            except (ValueError, TypeError, AttributeError) as e:
+                self.reject(path, line, str(e), record)
+                if test_id in self.tests:
+                    # A test is imported whole or not at all.
+                    self.tests[test_id]["invalid"] = True
+
+    def read_roster(self, path):
+        for line, record in _records(path):
+            self.rows += 1
+            if not isinstance(record, dict):
+                self.reject(path, line, "expected an object", record)
+                continue
+            test_id = str(record.get("test_id") or "").strip()
+            user_id = str(record.get("user_id") or "").strip()
+            if "_error" in record or not test_id or not user_id:
+                self.reject(path, line, record.get("_error", "test_id and user_id are required"), record)
+                continue
+            self.assignments.append((test_id, user_id, path, line, False))
+
+    def write(self):
+        with db.cursor() as cur:
+            # Validate every referenced student and test id up front, one query each.
+            cur.execute("SELECT user_id FROM users WHERE role = 'student' AND user_id = ANY(%s)",
+                        (list({a[1] for a in self.assignments}),))
+            students = {row["user_id"] for row in cur.fetchall()}
+            cur.execute("SELECT test_id FROM tests WHERE test_id = ANY(%s)",
+                        (list(self.tests) + list({a[0] for a in self.assignments}),))
+            existing = {row["test_id"] for row in cur.fetchall()}
+
+            for test_id in [t for t in self.tests if t in existing]:
+                path, line = self.tests.pop(test_id)["source"]
+                self.reject(path, line, f"test {test_id} already exists", {"test_id": test_id})
+            for test_id in [t for t, test in self.tests.items() if test.get("invalid") or not test["questions"]]:
+                path, line = self.tests.pop(test_id)["source"]
+                self.reject(path, line, f"test {test_id} has invalid or no questions", {"test_id": test_id})
+
+            assignments = {}
+            for test_id, user_id, path, line, from_bank in self.assignments:
+                if user_id not in students:
+                    self.reject(path, line, f"unknown student {user_id}", {"test_id": test_id, "user_id": user_id})
+                elif from_bank and test_id not in self.tests:
+                    self.reject(path, line, f"test {test_id} was not imported", {"test_id": test_id, "user_id": user_id})
+                elif test_id not in self.tests and test_id not in existing:
+                    self.reject(path, line, f"unknown test {test_id}", {"test_id": test_id, "user_id": user_id})
+                else:
+                    assignments.setdefault((test_id, user_id), None)
+            for test_id, user_id in assignments:
+                if test_id in self.tests:
+                    self.tests[test_id]["assigned"].append(user_id)
+
+            if self.tests:
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                for test_id, test in self.tests.items():
+                    writer.writerow([test_id, json.dumps(test["questions"]), json.dumps(test["assigned"])])
+                buf.seek(0)
+                cur.copy_expert("COPY tests (test_id, questions, assigned_ids) FROM STDIN WITH (FORMAT csv)", buf)
+            # Summary rows for the new tests, locked with the existing ones so
+            # the assignment counts add to them.
+            cur.execute(LOCK_TEST_STATS_SQL, {"test_ids": sorted(set(self.tests) | {t for t, _ in assignments})})
+            cur.execute(ASSIGN_SQL, {"test_ids": [t for t, _ in assignments], "user_ids": [u for _, u in assignments]})
+            # Keep the legacy assigned_ids column in step for tests that already existed.
+            updated = list({test_id for test_id, _ in assignments if test_id in existing})
+            if updated:
+                cur.execute("""
+                    UPDATE tests t
+                    SET assigned_ids = (SELECT jsonb_agg(a.user_id ORDER BY a.user_id)
+                                        FROM test_assignments a WHERE a.test_id = t.test_id)
+                    WHERE t.test_id = ANY(%s)
+                """, (updated,))
+            return len(self.tests), sum(len(t["questions"]) for t in self.tests.values()), len(assignments)
+
+def write_rejects(rejects, path):
+    with open(path, "w") as f:
+        for reject in rejects:
+            f.write(json.dumps(reject, default=str) + "\n")
+
+def import_files(tests_path=None, roster_path=None, rejects_path="import_rejects.jsonl"):
+    # The import is written with COPY and Postgres array SQL.
+    if not isinstance(db, Database):
+        print("Bulk import is only available on the Postgres backend.")
+        return None
+    start = time.perf_counter()
+    importer = Importer()
+    if tests_path:
+        importer.read_tests(tests_path)
+    if roster_path:
+        importer.read_roster(roster_path)
+    tests, questions, assignments = importer.write()
+    elapsed = time.perf_counter() - start
+    if importer.rejects:
+        write_rejects(importer.rejects, rejects_path)
+    report = {"rows": importer.rows, "tests": tests, "questions": questions, "assignments": assignments,
+              "rejected": len(importer.rejects), "seconds": elapsed,
+              "rows_per_sec": importer.rows / elapsed if elapsed > 0 else 0.0}
+    print(f"Imported {tests} tests ({questions} questions) and {assignments} assignments "
+          f"from {importer.rows} rows in {elapsed:.2f}s ({report['rows_per_sec']:.0f} rows/sec).")
+    if importer.rejects:
+        print(f"{len(importer.rejects)} rows rejected; see {rejects_path}.")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", help="question bank (.csv, .json or .jsonl)")
+    parser.add_argument("--roster", help="test assignments (.csv, .json or .jsonl)")
+    parser.add_argument("--rejects", default="import_rejects.jsonl")
+    args = parser.parse_args()
+    if not args.tests and not args.roster:
+        parser.error("nothing to import: pass --tests and/or --roster")
+    try:
+        import_files(args.tests, args.roster, args.rejects)
+    finally:
+        db.close()
@@ -0,0 +1,74 @@
+# content_cache.py
+import os
+import threading
+from collections import OrderedDict
+from database import db
+
+# Bounded LRU of decoded tests keyed by (test_id, version). tests.version is
+# bumped by a trigger whenever the questions change, so a cached entry is
+# never served for a newer version; callers learn the current version from
+# db.get_test_header, which also answers the assignment check.
+class ContentCache:
+    def __init__(self, capacity=None, database=None):
+        self.db = database or db
+        self.capacity = capacity if capacity is not None else int(os.getenv("TEST_CACHE_SIZE", "128"))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, test_id, version):
+        key = (test_id, version)
+        with self._lock:
+            test = self._entries.get(key)
+            if test is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return test
+            self.misses += 1
+        test = self.db.get_test(test_id)
+        if test is not None:
+            self.put(test)
+        return test
+
+    def put(self, test):
+        key = (test["test_id"], test["version"])
+        with self._lock:
+            old_version = self._versions.get(key[0])
+            if old_version is not None and old_version != key[1]:
+                if old_version > key[1]:
+                    return
+                del self._entries[(key[0], old_version)]
+                self.invalidations += 1
+            self._entries[key] = test
+            self._entries.move_to_end(key)
+            self._versions[key[0]] = key[1]
+            while len(self._entries) > self.capacity:
+                (test_id, _), _ = self._entries.popitem(last=False)
+                del self._versions[test_id]
+                self.evictions += 1
+
+    def invalidate(self, test_id):
+        with self._lock:
+            version = self._versions.pop(test_id, None)
+            if version is not None:
+                del self._entries[(test_id, version)]
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+content_cache = ContentCache()
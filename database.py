@@ -1,277 +1,406 @@
 # database.py
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import random
-import string
-import bcrypt
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from contextlib import contextmanager
 import time
-import pyotp
+import datetime
+import threading
 import json
+import io
+import csv
+from migrations import migrate
+from analytics import LOCK_ALL_STATS_SQL, LOCK_TEST_STATS_SQL, refresh_stats, test_report, confidence_gap_report
+from storage import (StorageBackend, LOCKOUT_SECONDS, LOCKOUT_TRANSITIONS, KEYSTROKE_COLUMNS, TYPING_PROFILE_COLUMNS,
+                     count_query, keystroke_rows, score_distribution, typing_profile_dict)
+from queries import (RESERVE_IDS_SQL, TAKEN_IDS_SQL, ADD_USER_SQL, USER_BY_EMAIL_SQL, USER_BY_ID_SQL, AUTH_STATE_SQL,
+                     REHASH_PASSWORD_SQL, STORED_FAILED_ATTEMPTS_SQL, APPLY_LOCKOUT_SQL, RESET_FAILED_ATTEMPTS_SQL,
+                     CLEAR_LOCKOUT_SQL, INCREMENT_FAILED_ATTEMPTS_SQL, TYPING_PROFILE_SQL, SAVE_TYPING_DYNAMICS_SQL,
+                     MERGE_TYPING_PROFILE_SQL, TYPING_DIGRAPHS_SQL, INIT_TYPING_DIGRAPHS_SQL,
+                     LOCK_TYPING_DIGRAPHS_SQL, UPDATE_TYPING_DIGRAPHS_SQL, CREATE_TEST_SQL, TEST_SQL,
+                     TEST_HEADER_SQL, TEST_ASSIGNED_SQL, ASSIGNED_TEST_IDS_SQL, TEST_SUBMITTERS_SQL, GRADE_SQL,
+                     GRADE_TEST_CONDITION, SUBMISSION_SQL, ASSIGN_SQL, SCORE_DISTRIBUTION_SQL, TYPING_PROFILES_SQL,
+                     TYPING_PROFILES_SINCE_SQL)
+import instrumentation
 
-class Database:
-    def __init__(self):
-        self.conn = psycopg2.connect(
+# Counts statements per thread so a flow can report how many round trips it
+# made, and times each one when instrumentation is enabled.
+class CountingCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        count_query()
+        if not instrumentation.ENABLED:
+            return super().execute(query, vars)
+        return self._timed(query, super().execute, query, vars)
+
+    def copy_expert(self, sql, file, size=8192):
+        count_query()
+        if not instrumentation.ENABLED:
+            return super().copy_expert(sql, file, size)
+        return self._timed(sql, super().copy_expert, sql, file, size)
+
+    def _timed(self, sql, run, *args):
+        start = time.perf_counter()
+        try:
+            result = run(*args)
+        except Exception:
+            instrumentation.record_statement(sql, time.perf_counter() - start, None, error=True)
+            raise
+        instrumentation.record_statement(sql, time.perf_counter() - start, max(self.rowcount, 0))
+        return result
+
+class Database(StorageBackend):
+    def __init__(self, minconn=None, maxconn=None):
+        self.minconn = minconn if minconn is not None else int(os.getenv("DB_POOL_MIN", "1"))
+        self.maxconn = maxconn if maxconn is not None else int(os.getenv("DB_POOL_MAX", "10"))
+        self.checkout_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self.health_check_interval = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+        self._pool = None
+        self._ready = False
+        self._pool_lock = threading.RLock()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used = {}
+        super().__init__()
+
+    def _connect_kwargs(self):
+        return dict(
             host=os.getenv("DB_HOST", "localhost"),
             dbname=os.getenv("DB_NAME", "SmartSecure"),
             user=os.getenv("DB_USER", "postgres"),
             password=os.getenv("DB_PASSWORD", "CruseQ67"),
-            cursor_factory=RealDictCursor
+            cursor_factory=CountingCursor
         )
-        self.init_db()
+
+    def _get_pool(self):
+        if self._ready:
+            return self._pool
+        with self._pool_lock:
+            # init_db() re-enters here from the same thread while the schema is
+            # being created; other threads wait on the lock until it is ready.
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self._connect_kwargs())
+                try:
+                    self.init_db()
+                except Exception:
+                    self._pool.closeall()
+                    self._pool = None
+                    raise
+                self._ready = True
+            return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self, pool):
+        # A pooled connection may have been dropped by the server while idle;
+        # replace it with a fresh one instead of handing it to the caller.
+        for _ in range(self.maxconn + 1):
+            conn = pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            self._last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Could not obtain a healthy database connection")
+
+    def connect(self):
+        self._get_pool()
+
+    @contextmanager
+    def connection(self):
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f"No database connection available after {self.checkout_timeout} seconds")
+        try:
+            conn = self._checkout(pool)
+            try:
+                yield conn
+                conn.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = None
+                raise
+            except BaseException:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                if conn is not None:
+                    self._last_used[id(conn)] = time.monotonic()
+                    pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                yield cur
 
     def init_db(self):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id VARCHAR(7) PRIMARY KEY,
-                    email VARCHAR(255) UNIQUE NOT NULL,
-                    password VARCHAR(255) NOT NULL,
-                    role VARCHAR(10) NOT NULL CHECK (role IN ('admin', 'student')),
-                    name VARCHAR(255) NOT NULL,
-                    failed_attempts INTEGER DEFAULT 0,
-                    lockout_time REAL DEFAULT 0,
-                    lockout_count INTEGER DEFAULT 0
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS typing_profiles (
-                    user_id VARCHAR(7) PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
-                    avg_dwell REAL NOT NULL,
-                    avg_flight REAL NOT NULL,
-                    error_rate REAL NOT NULL,
-                    sample_count INTEGER DEFAULT 5
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS keystrokes (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
-                    key CHAR(1),
-                    press_time REAL,
-                    release_time REAL,
-                    dwell_time REAL,
-                    flight_time REAL
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS tests (
-                    test_id VARCHAR(8) PRIMARY KEY,
-                    questions JSONB NOT NULL,
-                    assigned_ids JSONB NOT NULL,
-                    replies JSONB DEFAULT '{}'
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS student_submissions (
-                    user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
-                    test_id VARCHAR(8),
-                    taken_time TIMESTAMP NOT NULL,
-                    stored_confidence REAL NOT NULL,
-                    test_confidence REAL NOT NULL,
-                    answers JSONB NOT NULL,
-                    PRIMARY KEY (user_id, test_id)
-                );
-            """)
-            self.conn.commit()
-
-    def generate_token(self, role):
-        prefix = "A" if role == "admin" else "S"
-        return prefix + "".join(random.choices(string.digits, k=6))
+        migrate(self)
+
+    def reserve_ids(self, space, count):
+        with self.cursor() as cur:
+            cur.execute(RESERVE_IDS_SQL, {"sequence": space.sequence, "count": count})
+            candidates = [space.format(row["n"]) for row in cur.fetchall()]
+            cur.execute(TAKEN_IDS_SQL.format(table=space.table, column=space.column), {"ids": candidates})
+            taken = {row["id"] for row in cur.fetchall()}
+            return [c for c in candidates if c not in taken]
 
     def add_user(self, user_id, email, password, role, name):
-        hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        hashed_password = self.hasher.hash(password)
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO users (user_id, email, password, role, name)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING user_id;
-                """, (user_id, email, hashed_password, role, name))
+            with self.cursor() as cur:
+                cur.execute(ADD_USER_SQL, {"user_id": user_id, "email": email, "password": hashed_password,
+                                           "role": role, "name": name})
                 result = cur.fetchone()
-                self.conn.commit()
                 return result is not None
         except psycopg2.IntegrityError:
-            self.conn.rollback()
             return False
 
     def get_user_by_email(self, email):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE email = %s", (email,))
+        with self.cursor() as cur:
+            cur.execute(USER_BY_EMAIL_SQL, {"email": email})
             return cur.fetchone()
 
     def get_user_by_id(self, user_id):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+        with self.cursor() as cur:
+            cur.execute(USER_BY_ID_SQL, {"user_id": user_id})
             return cur.fetchone()
 
-    def check_password(self, email, password):
-        user = self.get_user_by_email(email)
-        if user:
-            if user["lockout_count"] >= 2:
+    def get_auth_state(self, email):
+        with self.cursor() as cur:
+            cur.execute(AUTH_STATE_SQL, {"email": email})
+            row = cur.fetchone()
+            if row is None:
                 return None
-            if user["lockout_time"] > time.time():
-                return None
-            if bcrypt.checkpw(password.encode(), user["password"].encode()):
-                return user
-            self.increment_failed_attempts(email)
-        return None
+            state = {k: v for k, v in row.items() if k not in TYPING_PROFILE_COLUMNS}
+            state["typing_profile"] = typing_profile_dict(row) if row["avg_dwell"] is not None else None
+            return state
+
+    def rehash_password(self, user_id, old_hash, password):
+        with self.cursor() as cur:
+            cur.execute(REHASH_PASSWORD_SQL, {"password": self.hasher.hash(password), "user_id": user_id,
+                                              "old_hash": old_hash})
+            return cur.rowcount == 1
+
+    def _stored_failed_attempts(self, email):
+        with self.cursor() as cur:
+            cur.execute(STORED_FAILED_ATTEMPTS_SQL, {"email": email})
+            row = cur.fetchone()
+            return row["failed_attempts"] if row else None
+
+    def _apply_lockout(self, email, attempts, until):
+        with self.cursor() as cur:
+            cur.execute(APPLY_LOCKOUT_SQL, {"attempts": attempts, "until": until, "email": email})
+            return cur.fetchone()
+
+    def _reset_failed_attempts(self, email):
+        with self.cursor() as cur:
+            cur.execute(RESET_FAILED_ATTEMPTS_SQL, {"email": email})
+
+    def _clear_lockout(self, email, lockout_time):
+        with self.cursor() as cur:
+            cur.execute(CLEAR_LOCKOUT_SQL, {"email": email, "lockout_time": lockout_time})
 
     def increment_failed_attempts(self, email):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                UPDATE users 
-                SET failed_attempts = failed_attempts + 1,
-                    lockout_time = CASE 
-                        WHEN failed_attempts + 1 = 3 THEN %s 
-                        ELSE lockout_time 
-                    END,
-                    lockout_count = CASE 
-                        WHEN failed_attempts + 1 = 6 THEN lockout_count + 1 
-                        ELSE lockout_count 
-                    END
-                WHERE email = %s
-                RETURNING failed_attempts, lockout_time, lockout_count
-            """, (time.time() + 30, email))
+        with self.cursor() as cur:
+            cur.execute(INCREMENT_FAILED_ATTEMPTS_SQL, {"until": time.time() + LOCKOUT_SECONDS, "email": email})
             result = cur.fetchone()
-            self.conn.commit()
             if result is None:
                 return {"failed_attempts": 0, "lockout_time": 0, "lockout_count": 0}
             return result
 
     def get_user_typing_profile(self, user_id):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT * FROM typing_profiles WHERE user_id = %s", (user_id,))
+        with self.cursor() as cur:
+            cur.execute(TYPING_PROFILE_SQL, {"user_id": user_id})
             profile = cur.fetchone()
             if profile:
-                return {"avgDwell": profile["avg_dwell"], "avgFlight": profile["avg_flight"], "errorRate": profile["error_rate"]}
+                return typing_profile_dict(profile)
             return None
 
-    def save_typing_dynamics(self, user_id, features):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO typing_profiles (user_id, avg_dwell, avg_flight, error_rate, sample_count)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (user_id) DO UPDATE
-                SET avg_dwell = EXCLUDED.avg_dwell,
-                    avg_flight = EXCLUDED.avg_flight,
-                    error_rate = EXCLUDED.error_rate,
-                    sample_count = EXCLUDED.sample_count
-            """, (user_id, features["avgDwell"], features["avgFlight"], features["errorRate"], 5))
-            self.conn.commit()
-
-    def save_keystrokes(self, user_id, keystrokes):
-        with self.conn.cursor() as cur:
-            for ks in keystrokes:
-                cur.execute("""
-                    INSERT INTO keystrokes (user_id, key, press_time, release_time, dwell_time, flight_time)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (user_id, ks.get("key"), ks.get("press_time"), ks.get("release_time"),
-                      ks.get("dwell_time"), ks.get("flight_time")))
-            self.conn.commit()
-
-    def update_typing_profile(self, user_id, new_features, new_samples):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT * FROM typing_profiles WHERE user_id = %s", (user_id,))
+    def save_typing_dynamics(self, user_id, features, keystrokes=None):
+        with self.cursor() as cur:
+            cur.execute(SAVE_TYPING_DYNAMICS_SQL, {"user_id": user_id, "dwell": features["avgDwell"],
+                                                   "flight": features["avgFlight"], "error": features["errorRate"],
+                                                   "samples": 5})
+        if keystrokes:
+            self.update_typing_digraphs(user_id, keystrokes)
+
+    def insert_keystroke_rows(self, rows, method=None):
+        if not rows:
+            return 0
+        method = method or self.keystroke_insert_method
+        start = time.perf_counter()
+        with self.cursor() as cur:
+            if method == "copy":
+                buf = io.StringIO()
+                csv.writer(buf).writerows(rows)
+                buf.seek(0)
+                cur.copy_expert(f"COPY keystrokes ({', '.join(KEYSTROKE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+            else:
+                execute_values(cur, f"INSERT INTO keystrokes ({', '.join(KEYSTROKE_COLUMNS)}) VALUES %s",
+                               rows, page_size=1000)
+        self._count_ingest(len(rows), time.perf_counter() - start)
+        return len(rows)
+
+    def get_user_keystrokes(self, user_id, since=None):
+        # Served by keystrokes_user_captured_idx on every partition.
+        with self.cursor() as cur:
+            cur.execute(f"""
+                SELECT {', '.join(KEYSTROKE_COLUMNS)}, captured_at
+                FROM keystrokes
+                WHERE user_id = %s AND captured_at >= %s
+                ORDER BY captured_at, id
+            """, (user_id, since or datetime.datetime.min))
+            return cur.fetchall()
+
+    def _merge_typing_profile(self, user_id, new_features, new_samples):
+        with self.cursor() as cur:
+            cur.execute(MERGE_TYPING_PROFILE_SQL, {"user_id": user_id, "dwell": new_features["avgDwell"],
+                                                   "flight": new_features["avgFlight"],
+                                                   "error": new_features["errorRate"], "samples": new_samples})
             profile = cur.fetchone()
-            if not profile:
-                print("No existing typing profile found for user! Creating new profile.")
-                cur.execute("""
-                    INSERT INTO typing_profiles (user_id, avg_dwell, avg_flight, error_rate, sample_count)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (user_id, new_features["avgDwell"], new_features["avgFlight"], new_features["errorRate"], new_samples))
-                self.conn.commit()
-                return True
-
-            old_samples = profile["sample_count"]
-            total_samples = old_samples + new_samples
-
-            new_avg_dwell = (profile["avg_dwell"] * old_samples + new_features["avgDwell"] * new_samples) / total_samples
-            new_avg_flight = (profile["avg_flight"] * old_samples + new_features["avgFlight"] * new_samples) / total_samples
-            new_error_rate = (profile["error_rate"] * old_samples + new_features["errorRate"] * new_samples) / total_samples
-
-            cur.execute("""
-                UPDATE typing_profiles
-                SET avg_dwell = %s,
-                    avg_flight = %s,
-                    error_rate = %s,
-                    sample_count = %s
-                WHERE user_id = %s
-            """, (new_avg_dwell, new_avg_flight, new_error_rate, total_samples, user_id))
-            self.conn.commit()
-            return True
+            return profile, profile["inserted"]
 
-    def generate_totp_token(self, email):
-        secret = pyotp.random_base32()
-        totp = pyotp.TOTP(secret, interval=300)
-        token = totp.now()
-        return token, secret
+    def get_typing_digraphs(self, user_id):
+        from typing_digraphs import DigraphProfile
+        with self.cursor() as cur:
+            cur.execute(TYPING_DIGRAPHS_SQL, {"user_id": user_id})
+            row = cur.fetchone()
+            return DigraphProfile.from_bytes(row["profile"]) if row else None
 
-    def verify_totp_token(self, token, secret):
-        totp = pyotp.TOTP(secret, interval=300)
-        return totp.verify(token)
+    def update_typing_digraphs(self, user_id, keystrokes):
+        from typing_digraphs import DigraphProfile
+        with self.cursor() as cur:
+            cur.execute(INIT_TYPING_DIGRAPHS_SQL, {"user_id": user_id,
+                                                   "profile": psycopg2.Binary(DigraphProfile().to_bytes())})
+            cur.execute(LOCK_TYPING_DIGRAPHS_SQL, {"user_id": user_id})
+            profile = DigraphProfile.from_bytes(cur.fetchone()["profile"])
+            added = profile.update(keystrokes)
+            cur.execute(UPDATE_TYPING_DIGRAPHS_SQL, {"profile": psycopg2.Binary(profile.to_bytes()), "added": added,
+                                                     "user_id": user_id})
+            return profile
 
     def create_test(self, test_id, questions, assigned_ids):
         try:
-            with self.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO tests (test_id, questions, assigned_ids)
-                    VALUES (%s, %s, %s)
-                    RETURNING test_id;
-                """, (test_id, json.dumps(questions), json.dumps(assigned_ids)))
+            with self.cursor() as cur:
+                cur.execute(CREATE_TEST_SQL, {"test_id": test_id, "questions": json.dumps(questions),
+                                              "assigned_ids": json.dumps(assigned_ids)})
                 result = cur.fetchone()
-                self.conn.commit()
+                cur.execute(LOCK_TEST_STATS_SQL, {"test_ids": [test_id]})
+                cur.execute(ASSIGN_SQL, {"test_ids": [test_id] * len(assigned_ids), "user_ids": list(assigned_ids)})
                 return result is not None
         except psycopg2.IntegrityError:
-            self.conn.rollback()
             return False
 
     def get_test(self, test_id):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT * FROM tests WHERE test_id = %s", (test_id,))
+        with self.cursor() as cur:
+            cur.execute(TEST_SQL, {"test_id": test_id})
+            return cur.fetchone()
+
+    def get_test_header(self, test_id, user_id):
+        with self.cursor() as cur:
+            cur.execute(TEST_HEADER_SQL, {"test_id": test_id, "user_id": user_id})
             return cur.fetchone()
 
     def is_test_assigned(self, test_id, user_id):
-        test = self.get_test(test_id)
-        if test and "assigned_ids" in test:
-            assigned_ids = test["assigned_ids"]
-            return user_id in assigned_ids
-        return False
+        with self.cursor() as cur:
+            cur.execute(TEST_ASSIGNED_SQL, {"test_id": test_id, "user_id": user_id})
+            return cur.fetchone() is not None
 
     def save_test_submission(self, user_id, test_id, answers, stored_confidence, test_confidence):
-        with self.conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO student_submissions (user_id, test_id, taken_time, stored_confidence, test_confidence, answers)
-                VALUES (%s, %s, NOW(), %s, %s, %s)
-                ON CONFLICT (user_id, test_id) DO UPDATE
-                SET taken_time = NOW(),
-                    stored_confidence = EXCLUDED.stored_confidence,
-                    test_confidence = EXCLUDED.test_confidence,
-                    answers = EXCLUDED.answers
-                RETURNING user_id;
-            """, (user_id, test_id, stored_confidence, test_confidence, json.dumps(answers)))
-            result = cur.fetchone()
-            self.conn.commit()
-            return result is not None
+        # The submission is graded and added to the analytics rows in the same
+        # statement. Locking the test's row first queues it behind a regrade.
+        with self.cursor() as cur:
+            cur.execute(LOCK_TEST_STATS_SQL, {"test_ids": [test_id]})
+            cur.execute(SUBMISSION_SQL, {"user_id": user_id, "test_id": test_id, "stored_confidence": stored_confidence,
+                                         "test_confidence": test_confidence, "answers": json.dumps(answers)})
+            return cur.fetchone() is not None
+
+    def grade_tests(self, test_id=None):
+        # Re-grades every submission (for one test, or all) in one pass.
+        with self.cursor() as cur:
+            if test_id is None:
+                cur.execute(LOCK_ALL_STATS_SQL)
+                cur.execute(GRADE_SQL.format(source="student_submissions", condition=""))
+                graded = cur.rowcount
+                refresh_stats(cur)
+            else:
+                cur.execute(LOCK_TEST_STATS_SQL, {"test_ids": [test_id]})
+                cur.execute(GRADE_SQL.format(source="student_submissions", condition=GRADE_TEST_CONDITION),
+                            {"test_id": test_id})
+                graded = cur.rowcount
+                cur.execute(TEST_SUBMITTERS_SQL, {"test_id": test_id})
+                refresh_stats(cur, [test_id], [row["user_id"] for row in cur.fetchall()])
+            return graded
+
+    def get_score_distribution(self, test_id, bins=10):
+        with self.cursor() as cur:
+            cur.execute(SCORE_DISTRIBUTION_SQL, {"bins": bins, "test_id": test_id})
+            return score_distribution(cur.fetchall(), bins)
+
+    def get_test_stats(self, limit=50):
+        with self.cursor() as cur:
+            return test_report(cur, limit)
+
+    def get_confidence_gaps(self, limit=10):
+        with self.cursor() as cur:
+            return confidence_gap_report(cur, limit)
 
     def get_assigned_test_ids(self, user_id):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT test_id, assigned_ids FROM tests")
-            tests = cur.fetchall()
-            assigned_tests = []
-            for test in tests:
-                if user_id in test["assigned_ids"]:
-                    assigned_tests.append(test["test_id"])
-            return assigned_tests
+        with self.cursor() as cur:
+            cur.execute(ASSIGNED_TEST_IDS_SQL, {"user_id": user_id})
+            return [row["test_id"] for row in cur.fetchall()]
+
+    def get_typing_profiles(self, since=None):
+        with self.cursor() as cur:
+            if since is None:
+                cur.execute(TYPING_PROFILES_SQL)
+            else:
+                cur.execute(TYPING_PROFILES_SINCE_SQL, {"since": since})
+            return cur.fetchall()
 
     def close(self):
-        self.conn.close()
+        super().close()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._ready = False
+                self._last_used.clear()
+
+instrumentation.instrument(Database)
+
+def create_backend(name=None):
+    # DB_BACKEND=sqlite (with DB_PATH, a file or :memory:) runs everything on
+    # an embedded database instead of Postgres.
+    name = name or os.getenv("DB_BACKEND", "postgres")
+    if name == "sqlite":
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase()
+    if name != "postgres":
+        raise ValueError(f"Unknown DB_BACKEND: {name}")
+    return Database()
 
-db = Database()
+db = create_backend()
 
 def send_email(to, subject, body):
     print(f"Email to {to}: Subject: {subject}, Body: {body} (simulated)")
     return True
 
 if __name__ == "__main__":
+    db.connect()
     print("Database tables created successfully!")
\ No newline at end of file
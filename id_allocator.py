@@ -0,0 +1,79 @@
+# id_allocator.py
+import math
+import os
+import string
+import threading
+from collections import deque
+
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "64"))
+
+# One ID format: prefix + `width` characters from `alphabet`. Counters come
+# from a database sequence and are spread over the namespace by a fixed
+# multiplicative permutation (counter * multiplier + offset mod size), so
+# consecutive IDs do not look sequential and every counter maps to a distinct
+# ID until the sequence runs out.
+class IdSpace:
+    def __init__(self, prefix, width, alphabet, sequence, table, column, multiplier, offset):
+        self.prefix = prefix
+        self.width = width
+        self.alphabet = alphabet
+        self.sequence = sequence
+        self.table = table
+        self.column = column
+        self.size = len(alphabet) ** width
+        if math.gcd(multiplier, self.size) != 1:
+            raise ValueError(f"multiplier {multiplier} is not a permutation of {self.size} IDs")
+        self.multiplier = multiplier
+        self.offset = offset
+
+    def format(self, counter):
+        n = (counter * self.multiplier + self.offset) % self.size
+        chars = []
+        for _ in range(self.width):
+            n, digit = divmod(n, len(self.alphabet))
+            chars.append(self.alphabet[digit])
+        return self.prefix + "".join(reversed(chars))
+
+ID_SPACES = {
+    "student": IdSpace("S", 6, string.digits, "student_id_seq", "users", "user_id", 690421, 271828),
+    "admin": IdSpace("A", 6, string.digits, "admin_id_seq", "users", "user_id", 690421, 314159),
+    "test": IdSpace("TE", 6, string.digits + string.ascii_uppercase, "test_id_seq", "tests", "test_id",
+                    1234567891, 977953),
+}
+
+class IdSpaceExhausted(Exception):
+    pass
+
+# Hands out IDs from in-memory blocks. `reserve(space, count)` pulls `count`
+# counters from the space's sequence and returns the formatted IDs that are
+# not already taken (IDs issued randomly before the allocator existed), all in
+# one round trip per block, so each allocate() is O(1) from memory.
+class IdAllocator:
+    def __init__(self, reserve, block_size=None):
+        self.reserve = reserve
+        self.block_size = block_size if block_size is not None else ID_BLOCK_SIZE
+        self._lock = threading.Lock()
+        self._blocks = {kind: deque() for kind in ID_SPACES}
+        self.reserved_blocks = 0
+        self.skipped = 0
+
+    def allocate(self, kind):
+        with self._lock:
+            if not self.remaining(kind):
+                self.refill(kind, self.reserve(ID_SPACES[kind], self.block_size))
+            return self.take(kind)
+
+    def remaining(self, kind):
+        return len(self._blocks[kind])
+
+    def take(self, kind):
+        return self._blocks[kind].popleft()
+
+    def refill(self, kind, ids):
+        # One reservation per empty block: if none of its IDs are free the
+        # space has run out, and retrying would only burn more counters.
+        self.reserved_blocks += 1
+        self.skipped += self.block_size - len(ids)
+        if not ids:
+            raise IdSpaceExhausted(f"No unused {kind} IDs left in {ID_SPACES[kind].sequence}")
+        self._blocks[kind].extend(ids)
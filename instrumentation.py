@@ -0,0 +1,202 @@
+# instrumentation.py
+# Call counts, latency histograms, rows and errors for Database methods, SQL
+# statements and named steps (typing capture, model predict), plus a slow
+# query log. Everything is off unless DB_METRICS=1; disabled, methods are not
+# wrapped at all and statements and steps pay one flag check.
+#   DB_METRICS=1 DB_METRICS_FILE=metrics.prom python app.py
+import functools
+import inspect
+import os
+import re
+import threading
+import time
+
+ENABLED = os.getenv("DB_METRICS", "0") == "1"
+METRICS_FILE = os.getenv("DB_METRICS_FILE", "metrics.prom")
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("DB_SLOW_QUERY_LOG", "slow_queries.log")
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Methods that return context managers; their time is the caller's block, not theirs.
+UNTIMED_METHODS = {"cursor", "connection"}
+
+class Series:
+    __slots__ = ("buckets", "count", "sum", "errors", "rows")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.rows = 0
+
+    def observe(self, seconds, rows=None, error=False):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        if error:
+            self.errors += 1
+        if rows:
+            self.rows += rows
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._slow_log_lock = threading.Lock()
+
+    def observe(self, family, name, seconds, rows=None, error=False):
+        with self._lock:
+            series = self._series.get((family, name))
+            if series is None:
+                series = self._series[(family, name)] = Series()
+            series.observe(seconds, rows, error)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {"count": s.count, "sum": s.sum, "errors": s.errors, "rows": s.rows,
+                          "buckets": list(s.buckets)} for key, s in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def prometheus_text(self):
+        lines = []
+        by_family = {}
+        for (family, name), s in sorted(self.snapshot().items()):
+            by_family.setdefault(family, []).append((name, s))
+        for family, entries in by_family.items():
+            metric = f"smartsecure_{family}"
+            lines.append(f"# HELP {metric}_seconds Latency of {family.replace('_', ' ')} calls.")
+            lines.append(f"# TYPE {metric}_seconds histogram")
+            for name, s in entries:
+                label = _label(name)
+                cumulative = 0
+                for bound, n in zip(BUCKETS, s["buckets"]):
+                    cumulative += n
+                    lines.append(f'{metric}_seconds_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_seconds_bucket{{name="{label}",le="+Inf"}} {s["count"]}')
+                lines.append(f'{metric}_seconds_sum{{name="{label}"}} {s["sum"]:.6f}')
+                lines.append(f'{metric}_seconds_count{{name="{label}"}} {s["count"]}')
+            lines.append(f"# TYPE {metric}_errors_total counter")
+            lines.extend(f'{metric}_errors_total{{name="{_label(name)}"}} {s["errors"]}' for name, s in entries)
+            lines.append(f"# TYPE {metric}_rows_total counter")
+            lines.extend(f'{metric}_rows_total{{name="{_label(name)}"}} {s["rows"]}' for name, s in entries)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        path = path or METRICS_FILE
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+    def log_slow(self, kind, seconds, rows, text):
+        with self._slow_log_lock:
+            with open(SLOW_QUERY_LOG, "a") as f:
+                f.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {kind} {seconds * 1000:.1f}ms rows={rows} {text}\n")
+
+registry = MetricsRegistry()
+
+def _label(name):
+    return name.replace("\\", "\\\\").replace('"', '\\"')
+
+def _one_line(sql):
+    sql = sql.decode() if isinstance(sql, bytes) else str(sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+_statement_names = {}
+
+def statement_name(sql):
+    # Groups statements by their opening words, e.g. "SELECT * FROM users WHERE".
+    # Query text comes from a fixed set of literals, so names are memoized.
+    name = _statement_names.get(sql)
+    if name is None:
+        name = _one_line(sql)[:60]
+        if len(_statement_names) < 4096:
+            _statement_names[sql] = name
+    return name
+
+def _rows(result):
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    return None
+
+def record_statement(sql, seconds, rows, error=False):
+    registry.observe("db_statement", statement_name(sql), seconds, rows, error)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        registry.log_slow("statement", seconds, rows, _one_line(sql))
+
+class _Timer:
+    __slots__ = ("family", "name", "start")
+
+    def __init__(self, family, name):
+        self.family = family
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.family, self.name, time.perf_counter() - self.start, error=exc_type is not None)
+        return False
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_TIMER = _NoTimer()
+
+def timed(name, family="step"):
+    return _Timer(family, name) if ENABLED else _NO_TIMER
+
+def _wrap(family, name, fn):
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception:
+                registry.observe(family, name, time.perf_counter() - start, error=True)
+                raise
+            _observe_call(family, name, time.perf_counter() - start, result)
+            return result
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                registry.observe(family, name, time.perf_counter() - start, error=True)
+                raise
+            _observe_call(family, name, time.perf_counter() - start, result)
+            return result
+    return wrapper
+
+def _observe_call(family, name, seconds, result):
+    rows = _rows(result)
+    registry.observe(family, name, seconds, rows)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        registry.log_slow("method", seconds, rows, name)
+
+def instrument(cls, family="db_method"):
+    # Wraps every public method of cls in place; a no-op unless enabled.
+    if not ENABLED:
+        return cls
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_") or name in UNTIMED_METHODS or not inspect.isfunction(fn):
+            continue
+        setattr(cls, name, _wrap(family, name, fn))
+    return cls
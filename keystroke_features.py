@@ -0,0 +1,70 @@
+# keystroke_features.py
+# Dwell/flight features for typing samples. TimingStats is the one place they
+# are computed: typing_auth feeds it events as a sample is typed, and
+# extract_features feeds it a recorded batch. Plain Python, so the capture
+# path does not load numpy.
+
+# Welford running mean/variance, updated one value at a time and mergeable
+# (Chan et al.) so per-sample statistics can be folded into a session total.
+class RunningStats:
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+# Dwell and flight times (seconds) of one or more samples, reported as the
+# feature dict the profiles store (milliseconds).
+class TimingStats:
+    __slots__ = ("dwell", "flight")
+
+    def __init__(self):
+        self.dwell = RunningStats()
+        self.flight = RunningStats()
+
+    def merge(self, other):
+        self.dwell.merge(other.dwell)
+        self.flight.merge(other.flight)
+
+    def features(self, error_rate):
+        return {
+            "avgDwell": self.dwell.mean * 1000 if self.dwell.count else 0,
+            "avgFlight": self.flight.mean * 1000 if self.flight.count else 0,
+            "errorRate": error_rate
+        }
+
+def extract_features(events, error_rate):
+    # Events are in press order. A missing release leaves the dwell at 0 and
+    # no flight to the next key.
+    stats = TimingStats()
+    for i, event in enumerate(events):
+        release = event.get("release_time")
+        event["dwell_time"] = 0
+        event["flight_time"] = None
+        if release is None:
+            continue
+        event["dwell_time"] = release - event["press_time"]
+        stats.dwell.add(event["dwell_time"])
+        if i + 1 < len(events):
+            event["flight_time"] = events[i + 1]["press_time"] - release
+            stats.flight.add(event["flight_time"])
+    return stats.features(error_rate)
@@ -0,0 +1,105 @@
+# keystroke_writer.py
+import threading
+import time
+
+# Write-behind buffer: keystroke rows from many sessions are queued in memory
+# and group-committed by a background thread in batches.
+class KeystrokeWriter:
+    def __init__(self, db, max_rows=5000, flush_interval=0.5, max_pending=100000):
+        self.db = db
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._rows = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.rows_written = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.dropped = 0
+
+    def submit(self, rows):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Keystroke writer is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="keystroke-writer", daemon=True)
+                self._thread.start()
+            self._rows.extend(rows)
+            if len(self._rows) < self.max_pending:
+                if len(self._rows) >= self.max_rows:
+                    self._cond.notify()
+                return
+            # Over the bound the caller writes the backlog itself, so a slow
+            # database pushes back on producers instead of growing memory.
+            pending = self._take()
+        self._write(pending)
+
+    def _take(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def _write(self, rows):
+        with self._write_lock:
+            start = time.perf_counter()
+            try:
+                self.db.insert_keystroke_rows(rows)
+            except Exception as e:
+                print(f"Keystroke write-behind flush failed: {str(e)}. Retrying with next batch.")
+                with self._cond:
+                    self._rows[:0] = rows
+                    overflow = len(self._rows) - self.max_pending
+                    if overflow > 0:
+                        del self._rows[:overflow]
+                        self.dropped += overflow
+                return False
+            self.rows_written += len(rows)
+            self.batches += 1
+            self.write_seconds += time.perf_counter() - start
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._rows) < self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                rows = self._take()
+            if rows:
+                self._write(rows)
+
+    def flush(self):
+        with self._cond:
+            rows = self._take()
+        if rows:
+            return self._write(rows)
+        return True
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._rows)
+        return {
+            "rows": self.rows_written,
+            "batches": self.batches,
+            "pending": pending,
+            "dropped": self.dropped,
+            "seconds": self.write_seconds,
+            "rows_per_sec": self.rows_written / self.write_seconds if self.write_seconds else 0.0,
+        }
@@ -1,13 +1,20 @@
 # login.py
 from database import db, send_email
-from typing_auth import typing_auth
-import time
+from instrumentation import timed
+from password_hasher import HasherBusy
 import os
-import pickle
-import numpy as np
+import time
 import getpass
 import re
 
+# Prints the statements each login stage cost, to check that the password
+# phase stays at one or two round trips.
+DEBUG_QUERIES = os.getenv("LOGIN_DEBUG_QUERIES", "0") == "1"
+
+def report_queries(stage):
+    if DEBUG_QUERIES:
+        print(f"[debug] {stage}: {db.query_count()} queries")
+
 def validate_email(email):
     pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
     return re.match(pattern, email) is not None
@@ -25,20 +32,18 @@ def validate_password(password):
         return False
     return True
 
-def verify_typing_features(login_features, stored_features):
-    dwell_threshold = 0.3
-    flight_threshold = 0.3
-    error_threshold = 0.2
-
-    dwell_ok = abs(login_features["avgDwell"] - stored_features["avgDwell"]) <= stored_features["avgDwell"] * dwell_threshold
-    flight_ok = abs(login_features["avgFlight"] - stored_features["avgFlight"]) <= stored_features["avgFlight"] * flight_threshold
-    error_ok = abs(login_features["errorRate"] - stored_features["errorRate"]) <= error_threshold and 0 <= login_features["errorRate"] <= 1
-
-    print(f"Typing Check - Dwell: {login_features['avgDwell']:.2f} vs {stored_features['avgDwell']:.2f} ({dwell_ok}), "
-          f"Flight: {login_features['avgFlight']:.2f} vs {stored_features['avgFlight']:.2f} ({flight_ok}), "
-          f"Error: {login_features['errorRate']:.2f} vs {stored_features['errorRate']:.2f} ({error_ok})")
+def report_failed_attempts(attempts):
+    if attempts == 1:
+        print("Warning: 3 failed attempts will lock your account for 30 seconds.")
+    elif attempts == 2:
+        print("One more failed attempt will lock your account for 30 seconds.")
+    elif attempts == 3:
+        print("Account locked for 30 seconds due to 3 failed attempts.")
+    elif attempts > 3:
+        print(f"{6 - attempts} attempts left before permanent lockout.")
 
-    return dwell_ok and flight_ok and error_ok
+def record_failed_attempt(email):
+    report_failed_attempts(db.record_failed_login(email)["failed_attempts"])
 
 def login():
     role = input("Role (admin/student): ").lower()
@@ -51,18 +56,18 @@ def login():
         print("Invalid email format!")
         return None
 
-    user_check = db.get_user_by_email(email)
-    if not user_check:
+    db.reset_query_count()
+    auth_state = db.get_auth_state(email)
+    if not auth_state:
         print("User does not exist!")
         return None
 
-    if user_check["role"] != role:
+    if auth_state["role"] != role:
         print("Role does not match!")
         return None
 
     user_id = input("User ID: ")
-    user = db.get_user_by_id(user_id)
-    if not user or user["email"] != email:
+    if auth_state["user_id"] != user_id:
         print("Invalid user ID or email mismatch!")
         return None
 
@@ -71,18 +76,18 @@ def login():
         print("Password must be at least 8 characters long, with uppercase, lowercase, digit, and special character!")
         return None
 
-    user = db.check_password(email, password)
+    try:
+        user, counters = db.verify_login(auth_state, password)
+    except HasherBusy:
+        print("Server busy, please try again in a moment.")
+        return None
+    report_queries("password check")
+    if not user and counters and "retry_after" in counters:
+        print(f"Too many login attempts! Please try again in {int(counters['retry_after']) + 1} seconds.")
+        return None
     if not user:
         print("Invalid email or password!")
-        attempts = db.get_user_by_email(email)["failed_attempts"]
-        if attempts == 1:
-            print("Warning: 3 failed attempts will lock your account for 30 seconds.")
-        elif attempts == 2:
-            print("One more failed attempt will lock your account for 30 seconds.")
-        elif attempts == 3:
-            print("Account locked for 30 seconds due to 3 failed attempts.")
-        elif attempts > 3:
-            print(f"{6 - attempts} attempts left before permanent lockout.")
+        report_failed_attempts(counters["failed_attempts"] if counters else auth_state["failed_attempts"])
         return None
 
     if user["lockout_count"] >= 2:
@@ -97,66 +102,43 @@ def login():
     typing_data = None
 
     if role == "student":
-        stored_profile = db.get_user_typing_profile(user_id)
+        from typing_auth import typing_auth
+        from typing_model import model_provider
+        from typing_digraphs import check_digraphs
+        from typing_verifier import verify_typing_features
+
+        stored_profile = auth_state["typing_profile"]
         if not stored_profile:
             print("No typing profile found! Login aborted.")
             return None
 
-        typing_data = typing_auth(user_id, "authenticate", samples_needed=3)
+        with timed("typing_capture"):
+            typing_data = typing_auth(user_id, "authenticate", samples_needed=3)
         if typing_data["samples"] < 3 or len(typing_data["keystrokes"]) < 3:
             print("Typing failed! Need 3 valid samples.")
-            if user_check:
-                db.increment_failed_attempts(email)
-                attempts = db.get_user_by_email(email)["failed_attempts"]
-                if attempts == 1:
-                    print("Warning: 3 failed attempts will lock your account for 30 seconds.")
-                elif attempts == 2:
-                    print("One more failed attempt will lock your account for 30 seconds.")
-                elif attempts == 3:
-                    print("Account locked for 30 seconds due to 3 failed attempts.")
-                elif attempts > 3:
-                    print(f"{6 - attempts} attempts left before permanent lockout.")
+            record_failed_attempt(email)
             return None
 
         if not verify_typing_features(typing_data["features"], stored_profile):
             print("Typing verification failed (threshold check)!")
-            if user_check:
-                db.increment_failed_attempts(email)
-                attempts = db.get_user_by_email(email)["failed_attempts"]
-                if attempts == 1:
-                    print("Warning: 3 failed attempts will lock your account for 30 seconds.")
-                elif attempts == 2:
-                    print("One more failed attempt will lock your account for 30 seconds.")
-                elif attempts == 3:
-                    print("Account locked for 30 seconds due to 3 failed attempts.")
-                elif attempts > 3:
-                    print(f"{6 - attempts} attempts left before permanent lockout.")
+            record_failed_attempt(email)
+            return None
+
+        if not check_digraphs(db.get_typing_digraphs(user_id), typing_data["keystrokes"]):
+            print("Typing verification failed (digraph check)!")
+            record_failed_attempt(email)
             return None
 
         model_verified = True
-        if os.path.exists("typing_model.pkl"):
+        if model_provider.available():
             try:
-                with open("typing_model.pkl", "rb") as f:
-                    model = pickle.load(f)
-                features = np.array([[typing_data["features"]["avgDwell"], 
-                                     typing_data["features"]["avgFlight"], 
-                                     typing_data["features"]["errorRate"]]])
-                predicted_user = model.predict(features)[0]
+                with timed("model_predict"):
+                    predicted_user = model_provider.predict_user(typing_data["features"])
                 model_verified = predicted_user == user_id
                 print(f"k-NN Prediction: {predicted_user} (Match: {model_verified})")
                 if not model_verified:
                     print("Typing verification failed (k-NN check)!")
-                    if user_check:
-                        db.increment_failed_attempts(email)
-                        attempts = db.get_user_by_email(email)["failed_attempts"]
-                        if attempts == 1:
-                            print("Warning: 3 failed attempts will lock your account for 30 seconds.")
-                        elif attempts == 2:
-                            print("One more failed attempt will lock your account for 30 seconds.")
-                        elif attempts == 3:
-                            print("Account locked for 30 seconds due to 3 failed attempts.")
-                        elif attempts > 3:
-                            print(f"{6 - attempts} attempts left before permanent lockout.")
+                    record_failed_attempt(email)
                     return None
             except Exception as e:
                 print(f"k-NN model check failed: {str(e)}. Proceeding with threshold check only.")
@@ -168,21 +150,12 @@ def login():
             print("Login successful!")
             if role == "student" and typing_data:
                 db.save_keystrokes(user_id, typing_data["keystrokes"])
-                db.update_typing_profile(user_id, typing_data["features"], new_samples=3)
+                db.update_typing_profile(user_id, typing_data["features"], new_samples=3,
+                                         keystrokes=typing_data["keystrokes"])
             return user
         else:
             print("Invalid or expired token!")
-            if user_check:
-                db.increment_failed_attempts(email)
-                attempts = db.get_user_by_email(email)["failed_attempts"]
-                if attempts == 1:
-                    print("Warning: 3 failed attempts will lock your account for 30 seconds.")
-                elif attempts == 2:
-                    print("One more failed attempt will lock your account for 30 seconds.")
-                elif attempts == 3:
-                    print("Account locked for 30 seconds due to 3 failed attempts.")
-                elif attempts > 3:
-                    print(f"{6 - attempts} attempts left before permanent lockout.")
+            record_failed_attempt(email)
             return None
     else:
         print("Email sending failed!")
@@ -0,0 +1,410 @@
+# migrations.py
+import re
+import psycopg2
+import psycopg2.errors
+
+# Arbitrary application-wide key for pg_advisory_lock so only one process
+# applies migrations at a time.
+MIGRATION_LOCK_ID = 7316502
+
+# Ordered (version, name, concurrent, statements). Concurrent migrations run
+# outside a transaction so they can use CREATE INDEX CONCURRENTLY against a
+# live database; the others run in one transaction each.
+MIGRATIONS = [
+    (1, "baseline schema", False, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id VARCHAR(7) PRIMARY KEY,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            role VARCHAR(10) NOT NULL CHECK (role IN ('admin', 'student')),
+            name VARCHAR(255) NOT NULL,
+            failed_attempts INTEGER DEFAULT 0,
+            lockout_time REAL DEFAULT 0,
+            lockout_count INTEGER DEFAULT 0
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS typing_profiles (
+            user_id VARCHAR(7) PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            avg_dwell REAL NOT NULL,
+            avg_flight REAL NOT NULL,
+            error_rate REAL NOT NULL,
+            sample_count INTEGER DEFAULT 5
+        );
+        """,
+        "ALTER TABLE typing_profiles ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW()",
+        "CREATE INDEX IF NOT EXISTS typing_profiles_updated_at_idx ON typing_profiles (updated_at)",
+        """
+        CREATE TABLE IF NOT EXISTS keystrokes (
+            id SERIAL PRIMARY KEY,
+            user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
+            key CHAR(1),
+            press_time REAL,
+            release_time REAL,
+            dwell_time REAL,
+            flight_time REAL
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tests (
+            test_id VARCHAR(8) PRIMARY KEY,
+            questions JSONB NOT NULL,
+            assigned_ids JSONB NOT NULL,
+            replies JSONB DEFAULT '{}'
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS student_submissions (
+            user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
+            test_id VARCHAR(8),
+            taken_time TIMESTAMP NOT NULL,
+            stored_confidence REAL NOT NULL,
+            test_confidence REAL NOT NULL,
+            answers JSONB NOT NULL,
+            PRIMARY KEY (user_id, test_id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS test_assignments (
+            test_id VARCHAR(8) REFERENCES tests(test_id) ON DELETE CASCADE,
+            user_id VARCHAR(7) NOT NULL,
+            PRIMARY KEY (test_id, user_id)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS test_assignments_user_id_idx ON test_assignments (user_id, test_id)",
+        """
+        INSERT INTO test_assignments (test_id, user_id)
+        SELECT t.test_id, a.user_id
+        FROM tests t, jsonb_array_elements_text(t.assigned_ids) AS a(user_id)
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (2, "indexes for users, keystrokes and submissions", True, [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_role_idx ON users (role)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS keystrokes_user_id_idx ON keystrokes (user_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS student_submissions_test_id_idx ON student_submissions (test_id)",
+    ]),
+    (3, "per-user digraph timing profiles", False, [
+        """
+        CREATE TABLE IF NOT EXISTS typing_digraphs (
+            user_id VARCHAR(7) PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            profile BYTEA NOT NULL,
+            timing_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+    ]),
+    (4, "time-partitioned keystrokes with rollups", True, [
+        # The existing table becomes the first partition, holding everything
+        # captured before today; new rows route to daily partitions created by
+        # retention.py, or to the default partition until those exist. No step
+        # scans or indexes the table under a lock that blocks writes, and each
+        # one is skipped if it already ran, so a failed run can be retried.
+        #
+        # captured_at gets a constant default (no table rewrite) and the bound
+        # is added as a NOT VALID check; both hold the table lock only briefly.
+        # The cutoff is kept as the constraint's comment for the swap below.
+        """
+        DO $$
+        DECLARE cutoff TIMESTAMP := date_trunc('day', NOW());
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'keystrokes'::regclass) = 'r'
+               AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'keystrokes_legacy_cutoff') THEN
+                EXECUTE format('ALTER TABLE keystrokes ADD COLUMN captured_at TIMESTAMP NOT NULL DEFAULT %L',
+                               cutoff - INTERVAL '1 second');
+                EXECUTE format('ALTER TABLE keystrokes ADD CONSTRAINT keystrokes_legacy_cutoff CHECK (captured_at < %L) NOT VALID',
+                               cutoff);
+                EXECUTE format('COMMENT ON CONSTRAINT keystrokes_legacy_cutoff ON keystrokes IS %L', cutoff);
+            END IF;
+        END $$;
+        """,
+        # Validation scans under SHARE UPDATE EXCLUSIVE, which lets writes through.
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'keystrokes_legacy_cutoff' AND NOT convalidated) THEN
+                ALTER TABLE keystrokes VALIDATE CONSTRAINT keystrokes_legacy_cutoff;
+            END IF;
+        END $$;
+        """,
+        # The swap is catalog-only: the validated check already proves the
+        # partition bound, so ATTACH skips its scan, and the parent's indexes
+        # are created ON ONLY so nothing is built on the legacy rows here. The
+        # default partition is empty, so its indexes are created with it.
+        """
+        DO $$
+        DECLARE cutoff TIMESTAMP;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'keystrokes'::regclass) = 'r' THEN
+                SELECT obj_description(oid, 'pg_constraint')::timestamp INTO cutoff
+                FROM pg_constraint WHERE conname = 'keystrokes_legacy_cutoff';
+                ALTER TABLE keystrokes RENAME TO keystrokes_legacy;
+                -- The partition is keyed by the parent's (id, captured_at) index instead.
+                ALTER TABLE keystrokes_legacy DROP CONSTRAINT keystrokes_pkey;
+                ALTER INDEX IF EXISTS keystrokes_user_id_idx RENAME TO keystrokes_legacy_user_id_idx;
+                CREATE TABLE keystrokes (
+                    id INTEGER NOT NULL DEFAULT nextval('keystrokes_id_seq'),
+                    user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
+                    key CHAR(1),
+                    press_time REAL,
+                    release_time REAL,
+                    dwell_time REAL,
+                    flight_time REAL,
+                    captured_at TIMESTAMP NOT NULL DEFAULT NOW()
+                ) PARTITION BY RANGE (captured_at);
+                -- Keep the id sequence alive when the legacy partition is dropped.
+                ALTER SEQUENCE keystrokes_id_seq OWNED BY keystrokes.id;
+                EXECUTE format('ALTER TABLE keystrokes ATTACH PARTITION keystrokes_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                               cutoff);
+                CREATE UNIQUE INDEX keystrokes_id_captured_idx ON ONLY keystrokes (id, captured_at);
+                CREATE INDEX keystrokes_user_captured_idx ON ONLY keystrokes (user_id, captured_at);
+                CREATE TABLE keystrokes_default PARTITION OF keystrokes DEFAULT;
+            END IF;
+        END $$;
+        """,
+        # Attaching the last partition index marks the parent index valid.
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS keystrokes_legacy_id_captured_idx ON keystrokes_legacy (id, captured_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS keystrokes_legacy_user_captured_idx ON keystrokes_legacy (user_id, captured_at)",
+        "ALTER INDEX keystrokes_id_captured_idx ATTACH PARTITION keystrokes_legacy_id_captured_idx",
+        "ALTER INDEX keystrokes_user_captured_idx ATTACH PARTITION keystrokes_legacy_user_captured_idx",
+        # (user_id, captured_at) now serves user lookups on the legacy rows too.
+        "DROP INDEX CONCURRENTLY IF EXISTS keystrokes_legacy_user_id_idx",
+        """
+        CREATE TABLE IF NOT EXISTS keystroke_rollups (
+            user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
+            key VARCHAR(1) NOT NULL,
+            keystrokes BIGINT NOT NULL DEFAULT 0,
+            dwell_count BIGINT NOT NULL DEFAULT 0,
+            dwell_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            dwell_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            flight_count BIGINT NOT NULL DEFAULT 0,
+            flight_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            flight_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            first_captured_at TIMESTAMP,
+            last_captured_at TIMESTAMP,
+            PRIMARY KEY (user_id, key)
+        );
+        """,
+    ]),
+    (5, "running variance for typing profiles", False, [
+        # Sum of squared deviations (Welford M2) of the per-session means,
+        # weighted by sample_count, kept next to each running mean.
+        "ALTER TABLE typing_profiles ADD COLUMN IF NOT EXISTS dwell_m2 DOUBLE PRECISION NOT NULL DEFAULT 0",
+        "ALTER TABLE typing_profiles ADD COLUMN IF NOT EXISTS flight_m2 DOUBLE PRECISION NOT NULL DEFAULT 0",
+        "ALTER TABLE typing_profiles ADD COLUMN IF NOT EXISTS error_m2 DOUBLE PRECISION NOT NULL DEFAULT 0",
+        "UPDATE typing_profiles SET sample_count = 5 WHERE sample_count IS NULL",
+        "ALTER TABLE typing_profiles ALTER COLUMN sample_count SET NOT NULL",
+    ]),
+    (6, "materialized test scores", False, [
+        """
+        CREATE TABLE IF NOT EXISTS test_scores (
+            user_id VARCHAR(7) REFERENCES users(user_id) ON DELETE CASCADE,
+            test_id VARCHAR(8) REFERENCES tests(test_id) ON DELETE CASCADE,
+            correct INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            score REAL NOT NULL,
+            graded_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (user_id, test_id)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS test_scores_test_id_score_idx ON test_scores (test_id, score)",
+        # Grade every existing submission in one pass.
+        """
+        INSERT INTO test_scores (user_id, test_id, correct, total, score)
+        SELECT s.user_id, s.test_id,
+               COUNT(q.key) FILTER (WHERE s.answers -> q.key = q.value -> 'correct'),
+               COUNT(q.key),
+               COALESCE(COUNT(q.key) FILTER (WHERE s.answers -> q.key = q.value -> 'correct')::REAL
+                        / NULLIF(COUNT(q.key), 0), 0)
+        FROM student_submissions s
+        JOIN tests t ON t.test_id = s.test_id
+        LEFT JOIN LATERAL jsonb_each(t.questions) AS q(key, value) ON TRUE
+        GROUP BY s.user_id, s.test_id
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (7, "test content versions", False, [
+        "ALTER TABLE tests ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+        # Any writer that changes the questions bumps the version, which is
+        # what cached copies of a test are keyed on.
+        """
+        CREATE OR REPLACE FUNCTION tests_bump_version() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.questions IS DISTINCT FROM OLD.questions THEN
+                NEW.version := OLD.version + 1;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS tests_bump_version ON tests",
+        """
+        CREATE TRIGGER tests_bump_version BEFORE UPDATE ON tests
+        FOR EACH ROW EXECUTE FUNCTION tests_bump_version();
+        """,
+    ]),
+    (8, "ID allocation sequences", False, [
+        # Counters for id_allocator; MAXVALUE is the size of each ID namespace
+        # so running out raises instead of wrapping onto issued IDs.
+        "CREATE SEQUENCE IF NOT EXISTS student_id_seq MINVALUE 0 MAXVALUE 999999 START 0 NO CYCLE",
+        "CREATE SEQUENCE IF NOT EXISTS admin_id_seq MINVALUE 0 MAXVALUE 999999 START 0 NO CYCLE",
+        "CREATE SEQUENCE IF NOT EXISTS test_id_seq MINVALUE 0 MAXVALUE 2176782335 START 0 NO CYCLE",
+    ]),
+    (9, "analytics summary tables", False, [
+        # Counts and sums, so submissions can add to a row instead of
+        # recomputing it; analytics.py derives the means when reading.
+        """
+        CREATE TABLE IF NOT EXISTS test_stats (
+            test_id VARCHAR(8) PRIMARY KEY REFERENCES tests(test_id) ON DELETE CASCADE,
+            assigned INTEGER NOT NULL DEFAULT 0,
+            submissions INTEGER NOT NULL DEFAULT 0,
+            score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            score_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            stored_confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            test_confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            confidence_gap_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            last_submission_at TIMESTAMP,
+            refreshed_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS student_stats (
+            user_id VARCHAR(7) PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            assigned INTEGER NOT NULL DEFAULT 0,
+            submissions INTEGER NOT NULL DEFAULT 0,
+            score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            stored_confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            test_confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            confidence_gap_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            last_submission_at TIMESTAMP,
+            refreshed_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS student_stats_confidence_gap_idx
+        ON student_stats ((confidence_gap_sum / submissions)) WHERE submissions > 0
+        """,
+        # Summary rows for everything that exists today; afterwards
+        # submissions and assignments add to them.
+        """
+        INSERT INTO test_stats (test_id, assigned, submissions, score_sum, score_sq_sum, stored_confidence_sum,
+                                test_confidence_sum, confidence_gap_sum, last_submission_at)
+        SELECT t.test_id,
+               (SELECT COUNT(*) FROM test_assignments a WHERE a.test_id = t.test_id),
+               COUNT(s.user_id),
+               COALESCE(SUM(g.score::DOUBLE PRECISION), 0),
+               COALESCE(SUM(g.score::DOUBLE PRECISION ^ 2), 0),
+               COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION), 0),
+               COALESCE(SUM(s.test_confidence::DOUBLE PRECISION), 0),
+               COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION - s.test_confidence::DOUBLE PRECISION), 0),
+               MAX(s.taken_time)
+        FROM tests t
+        LEFT JOIN student_submissions s ON s.test_id = t.test_id
+        LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+        GROUP BY t.test_id
+        ON CONFLICT (test_id) DO NOTHING
+        """,
+        """
+        INSERT INTO student_stats (user_id, assigned, submissions, score_sum, stored_confidence_sum,
+                                   test_confidence_sum, confidence_gap_sum, last_submission_at)
+        SELECT u.user_id,
+               (SELECT COUNT(*) FROM test_assignments a WHERE a.user_id = u.user_id),
+               COUNT(s.test_id),
+               COALESCE(SUM(g.score::DOUBLE PRECISION), 0),
+               COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION), 0),
+               COALESCE(SUM(s.test_confidence::DOUBLE PRECISION), 0),
+               COALESCE(SUM(s.stored_confidence::DOUBLE PRECISION - s.test_confidence::DOUBLE PRECISION), 0),
+               MAX(s.taken_time)
+        FROM users u
+        LEFT JOIN student_submissions s ON s.user_id = u.user_id
+        LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+        WHERE u.role = 'student'
+        GROUP BY u.user_id
+        ON CONFLICT (user_id) DO NOTHING
+        """,
+    ]),
+    (10, "keystroke capture attempts", False, [
+        # Rows saved before this have no attempt and are left out of the
+        # verifier's re-score. Nullable without a default, so this is
+        # catalog-only on every partition.
+        "ALTER TABLE keystrokes ADD COLUMN IF NOT EXISTS attempt_id UUID",
+        "ALTER TABLE keystrokes ADD COLUMN IF NOT EXISTS capture_kind VARCHAR(8)",
+    ]),
+    (11, "second-resolution lockout times", False, [
+        # REAL epoch seconds only resolve to about two minutes today, so a
+        # 30-second lockout could end early or late. Rewrites users under an
+        # exclusive lock; values already stored keep their rounding.
+        "ALTER TABLE users ALTER COLUMN lockout_time TYPE DOUBLE PRECISION",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(cur):
+    try:
+        cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations")
+        return cur.fetchone()["version"]
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        return 0
+
+def _drop_invalid_indexes(cur, statements):
+    # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind that
+    # IF NOT EXISTS would silently keep; drop it so the build is retried.
+    names = [m.group(1) for s in statements for m in [re.search(r"INDEX CONCURRENTLY IF NOT EXISTS (\w+)", s)] if m]
+    if not names:
+        return
+    cur.execute("""
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid AND c.relname = ANY(%s)
+    """, (names,))
+    for row in cur.fetchall():
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{row["relname"]}"')
+
+def _apply(cur, version, name, concurrent, statements):
+    if concurrent:
+        _drop_invalid_indexes(cur, statements)
+        for statement in statements:
+            cur.execute(statement)
+        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        return
+    cur.execute("BEGIN")
+    try:
+        for statement in statements:
+            cur.execute(statement)
+        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+
+def migrate(db):
+    # Healthy databases are confirmed with a single query.
+    with db.cursor() as cur:
+        if schema_version(cur) >= LATEST_VERSION:
+            return LATEST_VERSION
+
+    with db.connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+                try:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version INTEGER PRIMARY KEY,
+                            name VARCHAR(255) NOT NULL,
+                            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+                        );
+                    """)
+                    current = schema_version(cur)
+                    for version, name, concurrent, statements in MIGRATIONS:
+                        if version > current:
+                            print(f"Applying schema migration {version}: {name}")
+                            _apply(cur, version, name, concurrent, statements)
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        finally:
+            conn.autocommit = False
+    return LATEST_VERSION
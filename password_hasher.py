@@ -0,0 +1,69 @@
+# password_hasher.py
+import os
+import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+BCRYPT_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+def _check_password(password, hashed):
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+class HasherBusy(Exception):
+    pass
+
+# Runs bcrypt in a pool of worker processes so a login burst does not pin the
+# caller's core. At most workers + max_queue jobs are in flight; further
+# callers wait up to queue_timeout and then get HasherBusy. With workers=0
+# (the default for the interactive CLI) hashing runs inline.
+class PasswordHasher:
+    def __init__(self, workers=None, rounds=None, max_queue=None, queue_timeout=None):
+        self.workers = workers if workers is not None else int(os.getenv("HASH_WORKERS", "0"))
+        self.rounds = rounds if rounds is not None else int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("HASH_QUEUE", str(self.workers * 4)))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv("HASH_QUEUE_TIMEOUT", "10"))
+        self._slots = threading.BoundedSemaphore(max(1, self.workers + self.max_queue))
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                # spawn rather than fork: the parent holds threads and DB sockets.
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusy(f"Password hashing queue is full ({self.workers} workers, {self.max_queue} queued)")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run(_check_password, password, hashed)
+
+    def needs_rehash(self, hashed):
+        match = BCRYPT_COST.match(hashed)
+        return match is None or int(match.group(1)) != self.rounds
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
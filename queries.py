@@ -0,0 +1,261 @@
+# queries.py
+# Postgres statements shared by database.Database (psycopg2) and
+# async_database.AsyncDatabase (asyncpg), so the two stay in step; the ones
+# without Postgres-only syntax are also run by sqlite_database. They use
+# psycopg2's %(name)s placeholders; numbered() rewrites them for asyncpg and
+# named() for sqlite3.
+import functools
+import re
+from analytics import ASSIGNMENT_STATS_SQL, SUBMISSION_STATS_SQL
+
+PLACEHOLDER = re.compile(r"%\((\w+)\)s")
+
+@functools.lru_cache(maxsize=None)
+def numbered(sql):
+    # Returns the statement with $1, $2, ... and the parameter names in order;
+    # a name used twice keeps one number.
+    names = []
+    def replace(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+    return PLACEHOLDER.sub(replace, sql), tuple(names)
+
+@functools.lru_cache(maxsize=None)
+def named(sql):
+    return PLACEHOLDER.sub(r":\1", sql)
+
+RESERVE_IDS_SQL = "SELECT nextval(%(sequence)s::regclass) AS n FROM generate_series(1, %(count)s)"
+
+# {table} and {column} come from id_allocator.ID_SPACES, never from input.
+TAKEN_IDS_SQL = "SELECT {column} AS id FROM {table} WHERE {column} = ANY(%(ids)s)"
+
+ADD_USER_SQL = """
+    INSERT INTO users (user_id, email, password, role, name)
+    VALUES (%(user_id)s, %(email)s, %(password)s, %(role)s, %(name)s)
+    RETURNING user_id;
+"""
+
+USER_BY_EMAIL_SQL = "SELECT * FROM users WHERE email = %(email)s"
+
+USER_BY_ID_SQL = "SELECT * FROM users WHERE user_id = %(user_id)s"
+
+# User row, lockout counters and typing profile in a single round trip.
+AUTH_STATE_SQL = """
+    SELECT u.*, p.avg_dwell, p.avg_flight, p.error_rate, p.sample_count, p.dwell_m2, p.flight_m2, p.error_m2
+    FROM users u
+    LEFT JOIN typing_profiles p ON p.user_id = u.user_id
+    WHERE u.email = %(email)s
+"""
+
+# Compare-and-set so a concurrent password change is never overwritten.
+REHASH_PASSWORD_SQL = "UPDATE users SET password = %(password)s WHERE user_id = %(user_id)s AND password = %(old_hash)s"
+
+STORED_FAILED_ATTEMPTS_SQL = "SELECT failed_attempts FROM users WHERE email = %(email)s"
+
+APPLY_LOCKOUT_SQL = """
+    UPDATE users
+    SET failed_attempts = GREATEST(failed_attempts, %(attempts)s),
+        lockout_time = CASE WHEN %(attempts)s = 3 THEN %(until)s ELSE lockout_time END,
+        lockout_count = CASE WHEN %(attempts)s = 6 THEN lockout_count + 1 ELSE lockout_count END
+    WHERE email = %(email)s
+    RETURNING failed_attempts, lockout_time, lockout_count
+"""
+
+# After a successful login; the guard skips the write when nothing failed.
+RESET_FAILED_ATTEMPTS_SQL = """
+    UPDATE users SET failed_attempts = 0, lockout_time = 0
+    WHERE email = %(email)s AND (failed_attempts <> 0 OR lockout_time <> 0)
+"""
+
+# Once per lockout, when it has expired; failed_attempts is kept so the next
+# transition still counts from it.
+CLEAR_LOCKOUT_SQL = "UPDATE users SET lockout_time = 0 WHERE email = %(email)s AND lockout_time = %(lockout_time)s"
+
+INCREMENT_FAILED_ATTEMPTS_SQL = """
+    UPDATE users
+    SET failed_attempts = failed_attempts + 1,
+        lockout_time = CASE
+            WHEN failed_attempts + 1 = 3 THEN %(until)s
+            ELSE lockout_time
+        END,
+        lockout_count = CASE
+            WHEN failed_attempts + 1 = 6 THEN lockout_count + 1
+            ELSE lockout_count
+        END
+    WHERE email = %(email)s
+    RETURNING failed_attempts, lockout_time, lockout_count
+"""
+
+TYPING_PROFILE_SQL = "SELECT * FROM typing_profiles WHERE user_id = %(user_id)s"
+
+SAVE_TYPING_DYNAMICS_SQL = """
+    INSERT INTO typing_profiles (user_id, avg_dwell, avg_flight, error_rate, sample_count)
+    VALUES (%(user_id)s, %(dwell)s, %(flight)s, %(error)s, %(samples)s)
+    ON CONFLICT (user_id) DO UPDATE
+    SET avg_dwell = EXCLUDED.avg_dwell,
+        avg_flight = EXCLUDED.avg_flight,
+        error_rate = EXCLUDED.error_rate,
+        sample_count = EXCLUDED.sample_count,
+        dwell_m2 = 0,
+        flight_m2 = 0,
+        error_m2 = 0,
+        updated_at = NOW()
+"""
+
+# One upsert merges the new batch into the running mean and M2 (Chan et al.)
+# for each feature. Every SET expression reads the old row, and the row lock
+# taken by ON CONFLICT serialises concurrent sessions.
+MERGE_TYPING_PROFILE_SQL = """
+    INSERT INTO typing_profiles AS p (user_id, avg_dwell, avg_flight, error_rate, sample_count)
+    VALUES (%(user_id)s, %(dwell)s, %(flight)s, %(error)s, %(samples)s)
+    ON CONFLICT (user_id) DO UPDATE
+    SET sample_count = p.sample_count + EXCLUDED.sample_count,
+        avg_dwell = p.avg_dwell + (EXCLUDED.avg_dwell - p.avg_dwell) * EXCLUDED.sample_count
+                    / (p.sample_count + EXCLUDED.sample_count),
+        avg_flight = p.avg_flight + (EXCLUDED.avg_flight - p.avg_flight) * EXCLUDED.sample_count
+                     / (p.sample_count + EXCLUDED.sample_count),
+        error_rate = p.error_rate + (EXCLUDED.error_rate - p.error_rate) * EXCLUDED.sample_count
+                     / (p.sample_count + EXCLUDED.sample_count),
+        dwell_m2 = p.dwell_m2 + (EXCLUDED.avg_dwell - p.avg_dwell) ^ 2 * p.sample_count
+                   * EXCLUDED.sample_count / (p.sample_count + EXCLUDED.sample_count),
+        flight_m2 = p.flight_m2 + (EXCLUDED.avg_flight - p.avg_flight) ^ 2 * p.sample_count
+                    * EXCLUDED.sample_count / (p.sample_count + EXCLUDED.sample_count),
+        error_m2 = p.error_m2 + (EXCLUDED.error_rate - p.error_rate) ^ 2 * p.sample_count
+                   * EXCLUDED.sample_count / (p.sample_count + EXCLUDED.sample_count),
+        updated_at = NOW()
+    RETURNING p.*, (xmax = 0) AS inserted
+"""
+
+TYPING_DIGRAPHS_SQL = "SELECT profile FROM typing_digraphs WHERE user_id = %(user_id)s"
+
+# Make sure the row exists, then lock it so concurrent sessions merge into
+# the blob one after another instead of overwriting each other.
+INIT_TYPING_DIGRAPHS_SQL = """
+    INSERT INTO typing_digraphs (user_id, profile) VALUES (%(user_id)s, %(profile)s)
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+LOCK_TYPING_DIGRAPHS_SQL = "SELECT profile FROM typing_digraphs WHERE user_id = %(user_id)s FOR UPDATE"
+
+UPDATE_TYPING_DIGRAPHS_SQL = """
+    UPDATE typing_digraphs
+    SET profile = %(profile)s, timing_count = timing_count + %(added)s, updated_at = NOW()
+    WHERE user_id = %(user_id)s
+"""
+
+CREATE_TEST_SQL = """
+    INSERT INTO tests (test_id, questions, assigned_ids)
+    VALUES (%(test_id)s, %(questions)s, %(assigned_ids)s)
+    RETURNING test_id;
+"""
+
+TEST_SQL = "SELECT * FROM tests WHERE test_id = %(test_id)s"
+
+# Version and assignment without loading the questions payload.
+TEST_HEADER_SQL = """
+    SELECT t.test_id, t.version,
+           EXISTS (SELECT 1 FROM test_assignments a WHERE a.test_id = t.test_id AND a.user_id = %(user_id)s) AS assigned
+    FROM tests t
+    WHERE t.test_id = %(test_id)s
+"""
+
+TEST_ASSIGNED_SQL = "SELECT 1 FROM test_assignments WHERE test_id = %(test_id)s AND user_id = %(user_id)s"
+
+ASSIGNED_TEST_IDS_SQL = "SELECT test_id FROM test_assignments WHERE user_id = %(user_id)s ORDER BY test_id"
+
+TEST_SUBMITTERS_SQL = "SELECT user_id FROM student_submissions WHERE test_id = %(test_id)s"
+
+# Grades submissions set-wise: each submission is joined to its test's
+# questions via jsonb_each and answers are compared with the stored "correct"
+# index as jsonb. {source} is student_submissions or a CTE of fresh rows.
+GRADE_SQL = """
+    INSERT INTO test_scores AS g (user_id, test_id, correct, total, score, graded_at)
+    SELECT s.user_id, s.test_id,
+           COUNT(q.key) FILTER (WHERE s.answers -> q.key = q.value -> 'correct'),
+           COUNT(q.key),
+           COALESCE(COUNT(q.key) FILTER (WHERE s.answers -> q.key = q.value -> 'correct')::REAL
+                    / NULLIF(COUNT(q.key), 0), 0),
+           NOW()
+    FROM {source} s
+    JOIN tests t ON t.test_id = s.test_id
+    LEFT JOIN LATERAL jsonb_each(t.questions) AS q(key, value) ON TRUE
+    {condition}
+    GROUP BY s.user_id, s.test_id
+    ON CONFLICT (user_id, test_id) DO UPDATE
+    SET correct = EXCLUDED.correct,
+        total = EXCLUDED.total,
+        score = EXCLUDED.score,
+        graded_at = EXCLUDED.graded_at
+"""
+
+GRADE_TEST_CONDITION = "WHERE s.test_id = %(test_id)s"
+
+# The submission is graded in the same statement, and the difference from any
+# previous submission by the same student is added to the summary rows.
+SUBMISSION_SQL = """
+    WITH old AS (
+        SELECT 1 AS present, s.stored_confidence, s.test_confidence, g.score
+        FROM student_submissions s
+        LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+        WHERE s.user_id = %(user_id)s AND s.test_id = %(test_id)s
+    ), submission AS (
+        INSERT INTO student_submissions (user_id, test_id, taken_time, stored_confidence, test_confidence, answers)
+        VALUES (%(user_id)s, %(test_id)s, NOW(), %(stored_confidence)s, %(test_confidence)s, %(answers)s)
+        ON CONFLICT (user_id, test_id) DO UPDATE
+        SET taken_time = NOW(),
+            stored_confidence = EXCLUDED.stored_confidence,
+            test_confidence = EXCLUDED.test_confidence,
+            answers = EXCLUDED.answers
+        RETURNING user_id, test_id, answers, taken_time, stored_confidence, test_confidence
+    ), graded AS (""" + GRADE_SQL.format(source="submission", condition="") + """
+        RETURNING g.user_id, g.test_id, g.score
+    ), delta AS (
+        SELECT s.user_id, s.test_id,
+               1 - COALESCE(o.present, 0) AS submissions,
+               COALESCE(g.score::DOUBLE PRECISION, 0) - COALESCE(o.score::DOUBLE PRECISION, 0) AS score,
+               COALESCE(g.score::DOUBLE PRECISION ^ 2, 0) - COALESCE(o.score::DOUBLE PRECISION ^ 2, 0) AS score_sq,
+               COALESCE(s.stored_confidence::DOUBLE PRECISION, 0)
+                   - COALESCE(o.stored_confidence::DOUBLE PRECISION, 0) AS stored_confidence,
+               COALESCE(s.test_confidence::DOUBLE PRECISION, 0)
+                   - COALESCE(o.test_confidence::DOUBLE PRECISION, 0) AS test_confidence,
+               COALESCE(s.stored_confidence::DOUBLE PRECISION - s.test_confidence::DOUBLE PRECISION, 0)
+                   - COALESCE(o.stored_confidence::DOUBLE PRECISION - o.test_confidence::DOUBLE PRECISION, 0)
+                   AS confidence_gap,
+               s.taken_time
+        FROM submission s
+        LEFT JOIN graded g ON g.user_id = s.user_id AND g.test_id = s.test_id
+        LEFT JOIN old o ON TRUE
+    ), """ + SUBMISSION_STATS_SQL + """
+    SELECT user_id FROM delta;
+"""
+
+# Assigns tests to students from parallel arrays and counts only the pairs
+# that were new into the summary rows.
+ASSIGN_SQL = """
+    WITH added AS (
+        INSERT INTO test_assignments (test_id, user_id)
+        SELECT * FROM unnest(%(test_ids)s::VARCHAR[], %(user_ids)s::VARCHAR[])
+        ON CONFLICT DO NOTHING
+        RETURNING test_id, user_id
+    ), """ + ASSIGNMENT_STATS_SQL + """
+    SELECT COUNT(*) AS added FROM added;
+"""
+
+SCORE_DISTRIBUTION_SQL = """
+    SELECT LEAST(width_bucket(score, 0, 1, %(bins)s), %(bins)s) AS bucket, COUNT(*) AS n,
+           SUM(score) AS total, MIN(score) AS low, MAX(score) AS high
+    FROM test_scores
+    WHERE test_id = %(test_id)s
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+TYPING_PROFILES_SQL = "SELECT user_id, avg_dwell, avg_flight, error_rate, updated_at FROM typing_profiles"
+
+TYPING_PROFILES_SINCE_SQL = """
+    SELECT user_id, avg_dwell, avg_flight, error_rate, updated_at
+    FROM typing_profiles
+    WHERE updated_at > %(since)s
+    ORDER BY updated_at
+"""
@@ -0,0 +1,112 @@
+# rate_limit.py
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+# Token-bucket login limiter plus failed-attempt counters, kept in a local
+# SQLite file so every worker process on the host shares the same buckets
+# (RATE_LIMIT_DB=:memory: keeps them per process). Over-limit attempts are
+# turned away before any bcrypt work, and failures are counted here so only
+# lockout transitions need to be written to the users table. The users row
+# stays the source of truth: a local count only holds while users still has
+# the failed_attempts it was counted from.
+class LoginRateLimiter:
+    def __init__(self, path=None, burst=None, rate=None):
+        self.path = path or os.getenv("RATE_LIMIT_DB", "rate_limit.sqlite3")
+        self.burst = burst if burst is not None else float(os.getenv("RATE_LIMIT_BURST", "5"))
+        # Tokens regained per second; the default allows one attempt every 10s after the burst.
+        self.rate = rate if rate is not None else float(os.getenv("RATE_LIMIT_RATE", "0.1"))
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._memory = None
+        self._memory_lock = threading.Lock()
+
+    def _connect(self):
+        if self.path == ":memory:":
+            # One connection shared by all threads, guarded by _memory_lock.
+            if self._memory is None:
+                self._memory = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+                self._init_schema(self._memory)
+            return self._memory
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Each connection serves one thread; check_same_thread is off only so
+            # close() can release the ones opened by executor threads.
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._init_schema(conn)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _init_schema(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        # failures held counts without their users base; they cannot be trusted.
+        conn.execute("DROP TABLE IF EXISTS failures")
+        conn.execute("CREATE TABLE IF NOT EXISTS failed_logins "
+                     "(email TEXT PRIMARY KEY, attempts INTEGER NOT NULL, base INTEGER NOT NULL)")
+
+    def _transaction(self, fn):
+        lock = self._memory_lock if self.path == ":memory:" else contextlib.nullcontext()
+        with lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def acquire(self, *keys, now=None):
+        # Takes one token from every bucket, or none if any is empty. Returns
+        # 0 when allowed, otherwise the seconds until an attempt would be.
+        now = now if now is not None else time.time()
+
+        def take(conn):
+            levels = {}
+            for key in keys:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                levels[key] = tokens
+            short = max(1.0 - tokens for tokens in levels.values())
+            if short > 0:
+                return short / self.rate if self.rate > 0 else float("inf")
+            conn.executemany("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                             [(key, tokens - 1.0, now) for key, tokens in levels.items()])
+            return 0.0
+
+        return self._transaction(take)
+
+    def record_failure(self, email, stored_attempts):
+        # stored_attempts is users.failed_attempts. The local count goes on
+        # from itself only while that is unchanged; once any host persists a
+        # lockout or resets the row after a successful login, it restarts there.
+        def bump(conn):
+            row = conn.execute("SELECT attempts, base FROM failed_logins WHERE email = ?", (email,)).fetchone()
+            attempts = (row[0] if row and row[1] == stored_attempts else stored_attempts) + 1
+            conn.execute("INSERT OR REPLACE INTO failed_logins (email, attempts, base) VALUES (?, ?, ?)",
+                         (email, attempts, stored_attempts))
+            return attempts
+
+        return self._transaction(bump)
+
+    def reset(self, email):
+        self._transaction(lambda conn: conn.execute("DELETE FROM failed_logins WHERE email = ?", (email,)))
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        if self._memory is not None:
+            self._memory.close()
+            self._memory = None
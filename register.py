@@ -1,6 +1,7 @@
 # register.py
 from database import db, send_email
 from typing_auth import typing_auth
+from password_hasher import HasherBusy
 import re
 import getpass
 
@@ -61,9 +62,14 @@ def register():
     if send_email(email, "Registration Token", f"Your TOTP token (valid for 5 minutes): {token}"):
         user_token = input("Enter token: ")
         if db.verify_totp_token(user_token, secret):
-            if db.add_user(user_id, email, password, role, name):
-                db.save_typing_dynamics(user_id, typing_data["features"])
-                db.save_keystrokes(user_id, typing_data["keystrokes"])
+            try:
+                added = db.add_user(user_id, email, password, role, name)
+            except HasherBusy:
+                print("Server busy, please try again in a moment.")
+                return
+            if added:
+                db.save_typing_dynamics(user_id, typing_data["features"], keystrokes=typing_data["keystrokes"])
+                db.save_keystrokes(user_id, typing_data["keystrokes"], kind="register")
                 print(f"Registration successful! Your ID: {user_id}")
             else:
                 print("Registration failed: Email already exists!")
@@ -0,0 +1,131 @@
+# retention.py
+# Keystroke partition maintenance. Creates daily partitions ahead of time,
+# rolls raw events in expired partitions up into keystroke_rollups and drops
+# them. Run it from cron, or keep it running:
+#   python retention.py                      # one pass
+#   python retention.py --every 3600         # every hour
+import argparse
+import datetime
+import os
+import re
+import time
+from database import db
+
+RETENTION_DAYS = int(os.getenv("KEYSTROKE_RETENTION_DAYS", "90"))
+PARTITION_AHEAD_DAYS = int(os.getenv("KEYSTROKE_PARTITION_AHEAD_DAYS", "7"))
+BOUND = re.compile(r"FROM \((?:MINVALUE|'([^']+)')\) TO \((?:MAXVALUE|'([^']+)')\)")
+
+ROLLUP_SQL = """
+    INSERT INTO keystroke_rollups AS r (user_id, key, keystrokes, dwell_count, dwell_sum, dwell_sq_sum,
+                                        flight_count, flight_sum, flight_sq_sum, first_captured_at, last_captured_at)
+    SELECT user_id, COALESCE(key, ''), COUNT(*),
+           COUNT(dwell_time), COALESCE(SUM(dwell_time), 0), COALESCE(SUM(dwell_time * dwell_time), 0),
+           COUNT(flight_time), COALESCE(SUM(flight_time), 0), COALESCE(SUM(flight_time * flight_time), 0),
+           MIN(captured_at), MAX(captured_at)
+    FROM {source}
+    WHERE user_id IS NOT NULL {condition}
+    GROUP BY user_id, COALESCE(key, '')
+    ON CONFLICT (user_id, key) DO UPDATE
+    SET keystrokes = r.keystrokes + EXCLUDED.keystrokes,
+        dwell_count = r.dwell_count + EXCLUDED.dwell_count,
+        dwell_sum = r.dwell_sum + EXCLUDED.dwell_sum,
+        dwell_sq_sum = r.dwell_sq_sum + EXCLUDED.dwell_sq_sum,
+        flight_count = r.flight_count + EXCLUDED.flight_count,
+        flight_sum = r.flight_sum + EXCLUDED.flight_sum,
+        flight_sq_sum = r.flight_sq_sum + EXCLUDED.flight_sq_sum,
+        first_captured_at = LEAST(r.first_captured_at, EXCLUDED.first_captured_at),
+        last_captured_at = GREATEST(r.last_captured_at, EXCLUDED.last_captured_at)
+"""
+
+def _parse_ts(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+def list_partitions(cur):
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'keystrokes'::regclass
+    """)
+    partitions = []
+    for row in cur.fetchall():
+        match = BOUND.search(row["bound"])
+        if match is None:
+            partitions.append({"name": row["relname"], "default": True, "lower": None, "upper": None})
+        else:
+            partitions.append({"name": row["relname"], "default": False,
+                               "lower": _parse_ts(match.group(1)), "upper": _parse_ts(match.group(2))})
+    return partitions
+
+def _overlaps(partitions, lower, upper):
+    for p in partitions:
+        if p["default"]:
+            continue
+        if (p["lower"] is None or p["lower"] < upper) and (p["upper"] is None or lower < p["upper"]):
+            return True
+    return False
+
+def ensure_partitions(days_ahead=PARTITION_AHEAD_DAYS, today=None):
+    today = today or datetime.date.today()
+    created = []
+    with db.cursor() as cur:
+        partitions = list_partitions(cur)
+        for offset in range(days_ahead + 1):
+            day = today + datetime.timedelta(days=offset)
+            lower = datetime.datetime.combine(day, datetime.time())
+            upper = lower + datetime.timedelta(days=1)
+            if _overlaps(partitions, lower, upper):
+                continue
+            name = f"keystrokes_p{day:%Y%m%d}"
+            # Rows that already landed in the default partition for this day
+            # would block a plain CREATE ... PARTITION OF, so move them first.
+            cur.execute(f"CREATE TABLE {name} (LIKE keystrokes INCLUDING DEFAULTS)")
+            cur.execute(f"""
+                WITH moved AS (
+                    DELETE FROM keystrokes_default WHERE captured_at >= %s AND captured_at < %s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """, (lower, upper))
+            cur.execute(f"ALTER TABLE keystrokes ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (lower, upper))
+            partitions.append({"name": name, "default": False, "lower": lower, "upper": upper})
+            created.append(name)
+    return created
+
+def expire_partitions(retention_days=RETENTION_DAYS, now=None):
+    cutoff = datetime.datetime.combine((now or datetime.date.today()) - datetime.timedelta(days=retention_days),
+                                       datetime.time())
+    dropped = []
+    with db.cursor() as cur:
+        partitions = list_partitions(cur)
+    for p in partitions:
+        # Each partition is rolled up and dropped in its own transaction.
+        with db.cursor() as cur:
+            if p["default"]:
+                cur.execute(ROLLUP_SQL.format(source=p["name"], condition="AND captured_at < %s"), (cutoff,))
+                cur.execute(f"DELETE FROM {p['name']} WHERE captured_at < %s", (cutoff,))
+            elif p["upper"] is not None and p["upper"] <= cutoff:
+                cur.execute(ROLLUP_SQL.format(source=p["name"], condition=""))
+                cur.execute(f"DROP TABLE {p['name']}")
+                dropped.append(p["name"])
+    return dropped
+
+def run_retention(retention_days=RETENTION_DAYS, days_ahead=PARTITION_AHEAD_DAYS):
+    created = ensure_partitions(days_ahead)
+    dropped = expire_partitions(retention_days)
+    print(f"Keystroke retention: created {len(created)} partition(s), rolled up and dropped {len(dropped)}"
+          f" older than {retention_days} days.")
+    return {"created": created, "dropped": dropped}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    parser.add_argument("--ahead", type=int, default=PARTITION_AHEAD_DAYS)
+    parser.add_argument("--every", type=float, help="repeat every N seconds instead of running once")
+    args = parser.parse_args()
+    try:
+        while True:
+            run_retention(args.retention_days, args.ahead)
+            if not args.every:
+                break
+            time.sleep(args.every)
+    finally:
+        db.close()
@@ -0,0 +1,643 @@
+# sqlite_database.py
+import contextlib
+import datetime
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from storage import (StorageBackend, LOCKOUT_SECONDS, KEYSTROKE_COLUMNS, TYPING_PROFILE_COLUMNS, count_query,
+                     score_distribution, typing_profile_dict)
+from analytics import TEST_REPORT_SQL, CONFIDENCE_GAP_SQL
+from queries import (named, ADD_USER_SQL, USER_BY_EMAIL_SQL, USER_BY_ID_SQL, AUTH_STATE_SQL, REHASH_PASSWORD_SQL,
+                     STORED_FAILED_ATTEMPTS_SQL, APPLY_LOCKOUT_SQL, RESET_FAILED_ATTEMPTS_SQL, CLEAR_LOCKOUT_SQL,
+                     INCREMENT_FAILED_ATTEMPTS_SQL, TYPING_PROFILE_SQL, TYPING_DIGRAPHS_SQL, CREATE_TEST_SQL, TEST_SQL,
+                     TEST_HEADER_SQL, TEST_ASSIGNED_SQL, ASSIGNED_TEST_IDS_SQL, TEST_SUBMITTERS_SQL,
+                     TYPING_PROFILES_SQL, TYPING_PROFILES_SINCE_SQL)
+import instrumentation
+
+SCHEMA_VERSION = 1
+
+# Statements without Postgres-only syntax come from queries.py and analytics.py
+# through queries.named(); the ones below are the dialect differences.
+
+# The Postgres schema as of migration 11, in SQLite types. JSON columns are
+# TEXT read with json_each/json_extract, sequences are rows in id_sequences
+# and the tests version trigger bumps after the update instead of before.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('admin', 'student')),
+    name TEXT NOT NULL,
+    failed_attempts INTEGER DEFAULT 0,
+    lockout_time REAL DEFAULT 0,
+    lockout_count INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_role_idx ON users (role);
+CREATE TABLE IF NOT EXISTS typing_profiles (
+    user_id TEXT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    avg_dwell REAL NOT NULL,
+    avg_flight REAL NOT NULL,
+    error_rate REAL NOT NULL,
+    sample_count INTEGER NOT NULL DEFAULT 5,
+    updated_at TIMESTAMP NOT NULL,
+    dwell_m2 REAL NOT NULL DEFAULT 0,
+    flight_m2 REAL NOT NULL DEFAULT 0,
+    error_m2 REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS typing_profiles_updated_at_idx ON typing_profiles (updated_at);
+CREATE TABLE IF NOT EXISTS keystrokes (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT REFERENCES users(user_id) ON DELETE CASCADE,
+    key TEXT,
+    press_time REAL,
+    release_time REAL,
+    dwell_time REAL,
+    flight_time REAL,
+    captured_at TIMESTAMP NOT NULL,
+    attempt_id TEXT,
+    capture_kind TEXT
+);
+CREATE INDEX IF NOT EXISTS keystrokes_user_captured_idx ON keystrokes (user_id, captured_at);
+CREATE TABLE IF NOT EXISTS typing_digraphs (
+    user_id TEXT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    profile BLOB NOT NULL,
+    timing_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    test_id TEXT PRIMARY KEY,
+    questions TEXT NOT NULL,
+    assigned_ids TEXT NOT NULL,
+    replies TEXT DEFAULT '{}',
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE TRIGGER IF NOT EXISTS tests_bump_version AFTER UPDATE OF questions ON tests
+FOR EACH ROW WHEN NEW.questions IS NOT OLD.questions
+BEGIN
+    UPDATE tests SET version = OLD.version + 1 WHERE test_id = NEW.test_id;
+END;
+CREATE TABLE IF NOT EXISTS student_submissions (
+    user_id TEXT REFERENCES users(user_id) ON DELETE CASCADE,
+    test_id TEXT,
+    taken_time TIMESTAMP NOT NULL,
+    stored_confidence REAL NOT NULL,
+    test_confidence REAL NOT NULL,
+    answers TEXT NOT NULL,
+    PRIMARY KEY (user_id, test_id)
+);
+CREATE INDEX IF NOT EXISTS student_submissions_test_id_idx ON student_submissions (test_id);
+CREATE TABLE IF NOT EXISTS test_assignments (
+    test_id TEXT REFERENCES tests(test_id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (test_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS test_assignments_user_id_idx ON test_assignments (user_id, test_id);
+CREATE TABLE IF NOT EXISTS test_scores (
+    user_id TEXT REFERENCES users(user_id) ON DELETE CASCADE,
+    test_id TEXT REFERENCES tests(test_id) ON DELETE CASCADE,
+    correct INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    score REAL NOT NULL,
+    graded_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, test_id)
+);
+CREATE INDEX IF NOT EXISTS test_scores_test_id_score_idx ON test_scores (test_id, score);
+CREATE TABLE IF NOT EXISTS test_stats (
+    test_id TEXT PRIMARY KEY REFERENCES tests(test_id) ON DELETE CASCADE,
+    assigned INTEGER NOT NULL DEFAULT 0,
+    submissions INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    score_sq_sum REAL NOT NULL DEFAULT 0,
+    stored_confidence_sum REAL NOT NULL DEFAULT 0,
+    test_confidence_sum REAL NOT NULL DEFAULT 0,
+    confidence_gap_sum REAL NOT NULL DEFAULT 0,
+    last_submission_at TIMESTAMP,
+    refreshed_at TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS student_stats (
+    user_id TEXT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    assigned INTEGER NOT NULL DEFAULT 0,
+    submissions INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    stored_confidence_sum REAL NOT NULL DEFAULT 0,
+    test_confidence_sum REAL NOT NULL DEFAULT 0,
+    confidence_gap_sum REAL NOT NULL DEFAULT 0,
+    last_submission_at TIMESTAMP,
+    refreshed_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS student_stats_confidence_gap_idx
+ON student_stats (confidence_gap_sum / submissions) WHERE submissions > 0;
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name TEXT PRIMARY KEY,
+    next_value INTEGER NOT NULL,
+    max_value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO id_sequences (name, next_value, max_value) VALUES
+    ('student_id_seq', 0, 999999),
+    ('admin_id_seq', 0, 999999),
+    ('test_id_seq', 0, 2176782335);
+"""
+
+# GRADE_SQL from database.py: answers are compared with each question's
+# "correct" index via json_each/json_extract. WHERE TRUE keeps the upsert
+# unambiguous after a join.
+GRADE_SQL = """
+    INSERT INTO test_scores (user_id, test_id, correct, total, score, graded_at)
+    SELECT s.user_id, s.test_id,
+           SUM(CASE WHEN json_extract(s.answers, '$."' || q.key || '"') = json_extract(q.value, '$.correct')
+                    THEN 1 ELSE 0 END),
+           COUNT(q.key),
+           COALESCE(1.0 * SUM(CASE WHEN json_extract(s.answers, '$."' || q.key || '"') = json_extract(q.value, '$.correct')
+                                   THEN 1 ELSE 0 END) / NULLIF(COUNT(q.key), 0), 0),
+           :now
+    FROM student_submissions s
+    JOIN tests t ON t.test_id = s.test_id
+    LEFT JOIN json_each(t.questions) AS q
+    WHERE TRUE {condition}
+    GROUP BY s.user_id, s.test_id
+    ON CONFLICT (user_id, test_id) DO UPDATE
+    SET correct = excluded.correct,
+        total = excluded.total,
+        score = excluded.score,
+        graded_at = excluded.graded_at
+"""
+
+# analytics.TEST_STATS_SQL / STUDENT_STATS_SQL; key lists are JSON arrays.
+# Writers are serialised by BEGIN IMMEDIATE, so rows are recomputed rather
+# than added to.
+TEST_STATS_SQL = """
+    INSERT INTO test_stats (test_id, assigned, submissions, score_sum, score_sq_sum, stored_confidence_sum,
+                            test_confidence_sum, confidence_gap_sum, last_submission_at, refreshed_at)
+    SELECT t.test_id,
+           (SELECT COUNT(*) FROM test_assignments a WHERE a.test_id = t.test_id),
+           COUNT(s.user_id), TOTAL(g.score), TOTAL(g.score * g.score),
+           TOTAL(s.stored_confidence), TOTAL(s.test_confidence), TOTAL(s.stored_confidence - s.test_confidence),
+           MAX(s.taken_time), :now
+    FROM tests t
+    LEFT JOIN student_submissions s ON s.test_id = t.test_id
+    LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+    WHERE TRUE {condition}
+    GROUP BY t.test_id
+    ON CONFLICT (test_id) DO UPDATE
+    SET assigned = excluded.assigned,
+        submissions = excluded.submissions,
+        score_sum = excluded.score_sum,
+        score_sq_sum = excluded.score_sq_sum,
+        stored_confidence_sum = excluded.stored_confidence_sum,
+        test_confidence_sum = excluded.test_confidence_sum,
+        confidence_gap_sum = excluded.confidence_gap_sum,
+        last_submission_at = excluded.last_submission_at,
+        refreshed_at = excluded.refreshed_at
+"""
+
+STUDENT_STATS_SQL = """
+    INSERT INTO student_stats (user_id, assigned, submissions, score_sum, stored_confidence_sum,
+                               test_confidence_sum, confidence_gap_sum, last_submission_at, refreshed_at)
+    SELECT u.user_id,
+           (SELECT COUNT(*) FROM test_assignments a WHERE a.user_id = u.user_id),
+           COUNT(s.test_id), TOTAL(g.score),
+           TOTAL(s.stored_confidence), TOTAL(s.test_confidence), TOTAL(s.stored_confidence - s.test_confidence),
+           MAX(s.taken_time), :now
+    FROM users u
+    LEFT JOIN student_submissions s ON s.user_id = u.user_id
+    LEFT JOIN test_scores g ON g.user_id = s.user_id AND g.test_id = s.test_id
+    WHERE u.role = 'student' {condition}
+    GROUP BY u.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET assigned = excluded.assigned,
+        submissions = excluded.submissions,
+        score_sum = excluded.score_sum,
+        stored_confidence_sum = excluded.stored_confidence_sum,
+        test_confidence_sum = excluded.test_confidence_sum,
+        confidence_gap_sum = excluded.confidence_gap_sum,
+        last_submission_at = excluded.last_submission_at,
+        refreshed_at = excluded.refreshed_at
+"""
+
+# Timestamps are stored as fixed-width ISO text so they sort as strings and
+# come back as datetime, like Postgres TIMESTAMP columns through psycopg2.
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" ", "microseconds"))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.datetime.fromisoformat(b.decode()))
+
+def _dict_row(cur, row):
+    return {column[0]: value for column, value in zip(cur.description, row)}
+
+def _greatest(*values):
+    # Like Postgres, NULLs are ignored unless every argument is NULL.
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+def _json_list(values):
+    return json.dumps(list(values))
+
+def refresh_stats(cur, test_ids=None, user_ids=None):
+    now = datetime.datetime.now()
+    if test_ids is None and user_ids is None:
+        cur.execute(TEST_STATS_SQL.format(condition=""), {"now": now})
+        cur.execute(STUDENT_STATS_SQL.format(condition=""), {"now": now})
+        return
+    if test_ids:
+        cur.execute(TEST_STATS_SQL.format(condition="AND t.test_id IN (SELECT value FROM json_each(:ids))"),
+                    {"now": now, "ids": _json_list(test_ids)})
+    if user_ids:
+        cur.execute(STUDENT_STATS_SQL.format(condition="AND u.user_id IN (SELECT value FROM json_each(:ids))"),
+                    {"now": now, "ids": _json_list(user_ids)})
+
+# Counts and times statements like database.CountingCursor.
+class CountingCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        count_query()
+        if not instrumentation.ENABLED:
+            return super().execute(sql, parameters)
+        return self._timed(sql, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        count_query()
+        if not instrumentation.ENABLED:
+            return super().executemany(sql, seq_of_parameters)
+        return self._timed(sql, super().executemany, sql, seq_of_parameters)
+
+    def _timed(self, sql, run, *args):
+        start = time.perf_counter()
+        try:
+            result = run(*args)
+        except Exception:
+            instrumentation.record_statement(sql, time.perf_counter() - start, None, error=True)
+            raise
+        instrumentation.record_statement(sql, time.perf_counter() - start, max(self.rowcount, 0))
+        return result
+
+# Embedded backend: the same methods as database.Database on one SQLite file
+# (DB_PATH, default smartsecure.sqlite3) or ":memory:". A file gets one WAL
+# connection per thread; :memory: shares one connection between threads.
+# A cursor() is a BEGIN IMMEDIATE transaction, which also stands in for
+# Postgres row locks: writers, and every read-modify-write, run one at a time.
+# Plain reads use cursor(write=False), a deferred transaction that reads a WAL
+# snapshot without waiting for the write lock.
+class SQLiteDatabase(StorageBackend):
+    def __init__(self, path=None):
+        self.path = path or os.getenv("DB_PATH", "smartsecure.sqlite3")
+        self.busy_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self._local = threading.local()
+        self._connections = []
+        self._conn_lock = threading.Lock()
+        self._memory_lock = threading.RLock()
+        self._ready = False
+        super().__init__()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        with self._conn_lock:
+            if self.path == ":memory:" and self._connections:
+                conn = self._connections[0]
+            else:
+                # A file connection serves one thread; check_same_thread is off
+                # only so close() can release the ones opened by other threads.
+                conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                       detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+                conn.row_factory = _dict_row
+                # Postgres functions the shared statements use; sqrt() is only
+                # built in when SQLite is compiled with math functions.
+                conn.create_function("sqrt", 1, lambda x: None if x is None else math.sqrt(x), deterministic=True)
+                conn.create_function("greatest", -1, _greatest, deterministic=True)
+                conn.execute("PRAGMA foreign_keys = ON")
+                if self.path != ":memory:":
+                    conn.execute("PRAGMA journal_mode = WAL")
+                    conn.execute("PRAGMA synchronous = NORMAL")
+                self._connections.append(conn)
+                if not self._ready:
+                    self._init_schema(conn)
+                    self._ready = True
+        self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _init_schema(conn):
+        version = conn.execute("PRAGMA user_version").fetchone()["user_version"]
+        if version < SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def connect(self):
+        self._connect()
+
+    def init_db(self):
+        self._init_schema(self._connect())
+
+    @contextlib.contextmanager
+    def cursor(self, write=True):
+        lock = self._memory_lock if self.path == ":memory:" else contextlib.nullcontext()
+        with lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN DEFERRED")
+            cur = conn.cursor(CountingCursor)
+            try:
+                yield cur
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+
+    def reserve_ids(self, space, count):
+        with self.cursor() as cur:
+            # nextval() for `count` counters; like the Postgres sequences there is no wrap-around.
+            cur.execute("SELECT next_value, max_value FROM id_sequences WHERE name = ?", (space.sequence,))
+            row = cur.fetchone()
+            start = row["next_value"]
+            if start > row["max_value"]:
+                raise sqlite3.IntegrityError(f"{space.sequence} has reached its maximum value")
+            end = min(start + count, row["max_value"] + 1)
+            cur.execute("UPDATE id_sequences SET next_value = ? WHERE name = ?", (end, space.sequence))
+            candidates = [space.format(n) for n in range(start, end)]
+            cur.execute(f"SELECT {space.column} AS id FROM {space.table} "
+                        f"WHERE {space.column} IN (SELECT value FROM json_each(?))", (_json_list(candidates),))
+            taken = {row["id"] for row in cur.fetchall()}
+            return [c for c in candidates if c not in taken]
+
+    def add_user(self, user_id, email, password, role, name):
+        hashed_password = self.hasher.hash(password)
+        try:
+            with self.cursor() as cur:
+                cur.execute(named(ADD_USER_SQL), {"user_id": user_id, "email": email, "password": hashed_password,
+                                                  "role": role, "name": name})
+                return cur.fetchone() is not None
+        except sqlite3.IntegrityError:
+            return False
+
+    def get_user_by_email(self, email):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(USER_BY_EMAIL_SQL), {"email": email})
+            return cur.fetchone()
+
+    def get_user_by_id(self, user_id):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(USER_BY_ID_SQL), {"user_id": user_id})
+            return cur.fetchone()
+
+    def get_auth_state(self, email):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(AUTH_STATE_SQL), {"email": email})
+            row = cur.fetchone()
+            if row is None:
+                return None
+            state = {k: v for k, v in row.items() if k not in TYPING_PROFILE_COLUMNS}
+            state["typing_profile"] = typing_profile_dict(row) if row["avg_dwell"] is not None else None
+            return state
+
+    def rehash_password(self, user_id, old_hash, password):
+        with self.cursor() as cur:
+            cur.execute(named(REHASH_PASSWORD_SQL), {"password": self.hasher.hash(password), "user_id": user_id,
+                                                     "old_hash": old_hash})
+            return cur.rowcount == 1
+
+    def _stored_failed_attempts(self, email):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(STORED_FAILED_ATTEMPTS_SQL), {"email": email})
+            row = cur.fetchone()
+            return row["failed_attempts"] if row else None
+
+    def _apply_lockout(self, email, attempts, until):
+        with self.cursor() as cur:
+            cur.execute(named(APPLY_LOCKOUT_SQL), {"attempts": attempts, "until": until, "email": email})
+            return cur.fetchone()
+
+    def _reset_failed_attempts(self, email):
+        with self.cursor() as cur:
+            cur.execute(named(RESET_FAILED_ATTEMPTS_SQL), {"email": email})
+
+    def _clear_lockout(self, email, lockout_time):
+        with self.cursor() as cur:
+            cur.execute(named(CLEAR_LOCKOUT_SQL), {"email": email, "lockout_time": lockout_time})
+
+    def increment_failed_attempts(self, email):
+        with self.cursor() as cur:
+            cur.execute(named(INCREMENT_FAILED_ATTEMPTS_SQL), {"until": time.time() + LOCKOUT_SECONDS, "email": email})
+            result = cur.fetchone()
+            if result is None:
+                return {"failed_attempts": 0, "lockout_time": 0, "lockout_count": 0}
+            return result
+
+    def get_user_typing_profile(self, user_id):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(TYPING_PROFILE_SQL), {"user_id": user_id})
+            profile = cur.fetchone()
+            if profile:
+                return typing_profile_dict(profile)
+            return None
+
+    def save_typing_dynamics(self, user_id, features, keystrokes=None):
+        with self.cursor() as cur:
+            cur.execute("""
+                INSERT INTO typing_profiles (user_id, avg_dwell, avg_flight, error_rate, sample_count, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET avg_dwell = excluded.avg_dwell,
+                    avg_flight = excluded.avg_flight,
+                    error_rate = excluded.error_rate,
+                    sample_count = excluded.sample_count,
+                    dwell_m2 = 0,
+                    flight_m2 = 0,
+                    error_m2 = 0,
+                    updated_at = excluded.updated_at
+            """, (user_id, features["avgDwell"], features["avgFlight"], features["errorRate"], 5,
+                  datetime.datetime.now()))
+        if keystrokes:
+            self.update_typing_digraphs(user_id, keystrokes)
+
+    def insert_keystroke_rows(self, rows, method=None):
+        # method is a Postgres choice (COPY or VALUES); SQLite always uses executemany.
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        now = datetime.datetime.now()
+        with self.cursor() as cur:
+            cur.executemany(f"INSERT INTO keystrokes ({', '.join(KEYSTROKE_COLUMNS)}, captured_at) "
+                            f"VALUES ({', '.join('?' * (len(KEYSTROKE_COLUMNS) + 1))})", [row + (now,) for row in rows])
+        self._count_ingest(len(rows), time.perf_counter() - start)
+        return len(rows)
+
+    def get_user_keystrokes(self, user_id, since=None):
+        with self.cursor(write=False) as cur:
+            cur.execute(f"""
+                SELECT {', '.join(KEYSTROKE_COLUMNS)}, captured_at
+                FROM keystrokes
+                WHERE user_id = ? AND captured_at >= ?
+                ORDER BY captured_at, id
+            """, (user_id, since or datetime.datetime.min))
+            return cur.fetchall()
+
+    def _merge_typing_profile(self, user_id, new_features, new_samples):
+        # Same Chan merge as the Postgres upsert; BEGIN IMMEDIATE serialises
+        # sessions, so the existence check cannot race the upsert.
+        with self.cursor() as cur:
+            cur.execute("SELECT 1 FROM typing_profiles WHERE user_id = ?", (user_id,))
+            inserted = cur.fetchone() is None
+            cur.execute("""
+                INSERT INTO typing_profiles AS p (user_id, avg_dwell, avg_flight, error_rate, sample_count, updated_at)
+                VALUES (:user_id, :dwell, :flight, :error, :samples, :now)
+                ON CONFLICT (user_id) DO UPDATE
+                SET sample_count = p.sample_count + excluded.sample_count,
+                    avg_dwell = p.avg_dwell + (excluded.avg_dwell - p.avg_dwell) * excluded.sample_count
+                                / (p.sample_count + excluded.sample_count),
+                    avg_flight = p.avg_flight + (excluded.avg_flight - p.avg_flight) * excluded.sample_count
+                                 / (p.sample_count + excluded.sample_count),
+                    error_rate = p.error_rate + (excluded.error_rate - p.error_rate) * excluded.sample_count
+                                 / (p.sample_count + excluded.sample_count),
+                    dwell_m2 = p.dwell_m2 + (excluded.avg_dwell - p.avg_dwell) * (excluded.avg_dwell - p.avg_dwell)
+                               * p.sample_count * excluded.sample_count / (p.sample_count + excluded.sample_count),
+                    flight_m2 = p.flight_m2 + (excluded.avg_flight - p.avg_flight) * (excluded.avg_flight - p.avg_flight)
+                                * p.sample_count * excluded.sample_count / (p.sample_count + excluded.sample_count),
+                    error_m2 = p.error_m2 + (excluded.error_rate - p.error_rate) * (excluded.error_rate - p.error_rate)
+                               * p.sample_count * excluded.sample_count / (p.sample_count + excluded.sample_count),
+                    updated_at = excluded.updated_at
+                RETURNING *
+            """, {"user_id": user_id, "dwell": new_features["avgDwell"], "flight": new_features["avgFlight"],
+                  "error": new_features["errorRate"], "samples": new_samples, "now": datetime.datetime.now()})
+            return cur.fetchone(), inserted
+
+    def get_typing_digraphs(self, user_id):
+        from typing_digraphs import DigraphProfile
+        with self.cursor(write=False) as cur:
+            cur.execute(named(TYPING_DIGRAPHS_SQL), {"user_id": user_id})
+            row = cur.fetchone()
+            return DigraphProfile.from_bytes(row["profile"]) if row else None
+
+    def update_typing_digraphs(self, user_id, keystrokes):
+        from typing_digraphs import DigraphProfile
+        with self.cursor() as cur:
+            cur.execute("SELECT profile FROM typing_digraphs WHERE user_id = ?", (user_id,))
+            row = cur.fetchone()
+            profile = DigraphProfile.from_bytes(row["profile"]) if row else DigraphProfile()
+            added = profile.update(keystrokes)
+            cur.execute("""
+                INSERT INTO typing_digraphs (user_id, profile, timing_count, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET profile = excluded.profile,
+                    timing_count = timing_count + excluded.timing_count,
+                    updated_at = excluded.updated_at
+            """, (user_id, profile.to_bytes(), added, datetime.datetime.now()))
+            return profile
+
+    def create_test(self, test_id, questions, assigned_ids):
+        try:
+            with self.cursor() as cur:
+                cur.execute(named(CREATE_TEST_SQL), {"test_id": test_id, "questions": json.dumps(questions),
+                                                     "assigned_ids": json.dumps(assigned_ids)})
+                cur.fetchall()
+                cur.executemany("INSERT OR IGNORE INTO test_assignments (test_id, user_id) VALUES (?, ?)",
+                                [(test_id, user_id) for user_id in assigned_ids])
+                refresh_stats(cur, [test_id], assigned_ids)
+                return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def get_test(self, test_id):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(TEST_SQL), {"test_id": test_id})
+            test = cur.fetchone()
+        if test is not None:
+            for column in ("questions", "assigned_ids", "replies"):
+                if test[column] is not None:
+                    test[column] = json.loads(test[column])
+        return test
+
+    def get_test_header(self, test_id, user_id):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(TEST_HEADER_SQL), {"test_id": test_id, "user_id": user_id})
+            header = cur.fetchone()
+        if header is not None:
+            header["assigned"] = bool(header["assigned"])
+        return header
+
+    def is_test_assigned(self, test_id, user_id):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(TEST_ASSIGNED_SQL), {"test_id": test_id, "user_id": user_id})
+            return cur.fetchone() is not None
+
+    def save_test_submission(self, user_id, test_id, answers, stored_confidence, test_confidence):
+        now = datetime.datetime.now()
+        with self.cursor() as cur:
+            cur.execute("""
+                INSERT INTO student_submissions (user_id, test_id, taken_time, stored_confidence, test_confidence, answers)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, test_id) DO UPDATE
+                SET taken_time = excluded.taken_time,
+                    stored_confidence = excluded.stored_confidence,
+                    test_confidence = excluded.test_confidence,
+                    answers = excluded.answers
+            """, (user_id, test_id, now, stored_confidence, test_confidence, json.dumps(answers)))
+            saved = cur.rowcount == 1
+            cur.execute(GRADE_SQL.format(condition="AND s.user_id = :user_id AND s.test_id = :test_id"),
+                        {"user_id": user_id, "test_id": test_id, "now": now})
+            refresh_stats(cur, [test_id], [user_id])
+            return saved
+
+    def grade_tests(self, test_id=None):
+        now = datetime.datetime.now()
+        with self.cursor() as cur:
+            if test_id is None:
+                cur.execute(GRADE_SQL.format(condition=""), {"now": now})
+                graded = cur.rowcount
+                refresh_stats(cur)
+            else:
+                cur.execute(GRADE_SQL.format(condition="AND s.test_id = :test_id"), {"test_id": test_id, "now": now})
+                graded = cur.rowcount
+                cur.execute(named(TEST_SUBMITTERS_SQL), {"test_id": test_id})
+                refresh_stats(cur, [test_id], [row["user_id"] for row in cur.fetchall()])
+            return graded
+
+    def get_score_distribution(self, test_id, bins=10):
+        with self.cursor(write=False) as cur:
+            # MIN(width_bucket(score, 0, 1, bins), bins) for scores in [0, 1].
+            cur.execute("""
+                SELECT MIN(CAST(score * :bins AS INTEGER) + 1, :bins) AS bucket, COUNT(*) AS n,
+                       SUM(score) AS total, MIN(score) AS low, MAX(score) AS high
+                FROM test_scores
+                WHERE test_id = :test_id
+                GROUP BY 1
+                ORDER BY 1
+            """, {"bins": bins, "test_id": test_id})
+            return score_distribution(cur.fetchall(), bins)
+
+    def get_test_stats(self, limit=50):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(TEST_REPORT_SQL), {"limit": limit})
+            return cur.fetchall()
+
+    def get_confidence_gaps(self, limit=10):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(CONFIDENCE_GAP_SQL), {"limit": limit})
+            return cur.fetchall()
+
+    def get_assigned_test_ids(self, user_id):
+        with self.cursor(write=False) as cur:
+            cur.execute(named(ASSIGNED_TEST_IDS_SQL), {"user_id": user_id})
+            return [row["test_id"] for row in cur.fetchall()]
+
+    def get_typing_profiles(self, since=None):
+        with self.cursor(write=False) as cur:
+            if since is None:
+                cur.execute(TYPING_PROFILES_SQL)
+            else:
+                cur.execute(named(TYPING_PROFILES_SINCE_SQL), {"since": since})
+            return cur.fetchall()
+
+    def close(self):
+        super().close()
+        with self._conn_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._ready = False
+        self._local = threading.local()
+
+instrumentation.instrument(SQLiteDatabase)
@@ -0,0 +1,307 @@
+# storage.py
+import abc
+import math
+import os
+import threading
+import time
+import uuid
+import pyotp
+from keystroke_writer import KeystrokeWriter
+from password_hasher import PasswordHasher
+from id_allocator import IdAllocator
+from rate_limit import LoginRateLimiter
+import instrumentation
+
+# Failed-attempt counts that change the lockout state stored in users.
+LOCKOUT_TRANSITIONS = (3, 6)
+
+LOCKOUT_SECONDS = 30
+
+# attempt_id groups the rows of one save_keystrokes call (one registration or
+# login capture); capture_kind says which of the two it was.
+KEYSTROKE_COLUMNS = ("user_id", "key", "press_time", "release_time", "dwell_time", "flight_time", "attempt_id",
+                     "capture_kind")
+
+CAPTURE_KINDS = ("register", "login")
+
+TYPING_PROFILE_COLUMNS = ("avg_dwell", "avg_flight", "error_rate", "sample_count", "dwell_m2", "flight_m2", "error_m2")
+
+# Statements per thread, so a flow can report how many round trips it made.
+query_counter = threading.local()
+
+def count_query():
+    query_counter.count = getattr(query_counter, "count", 0) + 1
+
+def typing_profile_dict(row):
+    profile = {"avgDwell": row["avg_dwell"], "avgFlight": row["avg_flight"], "errorRate": row["error_rate"]}
+    if row.get("dwell_m2") is not None:
+        # Population spread of the per-session means, weighted by samples.
+        samples = row["sample_count"]
+        profile["sampleCount"] = samples
+        for key, column in (("dwellStd", "dwell_m2"), ("flightStd", "flight_m2"), ("errorStd", "error_m2")):
+            profile[key] = math.sqrt(max(row[column], 0.0) / samples) if samples else 0.0
+    return profile
+
+def score_distribution(rows, bins):
+    histogram = [0] * bins
+    for row in rows:
+        histogram[row["bucket"] - 1] = row["n"]
+    submissions = sum(histogram)
+    return {
+        "submissions": submissions,
+        "mean": sum(row["total"] for row in rows) / submissions if submissions else None,
+        "min": min((row["low"] for row in rows), default=None),
+        "max": max((row["high"] for row in rows), default=None),
+        "histogram": histogram,
+    }
+
+# Login decisions shared by the blocking backends and async_database; the
+# callers only differ in how they reach the limiter and the users table.
+def login_locked(user):
+    # Permanently after the second lockout, otherwise until lockout_time.
+    return user["lockout_count"] >= 2 or user["lockout_time"] > time.time()
+
+def limiter_keys(user):
+    return f"email:{user['email']}", f"user:{user['user_id']}"
+
+def failure_counters(attempts, result=None):
+    # What record_failed_login returns once the limiter has counted a failure.
+    # result is the users row written at a lockout transition (None if the
+    # user no longer exists).
+    if attempts not in LOCKOUT_TRANSITIONS:
+        return {"failed_attempts": attempts, "lockout_time": None, "lockout_count": None}
+    if result is None:
+        return {"failed_attempts": attempts, "lockout_time": 0, "lockout_count": 0}
+    return dict(result, failed_attempts=attempts)
+
+# Five-minute one-time codes, shared with async_database.
+def generate_totp_token():
+    secret = pyotp.random_base32()
+    return pyotp.TOTP(secret, interval=300).now(), secret
+
+def verify_totp_token(token, secret):
+    return pyotp.TOTP(secret, interval=300).verify(token)
+
+def keystroke_rows(user_id, keystrokes, kind="login", attempt_id=None):
+    if kind not in CAPTURE_KINDS:
+        raise ValueError(f"Unknown capture kind: {kind}")
+    attempt_id = attempt_id or str(uuid.uuid4())
+    return [(user_id, ks.get("key"), ks.get("press_time"), ks.get("release_time"),
+             ks.get("dwell_time"), ks.get("flight_time"), attempt_id, kind) for ks in keystrokes]
+
+# The data layer the flows talk to. Password hashing, login rate limiting, ID
+# blocks, TOTP and keystroke write-behind live here; subclasses supply the
+# storage: database.Database (Postgres) and sqlite_database.SQLiteDatabase
+# (a file or :memory:). DB_BACKEND picks one for database.db. cursor() is
+# still available for tools that speak one dialect (bulk_import, retention).
+class StorageBackend(abc.ABC):
+    def __init__(self):
+        self.keystroke_insert_method = os.getenv("KEYSTROKE_INSERT_METHOD", "values")
+        self.keystroke_writer = None
+        if os.getenv("KEYSTROKE_WRITE_BEHIND", "0") == "1":
+            self.keystroke_writer = KeystrokeWriter(
+                self,
+                max_rows=int(os.getenv("KEYSTROKE_BATCH_ROWS", "5000")),
+                flush_interval=float(os.getenv("KEYSTROKE_FLUSH_INTERVAL", "0.5")),
+            )
+        self.hasher = PasswordHasher()
+        self.ids = IdAllocator(self.reserve_ids)
+        self.login_limiter = LoginRateLimiter()
+        self._stats_lock = threading.Lock()
+        self._ingest_rows = 0
+        self._ingest_seconds = 0.0
+
+    @abc.abstractmethod
+    def cursor(self): ...
+
+    @abc.abstractmethod
+    def connect(self): ...
+
+    @abc.abstractmethod
+    def init_db(self): ...
+
+    @abc.abstractmethod
+    def reserve_ids(self, space, count): ...
+
+    @abc.abstractmethod
+    def add_user(self, user_id, email, password, role, name): ...
+
+    @abc.abstractmethod
+    def get_user_by_email(self, email): ...
+
+    @abc.abstractmethod
+    def get_user_by_id(self, user_id): ...
+
+    @abc.abstractmethod
+    def get_auth_state(self, email): ...
+
+    @abc.abstractmethod
+    def rehash_password(self, user_id, old_hash, password): ...
+
+    @abc.abstractmethod
+    def increment_failed_attempts(self, email): ...
+
+    @abc.abstractmethod
+    def get_user_typing_profile(self, user_id): ...
+
+    @abc.abstractmethod
+    def save_typing_dynamics(self, user_id, features, keystrokes=None): ...
+
+    @abc.abstractmethod
+    def insert_keystroke_rows(self, rows, method=None): ...
+
+    @abc.abstractmethod
+    def get_user_keystrokes(self, user_id, since=None): ...
+
+    @abc.abstractmethod
+    def get_typing_digraphs(self, user_id): ...
+
+    @abc.abstractmethod
+    def update_typing_digraphs(self, user_id, keystrokes): ...
+
+    @abc.abstractmethod
+    def create_test(self, test_id, questions, assigned_ids): ...
+
+    @abc.abstractmethod
+    def get_test(self, test_id): ...
+
+    @abc.abstractmethod
+    def get_test_header(self, test_id, user_id): ...
+
+    @abc.abstractmethod
+    def is_test_assigned(self, test_id, user_id): ...
+
+    @abc.abstractmethod
+    def save_test_submission(self, user_id, test_id, answers, stored_confidence, test_confidence): ...
+
+    @abc.abstractmethod
+    def grade_tests(self, test_id=None): ...
+
+    @abc.abstractmethod
+    def get_score_distribution(self, test_id, bins=10): ...
+
+    @abc.abstractmethod
+    def get_test_stats(self, limit=50): ...
+
+    @abc.abstractmethod
+    def get_confidence_gaps(self, limit=10): ...
+
+    @abc.abstractmethod
+    def get_assigned_test_ids(self, user_id): ...
+
+    @abc.abstractmethod
+    def get_typing_profiles(self, since=None): ...
+
+    # Hooks for record_failed_login and update_typing_profile.
+    @abc.abstractmethod
+    def _stored_failed_attempts(self, email): ...
+
+    @abc.abstractmethod
+    def _apply_lockout(self, email, attempts, until): ...
+
+    @abc.abstractmethod
+    def _reset_failed_attempts(self, email): ...
+
+    @abc.abstractmethod
+    def _clear_lockout(self, email, lockout_time): ...
+
+    @abc.abstractmethod
+    def _merge_typing_profile(self, user_id, features, samples): ...
+
+    def generate_token(self, role):
+        return self.ids.allocate("admin" if role == "admin" else "student")
+
+    def generate_test_id(self):
+        return self.ids.allocate("test")
+
+    def verify_login(self, state, password):
+        # Returns (user, None) on success, or (None, counters) where counters are
+        # the post-failure values from record_failed_login, {"retry_after": s}
+        # when rate limited, or None if locked.
+        user = {k: v for k, v in state.items() if k != "typing_profile"}
+        if login_locked(user):
+            return None, None
+        if user["lockout_time"]:
+            # The lockout has expired: drop this host's count, which was taken
+            # before it, and record the expiry so it is handled only once.
+            self.login_limiter.reset(user["email"])
+            self._clear_lockout(user["email"], user["lockout_time"])
+        retry_after = self.login_limiter.acquire(*limiter_keys(user))
+        if retry_after:
+            return None, {"retry_after": retry_after}
+        if self.hasher.verify(password, user["password"]):
+            if self.hasher.needs_rehash(user["password"]):
+                self.rehash_password(user["user_id"], user["password"], password)
+            self.login_limiter.reset(user["email"])
+            if user["failed_attempts"] or user["lockout_time"]:
+                self._reset_failed_attempts(user["email"])
+            return user, None
+        return None, self.record_failed_login(user["email"], user["failed_attempts"])
+
+    def check_password(self, email, password):
+        state = self.get_auth_state(email)
+        if state:
+            user, _ = self.verify_login(state, password)
+            return user
+        return None
+
+    def record_failed_login(self, email, known_attempts=None):
+        # Failures are counted in the local limiter store, on top of the
+        # users row's failed_attempts; users is only written when the count
+        # crosses a lockout threshold.
+        if known_attempts is None:
+            known_attempts = self._stored_failed_attempts(email)
+            if known_attempts is None:
+                return {"failed_attempts": 0, "lockout_time": 0, "lockout_count": 0}
+        attempts = self.login_limiter.record_failure(email, known_attempts)
+        result = None
+        if attempts in LOCKOUT_TRANSITIONS:
+            result = self._apply_lockout(email, attempts, time.time() + LOCKOUT_SECONDS)
+        return failure_counters(attempts, result)
+
+    def update_typing_profile(self, user_id, new_features, new_samples, keystrokes=None):
+        if keystrokes:
+            self.update_typing_digraphs(user_id, keystrokes)
+        profile, inserted = self._merge_typing_profile(user_id, new_features, new_samples)
+        if inserted:
+            print("No existing typing profile found for user! Creating new profile.")
+        return typing_profile_dict(profile)
+
+    def save_keystrokes(self, user_id, keystrokes, kind="login"):
+        rows = keystroke_rows(user_id, keystrokes, kind)
+        if self.keystroke_writer is not None:
+            self.keystroke_writer.submit(rows)
+            return len(rows)
+        return self.insert_keystroke_rows(rows)
+
+    def _count_ingest(self, rows, seconds):
+        with self._stats_lock:
+            self._ingest_rows += rows
+            self._ingest_seconds += seconds
+
+    def ingest_stats(self):
+        with self._stats_lock:
+            rows, seconds = self._ingest_rows, self._ingest_seconds
+        return {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds else 0.0}
+
+    def reset_query_count(self):
+        query_counter.count = 0
+
+    def query_count(self):
+        return getattr(query_counter, "count", 0)
+
+    def generate_totp_token(self, email):
+        return generate_totp_token()
+
+    def verify_totp_token(self, token, secret):
+        return verify_totp_token(token, secret)
+
+    def close(self):
+        # Subclasses close their connections after this, so write-behind
+        # keystrokes are flushed first.
+        if self.keystroke_writer is not None:
+            self.keystroke_writer.close()
+        self.hasher.close()
+        self.login_limiter.close()
+
+instrumentation.instrument(StorageBackend)
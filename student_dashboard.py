@@ -1,26 +1,13 @@
 # student_dashboard.py
 from database import db
 from typing_auth import typing_auth
+from typing_model import model_provider
+from typing_digraphs import check_digraphs
+from typing_verifier import verify_typing_features
+from content_cache import content_cache
+from instrumentation import timed
 import json
 import time
-import numpy as np
-import pickle
-import os
-
-def verify_typing_features(login_features, stored_features):
-    dwell_threshold = 0.3
-    flight_threshold = 0.3
-    error_threshold = 0.2
-
-    dwell_ok = abs(login_features["avgDwell"] - stored_features["avgDwell"]) <= stored_features["avgDwell"] * dwell_threshold
-    flight_ok = abs(login_features["avgFlight"] - stored_features["avgFlight"]) <= stored_features["avgFlight"] * flight_threshold
-    error_ok = abs(login_features["errorRate"] - stored_features["errorRate"]) <= error_threshold and 0 <= login_features["errorRate"] <= 1
-
-    print(f"Typing Check - Dwell: {login_features['avgDwell']:.2f} vs {stored_features['avgDwell']:.2f} ({dwell_ok}), "
-          f"Flight: {login_features['avgFlight']:.2f} vs {stored_features['avgFlight']:.2f} ({flight_ok}), "
-          f"Error: {login_features['errorRate']:.2f} vs {stored_features['errorRate']:.2f} ({error_ok})")
-
-    return dwell_ok and flight_ok and error_ok
 
 def typing_verification(user_id):
     stored_profile = db.get_user_typing_profile(user_id)
@@ -28,7 +15,8 @@ def typing_verification(user_id):
         print("No typing profile found! Verification aborted.")
         return False
 
-    typing_data = typing_auth(user_id, "verify", samples_needed=3)
+    with timed("typing_capture"):
+        typing_data = typing_auth(user_id, "verify", samples_needed=3)
     if typing_data["samples"] < 3 or len(typing_data["keystrokes"]) < 3:
         print("Typing failed! Need 3 valid samples.")
         return False
@@ -37,15 +25,15 @@ def typing_verification(user_id):
         print("Typing verification failed (threshold check)!")
         return False
 
+    if not check_digraphs(db.get_typing_digraphs(user_id), typing_data["keystrokes"]):
+        print("Typing verification failed (digraph check)!")
+        return False
+
     model_verified = True
-    if os.path.exists("typing_model.pkl"):
+    if model_provider.available():
         try:
-            with open("typing_model.pkl", "rb") as f:
-                model = pickle.load(f)
-            features = np.array([[typing_data["features"]["avgDwell"], 
-                                 typing_data["features"]["avgFlight"], 
-                                 typing_data["features"]["errorRate"]]])
-            predicted_user = model.predict(features)[0]
+            with timed("model_predict"):
+                predicted_user = model_provider.predict_user(typing_data["features"])
             model_verified = predicted_user == user_id
             print(f"k-NN Prediction: {predicted_user} (Match: {model_verified})")
             if not model_verified:
@@ -68,21 +56,27 @@ def view_assigned_test_ids(user_id):
 def take_test(user):
     user_id = user["user_id"]
     test_id = input("Enter Test ID: ")
-    test = db.get_test(test_id)
-    if not test:
+    header = db.get_test_header(test_id, user_id)
+    if not header:
         print("Invalid Test ID!")
         return
 
-    if not db.is_test_assigned(test_id, user_id):
+    if not header["assigned"]:
         print("This test is not assigned to you!")
         return
 
+    test = content_cache.get(test_id, header["version"])
+    if not test:
+        print("Invalid Test ID!")
+        return
+
     print("Verifying identity with typing test...")
     if not typing_verification(user_id):
         print("Identity verification failed! Cannot proceed with the test.")
         return
 
-    typing_data = typing_auth(user_id, "test", samples_needed=3)
+    with timed("typing_capture"):
+        typing_data = typing_auth(user_id, "test", samples_needed=3)
     stored_profile = db.get_user_typing_profile(user_id)
     if not stored_profile or typing_data["samples"] < 3 or len(typing_data["keystrokes"]) < 3:
         print("Typing test failed! Need 3 valid samples for confidence calculation.")
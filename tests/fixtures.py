@@ -0,0 +1,24 @@
+# tests/fixtures.py
+# Synthetic users and typing shared by the tests and the benchmarks.
+import random
+import time
+from keystroke_features import extract_features
+
+PHRASE = "thequickbrownfox"
+PASSWORD = "Bench#Pass1"
+
+def synthetic_typing(samples, dwell=0.1, flight=0.12, jitter=0.02):
+    events = []
+    t = time.time()
+    for _ in range(samples):
+        for ch in PHRASE:
+            press = t
+            release = press + max(0.01, random.gauss(dwell, jitter))
+            t = release + max(0.01, random.gauss(flight, jitter))
+            events.append({"key": ch, "press_time": press, "release_time": release})
+    features = extract_features(events, error_rate=random.uniform(0.0, 0.05))
+    return {"samples": samples, "features": features, "keystrokes": events}
+
+EMAIL_DOMAIN = "backends.bench"
+
+QUESTIONS = {str(q): {"text": f"Q{q}", "options": ["a", "b", "c", "d"], "correct": q % 4} for q in range(1, 11)}
@@ -0,0 +1,181 @@
+# tests/test_storage.py
+# StorageBackend conformance: every method is exercised and the results that
+# must agree between backends are checked. Runs against SQLite in memory, and
+# against Postgres when TEST_DB_NAME names a database to use (with the usual
+# DB_HOST, DB_USER and DB_PASSWORD); its fixtures are removed afterwards.
+# benchmarks/backends.py runs the same tests against each backend it times:
+#   TEST_DB_NAME=smartsecure_test python -m unittest tests.test_storage
+import datetime
+import math
+import os
+import time
+import unittest
+import uuid
+from unittest import mock
+from database import Database
+from password_hasher import PasswordHasher
+from queries import named
+from rate_limit import LoginRateLimiter
+from sqlite_database import SQLiteDatabase
+from storage import LOCKOUT_SECONDS
+from tests.fixtures import EMAIL_DOMAIN, PASSWORD, QUESTIONS, synthetic_typing
+
+TEST_DB_NAME = os.getenv("TEST_DB_NAME")
+
+# Mixed into a TestCase that defines make_backend(); each test gets a fresh
+# backend and a student of its own.
+class StorageConformance:
+    def setUp(self):
+        self.db = self.make_backend()
+        # Cheap hashes, and the same user logs in faster than the limiter allows.
+        self.db.hasher = PasswordHasher(workers=0, rounds=4)
+        self.db.login_limiter.close()
+        self.db.login_limiter = LoginRateLimiter(":memory:", burst=1e12)
+        self.db.connect()
+        self.run_id = uuid.uuid4().hex[:12]
+        self.test_ids = []
+        self.user_id, self.email = self.add_student("student")
+
+    def tearDown(self):
+        try:
+            for test_id in self.test_ids:
+                self.execute("DELETE FROM tests WHERE test_id = %(test_id)s", {"test_id": test_id})
+            self.execute("DELETE FROM users WHERE email LIKE %(pattern)s",
+                         {"pattern": f"{self.run_id}-%@{EMAIL_DOMAIN}"})
+        finally:
+            self.db.close()
+
+    def execute(self, sql, params):
+        with self.db.cursor() as cur:
+            cur.execute(named(sql) if isinstance(self.db, SQLiteDatabase) else sql, params)
+
+    def add_student(self, name):
+        user_id = self.db.generate_token("student")
+        email = f"{self.run_id}-{name}@{EMAIL_DOMAIN}"
+        self.assertTrue(self.db.add_user(user_id, email, PASSWORD, "student", name.title()))
+        return user_id, email
+
+    def add_test(self, assigned_ids):
+        test_id = self.db.generate_test_id()
+        self.test_ids.append(test_id)
+        self.assertTrue(self.db.create_test(test_id, QUESTIONS, assigned_ids))
+        return test_id
+
+    def test_generated_ids(self):
+        student_id, admin_id, test_id = (self.db.generate_token("student"), self.db.generate_token("admin"),
+                                         self.db.generate_test_id())
+        self.assertRegex(student_id, r"^S\d{6}$")
+        self.assertRegex(admin_id, r"^A\d{6}$")
+        self.assertRegex(test_id, r"^TE[0-9A-Z]{6}$")
+        self.assertNotEqual(student_id, self.user_id)
+
+    def test_users(self):
+        self.assertFalse(self.db.add_user(self.db.generate_token("student"), self.email, PASSWORD, "student", "Dup"))
+        self.assertEqual(self.db.get_user_by_email(self.email)["user_id"], self.user_id)
+        self.assertEqual(self.db.get_user_by_id(self.user_id)["email"], self.email)
+        state = self.db.get_auth_state(self.email)
+        self.assertIsNone(state["typing_profile"])
+        self.assertEqual(state["failed_attempts"], 0)
+        self.assertIsNone(self.db.get_auth_state(f"{self.run_id}-nobody@{EMAIL_DOMAIN}"))
+
+    def test_check_password(self):
+        self.assertEqual(self.db.check_password(self.email, PASSWORD)["user_id"], self.user_id)
+        self.assertIsNone(self.db.check_password(self.email, "wrong"))
+
+    def test_failed_logins(self):
+        self.assertIsNone(self.db.check_password(self.email, "wrong"))
+        self.assertEqual(self.db.record_failed_login(self.email)["failed_attempts"], 2)
+        self.assertIsNotNone(self.db.check_password(self.email, PASSWORD))
+        self.assertEqual(self.db.record_failed_login(self.email)["failed_attempts"], 1,
+                         "a successful login resets the count")
+        self.db.record_failed_login(self.email)
+        locked_at = time.time()
+        counters = self.db.record_failed_login(self.email)
+        self.assertEqual(counters["failed_attempts"], 3)
+        self.assertGreaterEqual(counters["lockout_time"], locked_at + LOCKOUT_SECONDS)
+        self.assertLessEqual(counters["lockout_time"], time.time() + LOCKOUT_SECONDS)
+        self.assertEqual(self.db.get_user_by_id(self.user_id)["failed_attempts"], 3)
+        self.assertIsNone(self.db.check_password(self.email, PASSWORD), "locked out")
+
+    def test_typing_profile(self):
+        start = datetime.datetime.now() - datetime.timedelta(seconds=1)
+        self.db.save_typing_dynamics(self.user_id, {"avgDwell": 0.1, "avgFlight": 0.2, "errorRate": 0.02})
+        self.assertAlmostEqual(self.db.get_user_typing_profile(self.user_id)["avgDwell"], 0.1, places=4)
+        second = {"avgDwell": 0.14, "avgFlight": 0.16, "errorRate": 0.05}
+        merged = self.db.update_typing_profile(self.user_id, second, 3)
+        self.assertAlmostEqual(merged["avgDwell"], (0.1 * 5 + 0.14 * 3) / 8, places=4)
+        self.assertAlmostEqual(merged["dwellStd"], math.sqrt((0.04 ** 2 * 5 * 3 / 8) / 8), places=4)
+        self.assertEqual(merged["sampleCount"], 8)
+        self.assertEqual(self.db.get_auth_state(self.email)["typing_profile"]["sampleCount"], 8)
+        profiles = {p["user_id"]: p for p in self.db.get_typing_profiles(since=start)}
+        self.assertIn(self.user_id, profiles)
+        self.assertIsInstance(profiles[self.user_id]["updated_at"], datetime.datetime)
+
+    def test_keystrokes(self):
+        registration, login = synthetic_typing(1), synthetic_typing(3)
+        self.db.save_keystrokes(self.user_id, registration["keystrokes"], kind="register")
+        self.assertEqual(self.db.save_keystrokes(self.user_id, login["keystrokes"]), len(login["keystrokes"]))
+        rows = self.db.get_user_keystrokes(self.user_id)
+        self.assertEqual([r["key"] for r in rows], [k["key"] for k in registration["keystrokes"] + login["keystrokes"]])
+        attempts = {(str(r["attempt_id"]), r["capture_kind"]) for r in rows}
+        self.assertEqual(sorted(kind for _, kind in attempts), ["login", "register"])
+        self.db.update_typing_digraphs(self.user_id, login["keystrokes"])
+        self.assertIsNotNone(self.db.get_typing_digraphs(self.user_id))
+
+    def test_tests(self):
+        admin_id = self.db.generate_token("admin")
+        test_id = self.add_test([self.user_id])
+        self.assertFalse(self.db.create_test(test_id, QUESTIONS, [self.user_id]))
+        self.assertEqual(self.db.get_test(test_id)["questions"], QUESTIONS)
+        header = self.db.get_test_header(test_id, self.user_id)
+        self.assertEqual(header["version"], 1)
+        self.assertIs(header["assigned"], True)
+        self.assertIs(self.db.get_test_header(test_id, admin_id)["assigned"], False)
+        self.assertTrue(self.db.is_test_assigned(test_id, self.user_id))
+        self.assertIn(test_id, self.db.get_assigned_test_ids(self.user_id))
+
+    def test_submissions_and_reports(self):
+        other_id, _ = self.add_student("other")
+        test_id = self.add_test([self.user_id, other_id])
+        # Half right for one student, all right for the other.
+        half = {qid: q["correct"] if int(qid) % 2 else (q["correct"] + 1) % 4 for qid, q in QUESTIONS.items()}
+        right = {qid: q["correct"] for qid, q in QUESTIONS.items()}
+        self.assertTrue(self.db.save_test_submission(self.user_id, test_id, half, 0.9, 0.6))
+        self.assertTrue(self.db.save_test_submission(other_id, test_id, right, 0.8, 0.8))
+        distribution = self.db.get_score_distribution(test_id)
+        self.assertEqual(distribution["submissions"], 2)
+        self.assertAlmostEqual(distribution["mean"], 0.75, places=4)
+        self.assertEqual(distribution["histogram"][5], 1)
+        self.assertEqual(distribution["histogram"][9], 1)
+        self.assertEqual(self.db.grade_tests(test_id), 2)
+        stats = {row["test_id"]: row for row in self.db.get_test_stats(limit=100000)}[test_id]
+        self.assertEqual(stats["submissions"], 2)
+        self.assertEqual(stats["assigned"], 2)
+        self.assertAlmostEqual(stats["avg_score"], 0.75, places=4)
+        self.assertAlmostEqual(stats["score_stddev"], 0.25, places=4)
+        self.assertAlmostEqual(stats["min_score"], 0.5, places=4)
+        self.assertAlmostEqual(stats["max_score"], 1.0, places=4)
+        self.assertAlmostEqual(stats["avg_confidence_gap"], 0.15, places=4)
+        gaps = {row["user_id"]: row for row in self.db.get_confidence_gaps(limit=100000)}
+        self.assertAlmostEqual(gaps[self.user_id]["avg_confidence_gap"], 0.3, places=4)
+
+def conformance_suite(make_backend):
+    # The conformance tests on backends from make_backend(), for benchmarks/backends.py.
+    case = type("BackendConformanceTest", (StorageConformance, unittest.TestCase),
+                {"make_backend": lambda self: make_backend()})
+    return unittest.defaultTestLoader.loadTestsFromTestCase(case)
+
+class SQLiteConformanceTest(StorageConformance, unittest.TestCase):
+    def make_backend(self):
+        return SQLiteDatabase(":memory:")
+
+@unittest.skipUnless(TEST_DB_NAME, "set TEST_DB_NAME to run the conformance tests against Postgres")
+class PostgresConformanceTest(StorageConformance, unittest.TestCase):
+    def make_backend(self):
+        patcher = mock.patch.dict(os.environ, {"DB_NAME": TEST_DB_NAME})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return Database()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,50 +1,118 @@
 # typing_auth.py
-from pynput import keyboard
 import time
-import pandas as pd
+from keystroke_features import TimingStats
 
-def typing_auth(user_id, mode, expected_phrase="thequickbrownfox", samples_needed=5):
+# Captures one typed sample. Presses are matched to releases through a
+# per-key stack of unreleased presses (O(1) per event), and dwell/flight
+# statistics (keystroke_features.TimingStats) are updated as events arrive,
+# over the first `limit` keys only.
+class SampleCapture:
+    def __init__(self, limit):
+        self.limit = limit
+        self.events = []
+        self._pending = {}
+        self.timings = TimingStats()
+
+    def press(self, char, timestamp):
+        index = len(self.events)
+        self.events.append({"key": char, "press_time": timestamp})
+        self._pending.setdefault(char, []).append(index)
+        if 0 < index < self.limit and "release_time" in self.events[index - 1]:
+            self._add_flight(index - 1)
+
+    def release(self, char, timestamp):
+        stack = self._pending.get(char)
+        if not stack:
+            return
+        index = stack.pop()
+        event = self.events[index]
+        event["release_time"] = timestamp
+        if index < self.limit:
+            event["dwell_time"] = timestamp - event["press_time"]
+            self.timings.dwell.add(event["dwell_time"])
+            if index + 1 < min(self.limit, len(self.events)):
+                self._add_flight(index)
+
+    def _add_flight(self, index):
+        flight = self.events[index + 1]["press_time"] - self.events[index]["release_time"]
+        self.events[index]["flight_time"] = flight
+        self.timings.flight.add(flight)
+
+# Accumulates accepted samples into the session's keystrokes and running
+# statistics, so the features are ready as soon as the last Enter is pressed.
+class CaptureSession:
+    def __init__(self):
+        self.keystrokes = []
+        self.timings = TimingStats()
+
+    def accept(self, sample):
+        events = sample.events[:sample.limit]
+        if self.keystrokes and events and "release_time" in self.keystrokes[-1]:
+            # Flight from the previous accepted sample's last key to this one's first.
+            last = self.keystrokes[-1]
+            last["flight_time"] = events[0]["press_time"] - last["release_time"]
+            self.timings.flight.add(last["flight_time"])
+        for event in events:
+            event.setdefault("dwell_time", 0)
+            event.setdefault("flight_time", None)
+        self.keystrokes.extend(events)
+        self.timings.merge(sample.timings)
+
+    def features(self, error_rate):
+        return self.timings.features(error_rate)
+
+# Live keyboard input through pynput; the sample ends when Enter is pressed.
+class KeyboardSource:
+    def read_sample(self, on_press, on_release):
+        from pynput import keyboard
+
+        def handle_press(key):
+            if hasattr(key, "char"):
+                on_press(key.char, time.time())
+
+        def handle_release(key):
+            if hasattr(key, "char"):
+                on_release(key.char, time.time())
+
+        with keyboard.Listener(on_press=handle_press, on_release=handle_release) as listener:
+            typed = input()
+            listener.join(0.1)
+        return typed
+
+# Replays recorded samples, each a (typed_text, [(kind, char, timestamp), ...])
+# pair with kind "press" or "release", for tests and benchmarks.
+class ReplaySource:
+    def __init__(self, samples):
+        self._samples = iter(samples)
+
+    @staticmethod
+    def from_keystrokes(typed, keystrokes):
+        events = [("press", ks["key"], ks["press_time"]) for ks in keystrokes]
+        events += [("release", ks["key"], ks["release_time"]) for ks in keystrokes if ks.get("release_time") is not None]
+        events.sort(key=lambda e: (e[2], e[0] == "press"))
+        return typed, events
+
+    def read_sample(self, on_press, on_release):
+        typed, events = next(self._samples)
+        for kind, char, timestamp in events:
+            (on_press if kind == "press" else on_release)(char, timestamp)
+        return typed
+
+def typing_auth(user_id, mode, expected_phrase="thequickbrownfox", samples_needed=5, source=None):
+    source = source or KeyboardSource()
     print(f"User {user_id}: Type '{expected_phrase}' {samples_needed} time{'s' if samples_needed > 1 else ''} (press Enter after each):")
-    all_events = []
+    session = CaptureSession()
     valid_samples = 0
     total_errors = 0
 
-    def on_press(key):
-        nonlocal last_press_time
-        current_time = time.time()
-        try:
-            if hasattr(key, 'char'):
-                last_press_time = current_time
-                current_events.append({'key': key.char, 'press_time': current_time})
-        except AttributeError:
-            pass
-
-    def on_release(key):
-        nonlocal last_release_time
-        current_time = time.time()
-        try:
-            if hasattr(key, 'char'):
-                last_release_time = current_time
-                for event in reversed(current_events):
-                    if event['key'] == key.char and 'release_time' not in event:
-                        event['release_time'] = current_time
-                        break
-        except AttributeError:
-            pass
-
     for i in range(samples_needed):
         print(f"{i+1}. ", end="")
-        current_events = []
-        last_press_time = None
-        last_release_time = None
-
-        with keyboard.Listener(on_press=on_press, on_release=on_release) as listener:
-            typed = input()
-            listener.join(0.1)
+        sample = SampleCapture(len(expected_phrase))
+        typed = source.read_sample(sample.press, sample.release)
 
         if typed == expected_phrase:
-            if len(current_events) >= len(expected_phrase):
-                all_events.extend(current_events[:len(expected_phrase)])
+            if len(sample.events) >= len(expected_phrase):
+                session.accept(sample)
                 valid_samples += 1
             else:
                 total_errors += len(expected_phrase)
@@ -57,22 +125,5 @@ def typing_auth(user_id, mode, expected_phrase="thequickbrownfox", samples_neede
     error_rate = total_errors / total_possible_chars if total_possible_chars > 0 else 1.0
     error_rate = max(0.0, min(1.0, error_rate))
 
-    if all_events:
-        df = pd.DataFrame(all_events)
-        df['dwell_time'] = df['release_time'] - df['press_time']
-        df['flight_time'] = df['press_time'].shift(-1) - df['release_time']
-        avg_dwell = df['dwell_time'].mean() * 1000 if not df['dwell_time'].isna().all() else 0
-        avg_flight = df['flight_time'].mean() * 1000 if not df['flight_time'].isna().all() else 0
-
-        for i, event in enumerate(all_events):
-            event['dwell_time'] = df['dwell_time'][i] if not pd.isna(df['dwell_time'][i]) else 0
-            event['flight_time'] = df['flight_time'][i] if not pd.isna(df['flight_time'][i]) else None
-    else:
-        avg_dwell, avg_flight = 0, 0
-
-    features = {
-        "avgDwell": avg_dwell,
-        "avgFlight": avg_flight,
-        "errorRate": error_rate
-    }
-    return {"samples": valid_samples, "features": features, "keystrokes": all_events}
\ No newline at end of file
+    features = session.features(error_rate)
+    return {"samples": valid_samples, "features": features, "keystrokes": session.keystrokes}
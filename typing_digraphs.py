@@ -0,0 +1,92 @@
+# typing_digraphs.py
+import os
+import numpy as np
+
+# a-z and space get their own slot; every other key shares the last one.
+ALPHABET = "abcdefghijklmnopqrstuvwxyz "
+KEYS = len(ALPHABET) + 1
+SLOTS = KEYS + KEYS * KEYS
+# Flights longer than this are pauses (e.g. the Enter between samples), not digraphs.
+MAX_FLIGHT_MS = 1500.0
+DIGRAPH_Z_THRESHOLD = float(os.getenv("DIGRAPH_Z_THRESHOLD", "3.0"))
+DIGRAPH_MIN_TIMINGS = int(os.getenv("DIGRAPH_MIN_TIMINGS", "10"))
+DIGRAPH_MIN_COUNT = 3
+
+def key_slot(key):
+    index = ALPHABET.find((key or "").lower()[:1]) if key else -1
+    return index if index >= 0 else KEYS - 1
+
+def _timings(keystrokes):
+    # Slot indexes and millisecond values: per-key dwell in slots [0, KEYS),
+    # digraph flight key[i] -> key[i+1] in slots [KEYS, SLOTS).
+    slots = np.array([key_slot(ks.get("key")) for ks in keystrokes], dtype=np.int64)
+    dwell = np.array([ks.get("dwell_time") for ks in keystrokes], dtype=float) * 1000
+    flight = np.array([ks.get("flight_time") for ks in keystrokes[:-1]], dtype=float) * 1000
+    dwell_ok = np.isfinite(dwell) & (dwell > 0)
+    flight_ok = np.isfinite(flight) & (flight > 0) & (flight <= MAX_FLIGHT_MS)
+    digraphs = KEYS + slots[:-1] * KEYS + slots[1:]
+    index = np.concatenate([slots[dwell_ok], digraphs[flight_ok]])
+    values = np.concatenate([dwell[dwell_ok], flight[flight_ok]])
+    return index, values
+
+# Fixed-size per-user timing matrix: count, mean and M2 (sum of squared
+# deviations) for every key dwell and key-pair flight, packed as float32.
+class DigraphProfile:
+    def __init__(self, stats=None):
+        self.stats = stats if stats is not None else np.zeros((SLOTS, 3), dtype=np.float64)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        return cls(np.frombuffer(bytes(blob), dtype="<f4").reshape(SLOTS, 3).astype(np.float64))
+
+    def to_bytes(self):
+        return self.stats.astype("<f4").tobytes()
+
+    def update(self, keystrokes):
+        if len(keystrokes) < 1:
+            return 0
+        index, values = _timings(keystrokes)
+        if index.size == 0:
+            return 0
+        n_b = np.bincount(index, minlength=SLOTS).astype(np.float64)
+        sum_b = np.bincount(index, weights=values, minlength=SLOTS)
+        seen = n_b > 0
+        mean_b = np.zeros(SLOTS)
+        mean_b[seen] = sum_b[seen] / n_b[seen]
+        m2_b = np.bincount(index, weights=(values - mean_b[index]) ** 2, minlength=SLOTS)
+
+        # Chan et al. parallel merge of the stored and new running statistics.
+        n_a, mean_a, m2_a = self.stats[:, 0], self.stats[:, 1], self.stats[:, 2]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(seen, mean_a + delta * n_b / n, mean_a)
+            m2 = np.where(seen, m2_a + m2_b + delta ** 2 * n_a * n_b / n, m2_a)
+        self.stats = np.column_stack([n, mean, m2])
+        return int(index.size)
+
+    def std(self):
+        n = self.stats[:, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 1, np.sqrt(self.stats[:, 2] / (n - 1)), 0.0)
+
+    def score(self, keystrokes, min_count=DIGRAPH_MIN_COUNT):
+        # Mean absolute z-score of the attempt's timings against this profile,
+        # over slots with enough history; returns (score, timings compared).
+        index, values = _timings(keystrokes)
+        std = self.std()
+        usable = (self.stats[index, 0] >= min_count) & (std[index] > 0)
+        if not usable.any():
+            return 0.0, 0
+        z = np.abs(values[usable] - self.stats[index[usable], 1]) / std[index[usable]]
+        return float(z.mean()), int(usable.sum())
+
+def check_digraphs(profile, keystrokes):
+    if profile is None:
+        return True
+    score, compared = profile.score(keystrokes)
+    if compared < DIGRAPH_MIN_TIMINGS:
+        return True
+    ok = score <= DIGRAPH_Z_THRESHOLD
+    print(f"Digraph Check - mean |z| {score:.2f} over {compared} timings ({ok})")
+    return ok
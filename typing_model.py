@@ -0,0 +1,172 @@
+# typing_model.py
+import os
+import pickle
+import threading
+import time
+import datetime
+from collections import Counter
+import numpy as np
+from database import db
+
+MODEL_PATH = os.getenv("TYPING_MODEL_PATH", "typing_model.pkl")
+# Profiles committed slightly out of updated_at order are caught by re-reading
+# this window; re-applying an unchanged profile is harmless.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+def profile_vector(profile):
+    return [profile["avg_dwell"], profile["avg_flight"], profile["error_rate"]]
+
+# k-nearest-neighbour classifier over typing profiles that is updated in place:
+# each user owns one row, so adding or changing a profile is an O(1) write
+# instead of a full refit.
+class NeighbourIndex:
+    def __init__(self, n_neighbors=3, dim=3, capacity=64):
+        self.n_neighbors = n_neighbors
+        self._X = np.zeros((capacity, dim))
+        self.labels = []
+        self._rows = {}
+        self.watermark = None
+
+    @classmethod
+    def from_profiles(cls, profiles, n_neighbors=3):
+        index = cls(n_neighbors=n_neighbors, capacity=max(64, len(profiles)))
+        index.apply_profiles(profiles)
+        return index
+
+    def __len__(self):
+        return len(self.labels)
+
+    def upsert(self, label, vector):
+        row = self._rows.get(label)
+        if row is None:
+            row = len(self.labels)
+            if row == len(self._X):
+                self._X = np.concatenate([self._X, np.zeros_like(self._X)])
+            self._rows[label] = row
+            self.labels.append(label)
+        self._X[row] = vector
+
+    def apply_profiles(self, profiles):
+        for p in profiles:
+            self.upsert(p["user_id"], profile_vector(p))
+            updated_at = p.get("updated_at")
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+        return len(profiles)
+
+    def predict(self, X):
+        n = len(self.labels)
+        if n == 0:
+            raise ValueError("Neighbour index is empty")
+        k = min(self.n_neighbors, n)
+        points = self._X[:n]
+        predictions = []
+        for x in np.asarray(X, dtype=float):
+            distances = ((points - x) ** 2).sum(axis=1)
+            nearest = np.argpartition(distances, k - 1)[:k]
+            votes = Counter(self.labels[i] for i in nearest)
+            best = max(votes.values())
+            # Break ties the way a distance-ordered vote would: closest label wins.
+            winner = next(self.labels[i] for i in nearest[np.argsort(distances[nearest])]
+                          if votes[self.labels[i]] == best)
+            predictions.append(winner)
+        return np.array(predictions)
+
+# Keeps the trained typing model in memory and reloads it only when the file
+# on disk is replaced (detected by its mtime/size/inode stamp).
+class ModelProvider:
+    def __init__(self, path=MODEL_PATH, sync_interval=None, checkpoint_rows=None):
+        self.path = path
+        self.sync_interval = sync_interval if sync_interval is not None else float(os.getenv("TYPING_MODEL_SYNC_INTERVAL", "5"))
+        self.checkpoint_rows = checkpoint_rows if checkpoint_rows is not None else int(os.getenv("TYPING_MODEL_CHECKPOINT_ROWS", "500"))
+        self._lock = threading.RLock()
+        self._last_sync = 0.0
+        self._unsaved = 0
+        self.synced_profiles = 0
+        self._model = None
+        self._stamp = None
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.predictions = 0
+        self.predict_seconds = 0.0
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def available(self):
+        return self._file_stamp() is not None
+
+    def get(self):
+        stamp = self._file_stamp()
+        if stamp is None:
+            return None
+        if stamp == self._stamp:
+            return self._model
+        with self._lock:
+            if stamp != self._stamp:
+                start = time.perf_counter()
+                with open(self.path, "rb") as f:
+                    model = pickle.load(f)
+                self._model, self._stamp = model, stamp
+                self._last_sync = 0.0
+                self._unsaved = 0
+                self.loads += 1
+                self.load_seconds += time.perf_counter() - start
+            return self._model
+
+    def sync(self, force=False):
+        # Pull profiles changed since the model's watermark (one indexed query)
+        # and apply them in place; snapshot to disk every checkpoint_rows changes.
+        model = self.get()
+        if not isinstance(model, NeighbourIndex):
+            return 0
+        with self._lock:
+            if not force and time.monotonic() - self._last_sync < self.sync_interval:
+                return 0
+            since = model.watermark - SYNC_OVERLAP if model.watermark is not None else None
+            changed = model.apply_profiles(db.get_typing_profiles(since=since))
+            self._last_sync = time.monotonic()
+            self.synced_profiles += changed
+            self._unsaved += changed
+            if self._unsaved >= self.checkpoint_rows:
+                self.save(model)
+            return changed
+
+    def predict_user(self, features):
+        model = self.get()
+        if model is None:
+            return None
+        self.sync()
+        start = time.perf_counter()
+        with self._lock:
+            predicted_user = model.predict(np.array([[features["avgDwell"], features["avgFlight"], features["errorRate"]]]))[0]
+            self.predictions += 1
+            self.predict_seconds += time.perf_counter() - start
+        return predicted_user
+
+    def save(self, model):
+        # Write to a temporary file and rename so readers never see a partial pickle.
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(model, f)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._model, self._stamp = model, self._file_stamp()
+            self._unsaved = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "synced_profiles": self.synced_profiles,
+                "load_seconds": self.load_seconds,
+                "predictions": self.predictions,
+                "predict_seconds": self.predict_seconds,
+                "avg_predict_ms": self.predict_seconds / self.predictions * 1000 if self.predictions else 0.0,
+            }
+
+model_provider = ModelProvider()
@@ -0,0 +1,155 @@
+# typing_verifier.py
+# Threshold verification of typing features against stored profiles. The same
+# vectorized scorer serves the live login/test check (one row) and the offline
+# re-score of every historical attempt when thresholds change:
+#   python typing_verifier.py                       # current thresholds
+#   python typing_verifier.py --mode zscore --z 2.5 --impostors 20
+import argparse
+import os
+import numpy as np
+from database import db, typing_profile_dict
+
+FEATURES = ("avgDwell", "avgFlight", "errorRate")
+STDS = ("dwellStd", "flightStd", "errorStd")
+
+# "band" accepts features within a fixed fraction of the stored mean (the
+# original rule); "zscore" uses each profile's running spread once it has
+# seen enough samples, falling back to the band per feature until then.
+VERIFY_MODE = os.getenv("TYPING_VERIFY_MODE", "band")
+DWELL_THRESHOLD = float(os.getenv("TYPING_DWELL_THRESHOLD", "0.3"))
+FLIGHT_THRESHOLD = float(os.getenv("TYPING_FLIGHT_THRESHOLD", "0.3"))
+ERROR_THRESHOLD = float(os.getenv("TYPING_ERROR_THRESHOLD", "0.2"))
+Z_THRESHOLD = float(os.getenv("TYPING_Z_THRESHOLD", "3.0"))
+Z_MIN_SAMPLES = int(os.getenv("TYPING_Z_MIN_SAMPLES", "11"))
+
+def feature_matrix(features):
+    return np.array([[f.get(k, np.nan) for k in FEATURES] for f in features], dtype=float).reshape(-1, 3)
+
+def profile_arrays(profiles):
+    means = feature_matrix(profiles)
+    stds = np.array([[p.get(k) or 0.0 for k in STDS] for p in profiles], dtype=float).reshape(-1, 3)
+    counts = np.array([p.get("sampleCount") or 0 for p in profiles], dtype=float)
+    return means, stds, counts
+
+def score(attempts, means, stds=None, counts=None, mode=None, dwell_threshold=None, flight_threshold=None,
+          error_threshold=None, z_threshold=None, min_samples=None):
+    # attempts and means are (n, 3) in FEATURES order, row i of one scored
+    # against row i of the other. Returns an (n, 3) boolean matrix of per-feature
+    # passes; NaN attempt features were not observed and are not checked.
+    mode = mode or VERIFY_MODE
+    attempts = np.asarray(attempts, dtype=float)
+    means = np.asarray(means, dtype=float)
+    bands = np.array([
+        DWELL_THRESHOLD if dwell_threshold is None else dwell_threshold,
+        FLIGHT_THRESHOLD if flight_threshold is None else flight_threshold,
+        ERROR_THRESHOLD if error_threshold is None else error_threshold,
+    ])
+    diff = np.abs(attempts - means)
+    # Dwell and flight bands are relative to the stored mean, error rate is absolute.
+    limit = np.empty_like(means)
+    limit[:, :2] = means[:, :2] * bands[:2]
+    limit[:, 2] = bands[2]
+    passed = diff <= limit
+    passed[:, 2] &= (attempts[:, 2] >= 0) & (attempts[:, 2] <= 1)
+
+    if mode == "zscore" and stds is not None:
+        z_threshold = Z_THRESHOLD if z_threshold is None else z_threshold
+        min_samples = Z_MIN_SAMPLES if min_samples is None else min_samples
+        stds = np.asarray(stds, dtype=float)
+        usable = stds > 0
+        if counts is not None:
+            usable &= (np.asarray(counts, dtype=float) >= min_samples)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_passed = diff <= z_threshold * stds
+        z_passed[:, 2] &= (attempts[:, 2] >= 0) & (attempts[:, 2] <= 1)
+        passed = np.where(usable, z_passed, passed)
+
+    return passed | np.isnan(attempts)
+
+def accept(attempts, means, stds=None, counts=None, **thresholds):
+    return score(attempts, means, stds, counts, **thresholds).all(axis=1)
+
+def verify_typing_features(login_features, stored_features, **thresholds):
+    means, stds, counts = profile_arrays([stored_features])
+    dwell_ok, flight_ok, error_ok = (bool(x) for x in score(feature_matrix([login_features]), means, stds, counts,
+                                                            **thresholds)[0])
+
+    print(f"Typing Check - Dwell: {login_features['avgDwell']:.2f} vs {stored_features['avgDwell']:.2f} ({dwell_ok}), "
+          f"Flight: {login_features['avgFlight']:.2f} vs {stored_features['avgFlight']:.2f} ({flight_ok}), "
+          f"Error: {login_features['errorRate']:.2f} vs {stored_features['errorRate']:.2f} ({error_ok})")
+
+    return dwell_ok and flight_ok and error_ok
+
+def load_profiles():
+    with db.cursor() as cur:
+        cur.execute("SELECT * FROM typing_profiles ORDER BY user_id")
+        rows = cur.fetchall()
+    user_ids = [row["user_id"] for row in rows]
+    return user_ids, profile_arrays([typing_profile_dict(row) for row in rows])
+
+def load_history():
+    # One attempt per saved login capture, plus one per test submission, which
+    # only records the error rate as test_confidence. Registration samples
+    # built the profile, and rows saved before attempts were recorded cannot
+    # be split into attempts, so neither is scored.
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT user_id, AVG(dwell_time) * 1000 AS dwell, AVG(flight_time) * 1000 AS flight, CAST(NULL AS DOUBLE PRECISION) AS error
+            FROM keystrokes
+            WHERE user_id IS NOT NULL AND capture_kind = 'login' AND attempt_id IS NOT NULL
+            GROUP BY user_id, attempt_id
+            UNION ALL
+            SELECT user_id, NULL, NULL, 1.0 - test_confidence
+            FROM student_submissions
+        """)
+        rows = cur.fetchall()
+    user_ids = [row["user_id"] for row in rows]
+    attempts = np.array([[row["dwell"], row["flight"], row["error"]] for row in rows], dtype=float).reshape(-1, 3)
+    return user_ids, attempts
+
+def rescore(impostors=10, seed=0, **thresholds):
+    # Genuine attempts are scored against their own profile (FRR); each is
+    # also scored against `impostors` other users' profiles drawn at random (FAR).
+    profile_ids, (means, stds, counts) = load_profiles()
+    attempt_ids, attempts = load_history()
+    row_of = {user_id: i for i, user_id in enumerate(profile_ids)}
+    own = np.array([row_of.get(user_id, -1) for user_id in attempt_ids], dtype=int)
+    attempts = attempts[own >= 0]
+    own = own[own >= 0]
+
+    genuine = accept(attempts, means[own], stds[own], counts[own], **thresholds)
+    report = {"profiles": len(profile_ids), "attempts": len(own), "genuine_rejected": int((~genuine).sum()),
+              "frr": float((~genuine).mean()) if len(own) else 0.0, "impostor_attempts": 0,
+              "impostor_accepted": 0, "far": 0.0}
+
+    if len(profile_ids) > 1 and impostors > 0 and len(own):
+        rng = np.random.default_rng(seed)
+        # Draw from the other n - 1 profiles by shifting past the attempt's own row.
+        others = rng.integers(0, len(profile_ids) - 1, size=(len(own), impostors))
+        others += others >= own[:, None]
+        others = others.ravel()
+        impostor = accept(np.repeat(attempts, impostors, axis=0), means[others], stds[others], counts[others],
+                          **thresholds)
+        report.update(impostor_attempts=len(impostor), impostor_accepted=int(impostor.sum()),
+                      far=float(impostor.mean()))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["band", "zscore"], default=VERIFY_MODE)
+    parser.add_argument("--dwell", type=float, default=DWELL_THRESHOLD)
+    parser.add_argument("--flight", type=float, default=FLIGHT_THRESHOLD)
+    parser.add_argument("--error", type=float, default=ERROR_THRESHOLD)
+    parser.add_argument("--z", type=float, default=Z_THRESHOLD)
+    parser.add_argument("--min-samples", type=int, default=Z_MIN_SAMPLES)
+    parser.add_argument("--impostors", type=int, default=10, help="other-user profiles each attempt is scored against")
+    args = parser.parse_args()
+    try:
+        report = rescore(impostors=args.impostors, mode=args.mode, dwell_threshold=args.dwell,
+                         flight_threshold=args.flight, error_threshold=args.error, z_threshold=args.z,
+                         min_samples=args.min_samples)
+        print(f"Re-scored {report['attempts']} attempts against {report['profiles']} profiles ({args.mode}).")
+        print(f"FRR: {report['frr']:.2%} ({report['genuine_rejected']} genuine attempts rejected)")
+        print(f"FAR: {report['far']:.2%} ({report['impostor_accepted']} of {report['impostor_attempts']} impostor attempts accepted)")
+    finally:
+        db.close()